@@ -0,0 +1,86 @@
+'''
+Code for rendering the groundtruths of Doc3D dataset
+https://www3.cs.stonybrook.edu/~cvl/projects/dewarpnet/storage/paper.pdf (ICCV 2019)
+
+This code keeps the loaded meshes, textures and HDR env maps in bpy.data
+across the samples of one Blender session (--batch, --selectmesh and the
+resident workers of batch_render.py), so that an asset used again is not
+parsed and decoded again. The assets are kept with a fake user and the
+least recently used ones are removed above a memory budget.
+render_mesh.py then only resets the per sample state (reset_scene).
+'''
+from collections import OrderedDict
+import os
+import bpy
+
+
+def image_size(image):
+    # decoded size in bytes, float buffers for HDR images
+    w, h = image.size
+    return w * h * max(image.channels, 1) * (4 if image.is_float else 1)
+
+
+def mesh_size(mesh):
+    return len(mesh.vertices) * 32 + len(mesh.loops) * 24 + len(mesh.polygons) * 16
+
+
+class AssetCache:
+    '''
+    LRU cache of images and meshes by file path, budget in MB.
+    Assets used by the current sample are never removed.
+    '''
+
+    def __init__(self, budget_mb):
+        self.budget = budget_mb * 1024 * 1024
+        self.entries = OrderedDict()  # (kind, path) -> [datablock name, size, sample, extra]
+        self.sample = 0
+        self.total = 0
+
+    def begin_sample(self):
+        self.sample += 1
+
+    def cached(self, kind):
+        # names of the cached datablocks of a kind
+        return set(entry[0] for key, entry in self.entries.items() if key[0] == kind)
+
+    def get(self, kind, path):
+        key = (kind, os.path.abspath(path))
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        data = bpy.data.images if kind == 'image' else bpy.data.meshes
+        if entry[0] not in data:
+            self.drop(key)
+            return None
+        self.entries.move_to_end(key)
+        entry[2] = self.sample
+        return data[entry[0]], entry[3]
+
+    def put(self, kind, path, datablock, size, extra=None):
+        key = (kind, os.path.abspath(path))
+        datablock.use_fake_user = True
+        self.entries[key] = [datablock.name, size, self.sample, extra]
+        self.total += size
+        self.evict()
+
+    def drop(self, key):
+        name, size, sample, extra = self.entries.pop(key)
+        self.total -= size
+        data = bpy.data.images if key[0] == 'image' else bpy.data.meshes
+        if name in data:
+            data.remove(data[name], do_unlink=True)
+
+    def evict(self):
+        for key in list(self.entries):
+            if self.total <= self.budget:
+                break
+            if self.entries[key][2] != self.sample:
+                self.drop(key)
+
+    def image(self, path):
+        hit = self.get('image', path)
+        if hit is not None:
+            return hit[0]
+        image = bpy.data.images.load(os.path.abspath(path))
+        self.put('image', path, image, image_size(image))
+        return image
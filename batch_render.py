@@ -1,35 +1,290 @@
 '''
-Code for rendering the groundtruths of Doc3D dataset 
+Code for rendering the groundtruths of Doc3D dataset
 https://www3.cs.stonybrook.edu/~cvl/projects/dewarpnet/storage/paper.pdf (ICCV 2019)
 
-This code runs the rendering codes in multiple threads
+This code runs the rendering codes in a pool of resident Blender workers.
+Each worker (render_worker.py) keeps its Blender session alive and pulls
+chunks of (mesh, texture, env, config) jobs from a local queue served here,
+so the Blender startup is paid once per worker instead of once per mesh range.
+The chunks get smaller towards the end of the batch and failed jobs are
+retried up to --retries times (see scheduler.py).
+Crashed workers, and workers that hit --max-jobs or --max-rss, are restarted.
+Each worker renders with --threads threads, by default the cores shared
+between the workers, so the workers do not fight over the cores.
+
+python batch_render.py <folder-id> <start-mesh> <end-mesh>
 
 Written by: Ke Ma
 Stony Brook University, New York
 January 2019
 '''
-from subprocess import Popen
 import os
-import sys
-import numpy as np
+import csv
+import time
+import queue
+import argparse
+import threading
+from subprocess import Popen
+from multiprocessing.managers import BaseManager
+
+import scheduler
+import seeding
+
+class JobQueue:
+    '''
+    The queue of chunks, it remembers the chunk handed out to a worker process
+    (by the token of the process) until the pool gets its 'take' message, so
+    that the chunk of a worker dying in between is not lost. A get still
+    blocked for a dead worker puts its chunk back.
+    '''
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.handed = {}
+        self.retired = set()
+        self.lock = threading.Lock()
+
+    def put(self, chunk):
+        self.queue.put(chunk)
+
+    def get(self, token=None):
+        chunk = self.queue.get()
+        if token is not None:
+            with self.lock:
+                if token in self.retired:
+                    # nobody reads the answer, the chunk goes to another worker
+                    self.queue.put(chunk)
+                    return None
+                if chunk is not None:
+                    self.handed[token] = chunk
+        return chunk
+
+    def clear(self):
+        # drops the chunks nobody got yet, returns their number
+        dropped = 0
+        try:
+            while True:
+                self.queue.get_nowait()
+                dropped += 1
+        except queue.Empty:
+            return dropped
+
+    def taken(self, token):
+        # the chunk handed out to a worker and not taken yet
+        with self.lock:
+            return self.handed.pop(token, None)
+
+    def retire(self, token):
+        # a worker died, returns the chunk it got and never took
+        with self.lock:
+            self.retired.add(token)
+            return self.handed.pop(token, None)
+
+
+_jobs = JobQueue()
+_results = queue.Queue()
+
+
+def get_jobs():
+    return _jobs
+
+
+def get_results():
+    return _results
+
 
-# number of meshes
-id1 = int(sys.argv[-2])
-id2 = int(sys.argv[-1])
+class QueueManager(BaseManager):
+    pass
 
-# folder id
-folder = sys.argv[-3]
 
-# number of processors
-nnum_proc = 1
+QueueManager.register('get_jobs', callable=get_jobs)
+QueueManager.register('get_results', callable=get_results)
 
-# split the task
-tlist = np.linspace(id1, id2, nnum_proc + 1)
-for k in range(nnum_proc):
-    cmd = ["blender", "--background", "--python", "render_mesh.py", "--", folder,
-    '{}'.format(int(round(tlist[k]))), '{}'.format(int(round(tlist[k + 1])))]
-    
+
+def read_list(path):
+    with open(path, 'r') as f:
+        return [row[0] for row in csv.reader(f) if row]
+
+
+def make_jobs(folder, id1, id2, conf, seed=0):
+    # one job per mesh line in objs.csv, with a texture and env map drawn from the seed and the line
+    objlist = read_list('./objs.csv')
+    texlist = read_list('./tex.csv')
+    envlist = read_list('./envs.csv')
+    jobs = []
+    for k in range(id1, id2):
+        rng = seeding.sample_rng(seed, 'job:{}:{}'.format(folder, k))
+        jobs.append({'mesh': objlist[k], 'texture': rng.choice(texlist),
+                     'env': rng.choice(envlist), 'conf': conf, 'out': folder})
+    return jobs
+
+
+def make_plan_jobs(plan_path, id1, id2):
+    # one job per row of a plan (plan.py), the parameters are in the rows
+    import plan
+    rows = plan.load(plan_path)
+    return [{'plan': os.path.abspath(plan_path), 'row': k, 'mesh': str(rows['mesh'][k])}
+            for k in range(id1, min(id2, len(rows)))]
+
+
+def worker_threads(nproc, threads=None):
+    # the cores shared between the workers when not given
+    if threads is None:
+        return max(1, (os.cpu_count() or 1) // nproc)
+    return threads
+
+
+class WorkerPool:
+    '''
+    Resident Blender workers fed from a shared local job queue.
+    '''
+
+    def __init__(self, nproc, blender='blender', max_jobs=50, max_rss=0, threads=0):
+        self.nproc = nproc
+        self.blender = blender
+        self.max_jobs = max_jobs
+        self.max_rss = max_rss
+        # render threads of each worker, 0 for the render profile of the config
+        self.threads = threads
+        self.authkey = os.urandom(16).hex()
+        self.procs = {}
+        # job queue token of each worker process
+        self.tokens = {}
+        self.spawned = 0
+        self.inflight = {}
+        self.started = {}
+        self.alive = set()
+
+        manager = QueueManager(address=('127.0.0.1', 0), authkey=self.authkey.encode())
+        self.server = manager.get_server()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def spawn(self, wid):
+        host, port = self.server.address
+        self.spawned += 1
+        self.tokens[wid] = '{}-{}'.format(wid, self.spawned)
+        # without --python-exit-code Blender exits with 0 after a Python error
+        cmd = [self.blender, "--background", "--python-exit-code", "1", "--python",
+               os.path.join(os.path.dirname(os.path.abspath(__file__)), "render_worker.py"), "--",
+               "--address", '{}:{}'.format(host, port), "--authkey", self.authkey,
+               "--worker", str(wid), "--token", self.tokens[wid],
+               "--max-jobs", str(self.max_jobs), "--max-rss", str(self.max_rss),
+               "--threads", str(self.threads)]
+        self.procs[wid] = Popen(cmd)
+        self.alive.discard(wid)
+
+    def run(self, jobs, max_chunk=8, max_retries=2, stop=None):
+        '''
+        Render all jobs and return a list of (job, status).
+        Once the event stop is set no more chunks are handed out, the run
+        returns when the chunks the workers have are rendered.
+        '''
+        sched = scheduler.Scheduler(jobs, self.nproc, max_chunk=max_chunk, max_retries=max_retries)
+        queued = 0
+        stop = stop or threading.Event()
+        # a pool renders several leases (coordinator.py), nothing carries over from the last run
+        self.procs = {}
+        self.inflight = {}
+        self.started = {}
+        self.alive = set()
+        try:
+            while True:
+                # e.g. the 'exit' messages of the last workers
+                _results.get_nowait()
+        except queue.Empty:
+            pass
+        for wid in range(min(self.nproc, len(jobs))):
+            self.spawn(wid)
+
+        while not sched.finished():
+            if stop.is_set():
+                queued -= _jobs.clear()
+                if queued == 0 and not any(self.inflight.values()):
+                    break
+            # a few chunks ready in the queue, the rest stays with the scheduler for the retries
+            while queued < self.nproc and not stop.is_set():
+                chunk = sched.next_chunk()
+                if chunk is None:
+                    break
+                _jobs.put(chunk)
+                queued += 1
+            # poll before draining so that every message a dead worker sent is seen
+            dead = [wid for wid, p in self.procs.items() if p.poll() is not None]
+            msgs = []
+            try:
+                msgs.append(_results.get(timeout=1.0))
+                while True:
+                    msgs.append(_results.get_nowait())
+            except queue.Empty:
+                pass
+            for msg in msgs:
+                kind, wid, job, status = msg
+                self.alive.add(wid)
+                if kind == 'take':
+                    # job is the chunk the worker took
+                    _jobs.taken(self.tokens[wid])
+                    queued -= 1
+                    self.inflight[wid] = list(job)
+                elif kind == 'start':
+                    self.started[wid] = job
+                elif kind == 'done':
+                    self.started.pop(wid, None)
+                    self.inflight[wid].pop(0)
+                    sched.report(job, status)
+            for wid in dead:
+                code = self.procs.pop(wid).returncode
+                # the chunk it got but never took, it died between the two
+                lost = _jobs.retire(self.tokens[wid])
+                if wid not in self.alive and lost is None and code != 0:
+                    raise RuntimeError('worker {} failed to start (exit code {})'.format(wid, code))
+                job = self.started.pop(wid, None)
+                chunk = self.inflight.pop(wid, [])
+                if job is not None:
+                    print('worker {} crashed (exit code {}) on {}'.format(wid, code, job['mesh']))
+                    sched.report(job, 'crashed')
+                    chunk = chunk[1:]
+                sched.requeue(chunk)
+                if lost is not None:
+                    queued -= 1
+                    sched.requeue(lost)
+                if not sched.finished() and not stop.is_set():
+                    self.spawn(wid)
+
+        for wid in self.procs:
+            _jobs.put(None)
+        for p in self.procs.values():
+            p.wait()
+        return sched.results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Render meshes with a pool of Blender workers')
+    parser.add_argument('folder', help='output folder id')
+    parser.add_argument('id1', type=int, help='first line in objs.csv')
+    parser.add_argument('id2', type=int, help='last line in objs.csv (exclusive)')
+    parser.add_argument('-c', '--conf', help='configuration path', default='conf/config.json')
+    # Cycles already uses several threads per render, so do not start one worker per core
+    parser.add_argument('-n', '--nproc', type=int, help='number of workers',
+                        default=max(1, (os.cpu_count() or 1) // 4))
+    parser.add_argument('--max-jobs', type=int, help='restart a worker after this many jobs', default=50)
+    parser.add_argument('--max-rss', type=float, help='restart a worker above this peak memory (MB), 0 to disable', default=0)
+    parser.add_argument('--threads', type=int, help='render threads of each worker, 0 for the render profile '
+                                                    'of the config (default: the cores divided by the workers)')
+    parser.add_argument('--blender', help='blender executable', default='blender')
+    parser.add_argument('--max-chunk', type=int, help='largest number of jobs handed out at once', default=8)
+    parser.add_argument('--retries', type=int, help='retries of a crashed or failed job', default=2)
+    parser.add_argument('--seed', type=int, help='seed of the texture and env map choices', default=0)
+    parser.add_argument('--plan', help='render rows <start-mesh> to <end-mesh> of this plan (plan.py)')
     #### In MacOS ####
-    #cmd = ["blender", "--background", "--python", "/full/path/to/render_mesh.py", "--", folder,
-    #'{}'.format(int(round(tlist[k]))), '{}'.format(int(round(tlist[k + 1])))]
-    pp = Popen(cmd)
+    # --blender /Applications/Blender.app/Contents/MacOS/Blender
+    args = parser.parse_args()
+
+    if args.plan:
+        jobs = make_plan_jobs(args.plan, args.id1, args.id2)
+    else:
+        jobs = make_jobs(args.folder, args.id1, args.id2, args.conf, args.seed)
+    pool = WorkerPool(args.nproc, args.blender, args.max_jobs, args.max_rss, worker_threads(args.nproc, args.threads))
+    start = time.time()
+    results = pool.run(jobs, args.max_chunk, args.retries)
+    failed = [job for job, status in results if status not in ('done', 'exists')]
+    print('rendered {} jobs in {:.1f}s, {} failed'.format(len(results), time.time() - start, len(failed)))
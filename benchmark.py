@@ -0,0 +1,252 @@
+'''
+Code for rendering the groundtruths of Doc3D dataset
+https://www3.cs.stonybrook.edu/~cvl/projects/dewarpnet/storage/paper.pdf (ICCV 2019)
+
+This code benchmarks the rendering pipeline on the bundled obj/, tex/ and env/
+assets with a fixed seeded workload, and writes the results as .json to
+compare commits.
+python benchmark.py blender [--samples 32 128] [--resolution 448 224] [-n 4]
+renders n samples with render_mesh.py for every numSamples and resolution,
+one Blender session per setting, and reports the time of every stage of
+render_mesh.py (see telemetry.py), the samples per hour and the peak memory.
+python benchmark.py python
+times the parts that run without Blender: .obj parsing and the mesh cache,
+the camera visibility test, planning, the numpy rasterizer and the
+backward mapping.
+'''
+import os
+import sys
+import json
+import glob
+import time
+import shutil
+import socket
+import argparse
+import platform
+import tempfile
+import subprocess
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import seeding
+import telemetry
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def header():
+    return {'commit': git_commit(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'host': socket.gethostname(),
+            'python': platform.python_version(), 'numpy': np.__version__}
+
+
+def workload(n, seed=0):
+    # the first n meshes with a texture and an env map drawn from the seed
+    meshes = sorted(glob.glob(os.path.join(ROOT, 'obj', '*.obj')))
+    textures = sorted(glob.glob(os.path.join(ROOT, 'tex', '*.jpg')) + glob.glob(os.path.join(ROOT, 'tex', '*.png')))
+    envs = sorted(glob.glob(os.path.join(ROOT, 'env', '*.hdr')))
+    jobs = []
+    for k in range(n):
+        rng = seeding.sample_rng(seed, 'benchmark:{}'.format(k))
+        jobs.append({'mesh': meshes[k % len(meshes)], 'texture': rng.choice(textures), 'env': rng.choice(envs)})
+    return jobs
+
+
+def timeit(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return {'min': min(times), 'median': float(np.median(times)), 'repeat': repeat}
+
+
+def python_benchmarks(repeat=5, conf=os.path.join(ROOT, 'conf', 'config.json')):
+    import objmesh
+    import meshcache
+    import campose
+    import visibility
+    import plan
+    import rasterize
+
+    with open(conf, 'r', encoding='utf-8') as fs:
+        config = json.load(fs)
+    job = dict(workload(1)[0], conf=conf, out='benchmark')
+    results = {}
+    mesh = objmesh.read_obj(job['mesh'])
+    results['read_obj'] = timeit(lambda: objmesh.read_obj(job['mesh']), repeat)
+    cache_dir = tempfile.mkdtemp()
+    try:
+        meshcache.convert(job['mesh'], cache_dir)
+        path = meshcache.cache_path(job['mesh'], cache_dir)
+        results['meshcache_load'] = timeit(lambda: {k: np.array(v) for k, v in meshcache.load(path).items()}, repeat)
+    finally:
+        shutil.rmtree(cache_dir)
+
+    co = objmesh.transform(mesh['co'], objmesh.OBJ_AXIS)
+    normals = objmesh.vertex_normals(mesh['co'], mesh['faces'])
+    results['vertex_normals'] = timeit(lambda: objmesh.vertex_normals(mesh['co'], mesh['faces']), repeat)
+    rng = seeding.sample_rng(0, 'benchmark')
+    lens, d, campos = campose.sample_camera(rng)
+    mats = campose.sample_candidates(rng, d, campos, 50)
+    results['visibility_50_cameras'] = timeit(
+        lambda: visibility.count_visible_batch(co, normals, mats, lens, 36.0,
+                                               config["resolution_x"], config["resolution_y"]), repeat)
+    results['plan_row'] = timeit(lambda: plan.plan_row(job), repeat)
+
+    cam = campose.camera_matrix(campose.euler_matrix(config["camEul"]), config["campos"])
+    gts = rasterize.render_gts(mesh, cam, config["camLens"], res_x=config["resolution_x"], res_y=config["resolution_y"])
+    results['rasterize'] = timeit(lambda: rasterize.render_gts(mesh, cam, config["camLens"], res_x=config["resolution_x"],
+                                                               res_y=config["resolution_y"]), repeat)
+    try:
+        sys.path.append(os.path.join(ROOT, 'uv2backwardmap'))
+        import uv2bm
+        uv = np.stack([gts['uv'][:, :, 0], 1.0 - gts['uv'][:, :, 1], gts['uv'][:, :, 2]], axis=2)
+        for method in ('delaunay', 'kdtree'):
+            results['uv2bm_' + method] = timeit(lambda: uv2bm.uv2mp(uv, method=method), repeat)
+    except ImportError as e:
+        print('uv2bm skipped: {}'.format(e))
+    return results
+
+
+def blender_settings(base_conf, samples, resolutions, device=None):
+    # configs of every numSamples and resolution
+    with open(base_conf, 'r', encoding='utf-8') as fs:
+        base = json.load(fs)
+    settings = []
+    for n in samples:
+        for res in resolutions:
+            config = dict(base, numSamples=n, resolution_x=res, resolution_y=res, resolution_percentage=100)
+            if device:
+                config['device'] = device
+            settings.append(('samples{}-res{}'.format(n, res), config))
+    return settings
+
+
+def run_blender(blender, name, config, jobs, workdir):
+    '''
+    Renders the jobs in one Blender session in workdir, returns its results.
+    '''
+    conf = os.path.join(workdir, name + '.json')
+    with open(conf, 'w') as f:
+        json.dump(config, f)
+    jobs = [dict(job, conf=conf, out=name, overwrite=True) for job in jobs]
+    jobs_path = os.path.join(workdir, name + '-jobs.json')
+    result_path = os.path.join(workdir, name + '-result.json')
+    with open(jobs_path, 'w') as f:
+        json.dump(jobs, f)
+    start = time.time()
+    # without --python-exit-code Blender exits with 0 after a Python error
+    subprocess.check_call([blender, '--background', '--python-exit-code', '1', '--python', os.path.abspath(__file__),
+                           '--', '--jobs', jobs_path, '--result', result_path], cwd=workdir)
+    with open(result_path, 'r') as f:
+        result = json.load(f)
+    result['session_time'] = time.time() - start
+    return result
+
+
+def summarize(result):
+    # totals per stage and samples per hour of a Blender run
+    samples = [s for s in result['samples'] if s['status'] == 'done']
+    total = sum(s['time'] for s in samples)
+    stages = {}
+    for s in samples:
+        for stage, t in s['stages'].items():
+            stages[stage] = stages.get(stage, 0.0) + t
+    return {'samples': len(result['samples']), 'rendered': len(samples),
+            'mean_sample_time': total / len(samples) if samples else None,
+            'samples_per_hour': 3600. * len(samples) / total if total > 0 else None,
+            'stage_mean_time': {k: v / len(samples) for k, v in stages.items()},
+            'session_time': result['session_time'], 'peak_rss_mb': result['peak_rss_mb']}
+
+
+def run_in_blender(jobs_path, result_path):
+    # the Blender side of run_blender
+    import render_mesh
+    render_mesh.args = render_mesh.build_parser().parse_args([])
+    with open(jobs_path, 'r') as f:
+        jobs = json.load(f)
+    samples = []
+    for job in jobs:
+        start = time.perf_counter()
+        status = render_mesh.run_job(job)
+        samples.append({'mesh': os.path.basename(job['mesh']), 'status': status,
+                        'time': time.perf_counter() - start, 'stages': telemetry.sample_timings()})
+        print('{} {} {:.2f}s'.format(job['mesh'], status, samples[-1]['time']))
+    with open(result_path, 'w') as f:
+        json.dump({'samples': samples, 'peak_rss_mb': telemetry.peak_rss()}, f, indent=1)
+
+
+def print_table(results):
+    for name, result in results.items():
+        if 'median' in result:
+            print('{:28s} {:9.4f}s median {:9.4f}s min'.format(name, result['median'], result['min']))
+        else:
+            print('{}: {} rendered, {} samples/hour, peak {:.0f}MB'.format(
+                name, result['rendered'],
+                '{:.0f}'.format(result['samples_per_hour']) if result['samples_per_hour'] else '-',
+                result['peak_rss_mb']))
+            for stage, t in result['stage_mean_time'].items():
+                print('    {:20s} {:8.3f}s'.format(stage, t))
+
+
+if __name__ == '__main__':
+    if '--' in sys.argv:
+        # inside Blender
+        parser = argparse.ArgumentParser()
+        parser.add_argument('--jobs', required=True)
+        parser.add_argument('--result', required=True)
+        args = parser.parse_args(sys.argv[sys.argv.index('--') + 1:])
+        run_in_blender(args.jobs, args.result)
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description='Benchmark the rendering pipeline')
+    sub = parser.add_subparsers(dest='command')
+    p = sub.add_parser('blender')
+    p.add_argument('-n', '--num', type=int, help='samples per setting', default=4)
+    p.add_argument('--samples', type=int, nargs='+', help='numSamples settings', default=[32, 128])
+    p.add_argument('--resolution', type=int, nargs='+', help='resolution settings', default=[448])
+    p.add_argument('-c', '--conf', help='base configuration', default=os.path.join(ROOT, 'conf', 'config.json'))
+    p.add_argument('--device', help='override the device of the config (CPU or GPU)')
+    p.add_argument('--seed', type=int, default=0)
+    p.add_argument('--blender', help='blender executable', default='blender')
+    p.add_argument('--keep', action='store_true', help='keep the rendered outputs')
+    p.add_argument('-o', '--out', help='results .json', default='benchmark.json')
+    p = sub.add_parser('python')
+    p.add_argument('--repeat', type=int, default=5)
+    p.add_argument('-o', '--out', help='results .json', default='benchmark-python.json')
+    args = parser.parse_args()
+
+    report = header()
+    if args.command == 'blender':
+        workdir = tempfile.mkdtemp(prefix='doc3d-benchmark-')
+        # render_mesh.py reads the checkerboard texture relative to the working directory
+        os.symlink(os.path.join(ROOT, 'recon_tex'), os.path.join(workdir, 'recon_tex'))
+        jobs = workload(args.num, args.seed)
+        results = {}
+        try:
+            for name, config in blender_settings(args.conf, args.samples, args.resolution, args.device):
+                results[name] = summarize(run_blender(args.blender, name, config, jobs, workdir))
+        finally:
+            if args.keep:
+                print('outputs in ' + workdir)
+            else:
+                shutil.rmtree(workdir)
+    elif args.command == 'python':
+        results = python_benchmarks(args.repeat)
+    else:
+        parser.print_help()
+        sys.exit(1)
+    report['results'] = results
+    report['peak_rss_mb'] = telemetry.peak_rss()
+    print_table(results)
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=1)
+    print('---output:' + os.path.abspath(args.out) + '---')
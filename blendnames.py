@@ -1,12 +1,54 @@
-import os 
+'''
+Code for rendering the groundtruths of Doc3D dataset
+https://www3.cs.stonybrook.edu/~cvl/projects/dewarpnet/storage/paper.pdf (ICCV 2019)
+
+This code writes blendlists/blendlist<folder-id>.csv, one saved sample per
+line, for the downstream scripts. The order is the one of the catalog
+(catalog.py) that render_mesh.py appends to, so the lines do not move
+between runs. --scan adds the samples of bld/<folder-id>/ missing from
+the catalog (saved before it), in sorted order.
+Without a catalog the listing of bld/<folder-id>/ is written sorted.
+
+python blendnames.py <folder-id> [--scan]
+'''
+import os
 import sys
+import argparse
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import catalog
+
+
+def list_saved(bld_dir):
+	# the .blend of every sample, its .json scene record without one
+	paths = {}
+	for entry in os.scandir(bld_dir):
+		name, ext = os.path.splitext(entry.name)
+		if ext == '.blend' or (ext == '.json' and name not in paths):
+			paths[name] = os.path.join(bld_dir, entry.name)
+	return [(name, paths[name]) for name in sorted(paths)]
 
 
-folder_id=sys.argv[-1]
-bld_dir= './bld/{}'.format(folder_id)
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='List the saved samples for the downstream scripts')
+	parser.add_argument('folder', help='output folder id')
+	parser.add_argument('--scan', action='store_true', help='add the saved samples missing from the catalog')
+	args = parser.parse_args()
 
-with open('blendlists/blendlist{}.csv'.format(folder_id),'w') as bf:
-	for f in os.listdir(bld_dir):
-		bf.write(os.path.join(bld_dir,f)+',')
-		bf.write('\n')
+	folder_id = args.folder
+	bld_dir = './bld/{}'.format(folder_id)
+	if args.scan:
+		cat = catalog.open_catalog(folder_id)
+		added = sum(cat.add(name, path) for name, path in list_saved(bld_dir))
+		print('{} samples added to the catalog'.format(added))
+	if os.path.exists(catalog.catalog_path(folder_id)):
+		paths = catalog.open_catalog(folder_id).range()
+	else:
+		paths = [path for name, path in list_saved(bld_dir)]
 
+	if not os.path.exists('blendlists'):
+		os.makedirs('blendlists')
+	with open('blendlists/blendlist{}.csv'.format(folder_id), 'w') as bf:
+		for path in paths:
+			bf.write(path + '\n')
+	print('{} samples in blendlists/blendlist{}.csv'.format(len(paths), folder_id))
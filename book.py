@@ -0,0 +1,119 @@
+'''
+Code for rendering the groundtruths of Doc3D dataset
+https://www3.cs.stonybrook.edu/~cvl/projects/dewarpnet/storage/paper.pdf (ICCV 2019)
+
+This code generates the book page meshes of render_mesh.py --generate with
+numpy instead of the Blender curve operators: the Bezier profile of
+createBook (two segments through (-2r, 0), (0, 0) and (2r, 0), bent by k1
+and k2) evaluated at resolution_u = 100 points per segment, extruded by
+wdh * length / 2 on both sides, as Blender converts the curve to a mesh
+(one row of two vertices per curve point, u along the curve and v across).
+The arrays have the layout of objmesh.read_obj, so meshcache.to_blender
+builds the Blender mesh with foreach_set and rasterize.render_gts renders
+them without Blender, with BOOK_MATRIX as the object matrix.
+
+python book.py -n 1000 --wdh 1.294 -o meshcache/books
+writes 1000 books with k1 and k2 drawn from the seed to the mesh cache, and
+their parameters to books.csv.
+'''
+import os
+import csv
+import argparse
+import numpy as np
+
+import meshcache
+import campose
+import seeding
+
+RESOLUTION_U = 100
+
+# object matrix of the page, the two rotations of createBook (Y then X)
+BOOK_MATRIX = np.eye(4)
+BOOK_MATRIX[:3, :3] = campose.axis_rotation('X', -np.pi / 2) @ campose.axis_rotation('Y', np.pi / 2)
+
+
+def control_points(r, k1, k2):
+    # (..., 2 segments, 4 points, xy) of the profile
+    r, k1, k2 = np.broadcast_arrays(*[np.asarray(x, dtype=np.float64) for x in (r, k1, k2)])
+    zero = np.zeros_like(r)
+    seg_a = [(-2 * r, zero), (-r, zero), (-0.5 * r, -0.5 * k1 * r), (zero, zero)]
+    seg_b = [(zero, zero), (0.5 * r, -0.5 * k2 * r), (r, zero), (2 * r, zero)]
+    return np.stack([np.stack([np.stack(p, axis=-1) for p in seg], axis=-2) for seg in (seg_a, seg_b)], axis=-3)
+
+
+def profile(r, k1, k2, resolution=RESOLUTION_U):
+    # (..., 2 * resolution + 1, 2) points of the curve, like the curve evaluation of Blender
+    t = np.arange(resolution) / float(resolution)
+    basis = np.stack([(1 - t) ** 3, 3 * t * (1 - t) ** 2, 3 * t ** 2 * (1 - t), t ** 3], axis=1)
+    ctrl = control_points(r, k1, k2)
+    points = np.einsum('tk,...skd->...std', basis, ctrl)
+    points = points.reshape(points.shape[:-3] + (2 * resolution, 2))
+    return np.concatenate([points, ctrl[..., 1:, 3, :]], axis=-2)
+
+
+def topology(npoints):
+    # faces and uvs shared by all the books
+    a = np.arange(npoints - 1)
+    p1, p2, p3, p4 = 2 * a, 2 * a + 1, 2 * a + 2, 2 * a + 3
+    faces = np.stack([np.stack([p1, p3, p4], axis=1), np.stack([p1, p4, p2], axis=1)], axis=1).reshape(-1, 3)
+    uv = np.stack(np.meshgrid(np.arange(npoints) / float(npoints - 1), [0.0, 1.0], indexing='ij'), axis=-1)
+    return faces.astype(np.int32), uv.reshape(-1, 2).astype(np.float32)
+
+
+def book_vertices(wdh, r, k1, k2, resolution=RESOLUTION_U):
+    '''
+    Vertices of the books (arrays of parameters broadcast together),
+    (..., 2 * (2 * resolution + 1), 3) in the local coordinates of the page.
+    '''
+    points = profile(r, k1, k2, resolution)
+    length = np.linalg.norm(np.diff(points, axis=-2), axis=-1).sum(axis=-1)
+    extrude = np.asarray(wdh) * length * 0.5
+    co = np.empty(points.shape[:-1] + (2, 3))
+    co[..., :2] = points[..., None, :]
+    co[..., 0, 2] = -extrude[..., None]
+    co[..., 1, 2] = extrude[..., None]
+    return co.reshape(points.shape[:-2] + (-1, 3)).astype(np.float32)
+
+
+def make_book(wdh, r, k1, k2, resolution=RESOLUTION_U):
+    # one book, a dict of objmesh.read_obj
+    co = book_vertices(wdh, r, k1, k2, resolution)
+    faces, uv = topology(2 * resolution + 1)
+    return {'co': co, 'uv': uv, 'faces': faces, 'face_uvs': faces.copy()}
+
+
+def sample_books(n, wdhs, seed=0, r=0.5):
+    # parameters of n books, k1 and k2 drawn like render_mesh.render_img
+    books = []
+    for k in range(n):
+        rng = seeding.sample_rng(seed, 'book:{}'.format(k))
+        books.append(('book-{:06d}'.format(k), rng.choice(wdhs), r, rng.uniform(0.1, 1.7), rng.uniform(0.1, 1.7)))
+    return books
+
+
+def write_cache(books, cache_dir, resolution=RESOLUTION_U):
+    # all the vertices in one pass, then one cache entry per book
+    params = np.array([book[1:] for book in books], dtype=np.float64)
+    co = book_vertices(params[:, 0], params[:, 1], params[:, 2], params[:, 3], resolution)
+    faces, uv = topology(2 * resolution + 1)
+    for book, book_co in zip(books, co):
+        meshcache.save({'co': book_co, 'uv': uv, 'faces': faces, 'face_uvs': faces},
+                       os.path.join(cache_dir, book[0]))
+    with open(os.path.join(cache_dir, 'books.csv'), 'w', newline='') as f:
+        csv.writer(f).writerows(books)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate book page meshes to the mesh cache')
+    parser.add_argument('-n', '--num', type=int, help='number of books', default=1000)
+    parser.add_argument('--wdh', type=float, nargs='+', help='height / width of the pages', default=[1.294])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--out', help='cache folder', default='meshcache/books')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.out):
+        os.makedirs(args.out)
+    books = sample_books(args.num, args.wdh, args.seed)
+    write_cache(books, args.out)
+    print('{} books in {}'.format(len(books), args.out))
+    print('---output:' + os.path.abspath(os.path.join(args.out, 'books.csv')) + '---')
@@ -0,0 +1,78 @@
+'''
+Code for rendering the groundtruths of Doc3D dataset
+https://www3.cs.stonybrook.edu/~cvl/projects/dewarpnet/storage/paper.pdf (ICCV 2019)
+
+This code samples the random camera poses of render_mesh.randCam as numpy
+matrices, so that a batch of look-at/roll candidates can be scored against
+the mesh in one pass (see visibility.py). The random numbers are drawn in
+the same order as the original one-by-one loop. It does not need Blender.
+'''
+import math
+import numpy as np
+
+
+def axis_rotation(axis, angle):
+    c, s = math.cos(angle), math.sin(angle)
+    if axis == 'X':
+        return np.array([[1, 0, 0], [0, c, -s], [0, s, c]])
+    elif axis == 'Y':
+        return np.array([[c, 0, s], [0, 1, 0], [-s, 0, c]])
+    return np.array([[c, -s, 0], [s, c, 0], [0, 0, 1]])
+
+
+def rotate_axes(*rotations):
+    '''
+    Rotation matrix of Euler((0, 0, 0)) after eul.rotate_axis(axis, angle)
+    for each (axis, angle); every rotation is applied in the rotated frame.
+    '''
+    mat = np.eye(3)
+    for axis, angle in rotations:
+        mat = mat @ axis_rotation(axis, angle)
+    return mat
+
+
+def euler_matrix(eul):
+    # rotation matrix of a Blender XYZ Euler (rotation_euler)
+    return axis_rotation('Z', eul[2]) @ axis_rotation('Y', eul[1]) @ axis_rotation('X', eul[0])
+
+
+def camera_matrix(rotation, location):
+    mat = np.eye(4)
+    mat[:3, :3] = rotation
+    mat[:3, 3] = location
+    return mat
+
+
+def camera_position(d, z_angle, x_angle):
+    return rotate_axes(('Z', z_angle), ('X', x_angle)) @ np.array([0.0, d, 0.0])
+
+
+def sample_camera(rng):
+    '''
+    Draws the focal length and the camera position like randCam.
+    Returns lens, d and the camera location.
+    '''
+    lens = rng.randint(25, 35)
+    d = rng.uniform(2.3, 3.3)
+    z_angle = rng.uniform(0, 3.1415)
+    x_angle = rng.uniform(math.radians(60), math.radians(120))
+    return lens, d, camera_position(d, z_angle, x_angle)
+
+
+def sample_candidates(rng, d, campos, n):
+    '''
+    Draws n look-at/roll candidates (3 random numbers each, in the order of
+    the randCam loop) and returns their (n, 4, 4) camera matrices.
+    '''
+    mats = np.empty((n, 4, 4))
+    for k in range(n):
+        # look at pos
+        st = (d - 2.3) / 1.0 * 0.2 + 0.3
+        lookat = (rng.uniform(-st, st), rng.uniform(-st, st), 0)
+        st = (d - 2.3) / 1.0 * 15 + 5.
+        roll = rng.uniform(math.radians(-90 - st), math.radians(-90 + st))
+        rotation = rotate_axes(('X', math.atan2(lookat[1] - campos[1], campos[2])),
+                               ('Y', math.atan2(campos[0] - lookat[0], campos[2])),
+                               ('Z', roll))
+        mats[k] = camera_matrix(rotation, campos)
+    return mats
@@ -0,0 +1,107 @@
+'''
+Code for rendering the groundtruths of Doc3D dataset
+https://www3.cs.stonybrook.edu/~cvl/projects/dewarpnet/storage/paper.pdf (ICCV 2019)
+
+This code keeps the catalog of the rendered samples of a folder id,
+catalog/<folder-id>.jsonl, one {"sample", "path"} record per sample appended
+by render_mesh.py when the sample is saved (.blend or .json scene record).
+The order is the order of the appends and never changes, so a
+<start> <end> range of the catalog always gives the same samples;
+a sample appended twice by two processes keeps its first position.
+The downstream scripts take their samples from it (work_list), the
+missing gts come from the manifest (manifest.py).
+
+python catalog.py <folder-id> [--range <start> <end>] [--missing alb norm ...] [--count]
+prints the paths of the samples.
+python blendnames.py <folder-id> --scan adds the samples saved before the catalog.
+'''
+import os
+import csv
+import argparse
+
+import manifest
+
+CATALOG_DIR = 'catalog'
+
+
+class Catalog:
+    '''
+    The samples of one folder id in catalog order, reloaded incrementally.
+    '''
+
+    def __init__(self, path):
+        self.log = manifest.AppendLog(path)
+        self.samples = []
+        self.paths = {}
+        self.refresh()
+
+    def refresh(self):
+        for record in self.log.refresh():
+            if record['sample'] not in self.paths:
+                self.samples.append(record['sample'])
+                self.paths[record['sample']] = record['path']
+
+    def __len__(self):
+        return len(self.samples)
+
+    def add(self, sample, path):
+        # appends a sample, once
+        self.refresh()
+        if sample in self.paths:
+            return False
+        self.log.append({'sample': sample, 'path': path})
+        self.samples.append(sample)
+        self.paths[sample] = path
+        return True
+
+    def range(self, start=0, end=None):
+        return [self.paths[sample] for sample in self.samples[start:end]]
+
+    def missing(self, gts, log, start=0, end=None):
+        # paths of the samples of a range with one of the gts not done in the manifest
+        return [self.paths[sample] for sample in self.samples[start:end]
+                if not all(log.is_done(sample, gt) for gt in gts)]
+
+
+_catalogs = {}
+
+
+def catalog_path(folder, root='.'):
+    return os.path.abspath(os.path.join(root, CATALOG_DIR, '{}.jsonl'.format(folder)))
+
+
+def open_catalog(folder, root='.'):
+    # the catalog of a folder id, one per process
+    path = catalog_path(folder, root)
+    if path not in _catalogs:
+        _catalogs[path] = Catalog(path)
+    return _catalogs[path]
+
+
+def work_list(folder, root='.'):
+    # the sample paths of a folder id: the catalog, or the blend list of blendnames.py without one
+    if os.path.exists(catalog_path(folder, root)):
+        return open_catalog(folder, root).range()
+    with open(os.path.join(root, 'blendlists', 'blendlist{}.csv'.format(folder)), 'r') as b:
+        return [row[0] for row in csv.reader(b) if row]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Query the catalog of the rendered samples')
+    parser.add_argument('folder', help='output folder id')
+    parser.add_argument('--range', type=int, nargs=2, help='start and end (exclusive) in the catalog')
+    parser.add_argument('--missing', nargs='+', help='only the samples with one of these gts not done')
+    parser.add_argument('--count', action='store_true', help='only print the number of samples')
+    args = parser.parse_args()
+
+    cat = open_catalog(args.folder)
+    start, end = args.range or (0, None)
+    if args.missing:
+        paths = cat.missing(args.missing, manifest.open_manifest(args.folder), start, end)
+    else:
+        paths = cat.range(start, end)
+    if args.count:
+        print(len(paths))
+    else:
+        for path in paths:
+            print(path)
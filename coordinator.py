@@ -0,0 +1,327 @@
+'''
+Code for rendering the groundtruths of Doc3D dataset
+https://www3.cs.stonybrook.edu/~cvl/projects/dewarpnet/storage/paper.pdf (ICCV 2019)
+
+This code spreads a batch_render.py render plan over several machines.
+The plan (meshes of objs.csv with their texture and env map) is split into
+leases of --lease-size jobs. Each machine runs a worker that claims a lease,
+renders it with its local pool of Blender workers and marks it complete,
+while a heartbeat keeps the lease; the lease of a machine that stopped
+sending heartbeats for --ttl seconds expires and is claimed by another one.
+Two backends:
+file: lock files in a folder of a shared file system, nothing to run
+socket: a lease server on one machine, e.g. where the file system has no
+reliable exclusive create
+
+python coordinator.py plan <folder-id> <start-mesh> <end-mesh> (writes leases/<folder-id>/plan.json)
+python coordinator.py work --leases leases/<folder-id> -n <nproc>
+or
+python coordinator.py serve <folder-id> <start-mesh> <end-mesh> --port 5000 --authkey <key>
+python coordinator.py work --server <host>:5000 --authkey <key> -n <nproc>
+'''
+import os
+import json
+import time
+import uuid
+import socket
+import argparse
+import threading
+from multiprocessing.managers import BaseManager
+
+import batch_render
+import manifest
+
+PLAN = 'plan.json'
+
+
+def make_plan(folder, id1, id2, conf, lease_size, seed=0):
+    # the jobs only depend on the seed, a reassigned lease renders the same samples
+    jobs = batch_render.make_jobs(folder, id1, id2, conf, seed)
+    return [{'id': k, 'jobs': jobs[i:i + lease_size]} for k, i in enumerate(range(0, len(jobs), lease_size))]
+
+
+def write_json(path, data):
+    # write then rename, readers never see a partial file
+    tmp = '{}.{}.tmp'.format(path, uuid.uuid4().hex)
+    with open(tmp, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+class FileBackend:
+    '''
+    Leases as files next to the plan: lease-<id>.lock while claimed
+    (created with O_EXCL, mtime is the heartbeat) and lease-<id>.done.
+    '''
+
+    def __init__(self, folder, ttl=600):
+        self.folder = folder
+        self.ttl = ttl
+        with open(os.path.join(folder, PLAN), 'r') as f:
+            self.leases = json.load(f)
+
+    def path(self, lid, ext):
+        return os.path.join(self.folder, 'lease-{:05d}.{}'.format(lid, ext))
+
+    def try_lock(self, lid, worker):
+        try:
+            fd = os.open(self.path(lid, 'lock'), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        except FileExistsError:
+            return False
+        os.write(fd, worker.encode('utf-8'))
+        os.close(fd)
+        return True
+
+    def claim(self, worker):
+        for lease in self.leases:
+            lid = lease['id']
+            if os.path.exists(self.path(lid, 'done')):
+                continue
+            if self.try_lock(lid, worker):
+                return lease
+            try:
+                mtime = os.path.getmtime(self.path(lid, 'lock'))
+            except FileNotFoundError:
+                continue
+            owner = self.owner(lid)
+            if owner is not None and time.time() - mtime > self.ttl:
+                # only one of the workers finding it expired wins the rename
+                expired = self.path(lid, 'expired-' + uuid.uuid4().hex)
+                try:
+                    os.rename(self.path(lid, 'lock'), expired)
+                except FileNotFoundError:
+                    continue
+                if not self.same_lock(expired, owner, mtime):
+                    # another worker took it over in between, its live lock goes back
+                    self.restore(lid, expired)
+                    continue
+                os.remove(expired)
+                print('lease {} expired, reassigned to {}'.format(lid, worker))
+                if self.try_lock(lid, worker):
+                    return lease
+        return None
+
+    def same_lock(self, path, owner, mtime):
+        # the moved lock file is still the expired one that was checked
+        with open(path, 'r') as f:
+            return f.read() == owner and os.path.getmtime(path) == mtime
+
+    def restore(self, lid, expired):
+        # puts a moved lock back with its heartbeat, unless a new one was created since
+        with open(expired, 'r') as f:
+            owner = f.read()
+        mtime = os.path.getmtime(expired)
+        if self.try_lock(lid, owner):
+            os.utime(self.path(lid, 'lock'), (mtime, mtime))
+        os.remove(expired)
+
+    def owner(self, lid):
+        try:
+            with open(self.path(lid, 'lock'), 'r') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def heartbeat(self, lid, worker):
+        # False when the lease expired and went to another worker
+        if self.owner(lid) != worker:
+            return False
+        os.utime(self.path(lid, 'lock'))
+        return True
+
+    def complete(self, lid, worker, summary):
+        # False when the lease went to another worker
+        if self.owner(lid) != worker:
+            return False
+        write_json(self.path(lid, 'done'), dict(summary, worker=worker))
+        os.remove(self.path(lid, 'lock'))
+        return True
+
+    def finished(self):
+        return all(os.path.exists(self.path(lease['id'], 'done')) for lease in self.leases)
+
+
+class LeaseServer:
+    '''
+    The same leases kept in memory by the coordinator process and served
+    over a socket. Claims and completions are logged, a restarted
+    server does not hand out the completed leases again.
+    '''
+
+    def __init__(self, leases, log_path, ttl=600):
+        self.leases = leases
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.owners = {}  # lease id -> [worker, last heartbeat]
+        self.done = set()
+        self.log = manifest.AppendLog(log_path)
+        for record in self.log.refresh():
+            if record['state'] == 'done':
+                self.done.add(record['lease'])
+
+    def claim(self, worker):
+        with self.lock:
+            now = time.time()
+            for lease in self.leases:
+                lid = lease['id']
+                if lid in self.done:
+                    continue
+                owner = self.owners.get(lid)
+                if owner is not None and now - owner[1] <= self.ttl:
+                    continue
+                if owner is not None:
+                    print('lease {} of {} expired, reassigned to {}'.format(lid, owner[0], worker))
+                self.owners[lid] = [worker, now]
+                self.log.append({'lease': lid, 'state': 'claim', 'worker': worker, 'time': now})
+                return lease
+            return None
+
+    def heartbeat(self, lid, worker):
+        with self.lock:
+            owner = self.owners.get(lid)
+            if owner is None or owner[0] != worker:
+                return False
+            owner[1] = time.time()
+            return True
+
+    def complete(self, lid, worker, summary):
+        # False when the lease went to another worker
+        with self.lock:
+            owner = self.owners.get(lid)
+            if owner is None or owner[0] != worker:
+                return False
+            self.done.add(lid)
+            self.owners.pop(lid, None)
+            self.log.append(dict(summary, lease=lid, state='done', worker=worker, time=time.time()))
+            print('lease {} done by {}, {}/{} leases'.format(lid, worker, len(self.done), len(self.leases)))
+            return True
+
+    def finished(self):
+        with self.lock:
+            return len(self.done) == len(self.leases)
+
+
+class LeaseManager(BaseManager):
+    pass
+
+
+def socket_backend(address, authkey):
+    host, port = address.rsplit(':', 1)
+    LeaseManager.register('get_leases')
+    manager = LeaseManager(address=(host, int(port)), authkey=authkey.encode())
+    manager.connect()
+    return manager.get_leases()
+
+
+class Heartbeat(threading.Thread):
+    '''
+    Renews a lease every interval seconds until stopped,
+    lost is set when the lease went to another worker.
+    '''
+
+    def __init__(self, backend, lid, worker, interval):
+        super().__init__(daemon=True)
+        self.backend = backend
+        self.lid = lid
+        self.worker = worker
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.lost = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            if not self.backend.heartbeat(self.lid, self.worker):
+                print('lost lease {}'.format(self.lid))
+                self.lost.set()
+                break
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def work(backend, pool, ttl, poll=30):
+    # claims and renders leases until the plan is finished
+    worker = '{}-{}'.format(socket.gethostname(), os.getpid())
+    while True:
+        lease = backend.claim(worker)
+        if lease is None:
+            if backend.finished():
+                break
+            # the rest is leased to other machines, wait in case one expires
+            time.sleep(poll)
+            continue
+        print('{} rendering lease {} ({} jobs)'.format(worker, lease['id'], len(lease['jobs'])))
+        heartbeat = Heartbeat(backend, lease['id'], worker, ttl / 4.)
+        heartbeat.start()
+        # the pool stops handing out the jobs of a lost lease, its new owner renders them
+        results = pool.run(lease['jobs'], stop=heartbeat.lost)
+        heartbeat.stop()
+        summary = {}
+        for job, status in results:
+            summary[status] = summary.get(status, 0) + 1
+        if not backend.complete(lease['id'], worker, summary):
+            print('{} lost lease {}, not completed'.format(worker, lease['id']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Render a plan over several machines')
+    sub = parser.add_subparsers(dest='command')
+    for name in ('plan', 'serve'):
+        p = sub.add_parser(name)
+        p.add_argument('folder', help='output folder id')
+        p.add_argument('id1', type=int, help='first line in objs.csv')
+        p.add_argument('id2', type=int, help='last line in objs.csv (exclusive)')
+        p.add_argument('-c', '--conf', help='configuration path', default='conf/config.json')
+        p.add_argument('--lease-size', type=int, help='jobs per lease', default=50)
+        p.add_argument('--seed', type=int, help='seed of the texture and env map choices', default=0)
+        p.add_argument('--leases', help='lease folder, leases/<folder-id> by default')
+    sub.choices['serve'].add_argument('--port', type=int, default=5000)
+    sub.choices['serve'].add_argument('--authkey', required=True)
+    sub.choices['serve'].add_argument('--ttl', type=float, help='lease expiry without heartbeat (s)', default=600)
+    p = sub.add_parser('work')
+    p.add_argument('--leases', help='lease folder (file backend)')
+    p.add_argument('--server', help='lease server host:port (socket backend)')
+    p.add_argument('--authkey', help='lease server key')
+    p.add_argument('--ttl', type=float, help='lease expiry without heartbeat (s)', default=600)
+    p.add_argument('-n', '--nproc', type=int, help='number of Blender workers',
+                   default=max(1, (os.cpu_count() or 1) // 4))
+    p.add_argument('--max-jobs', type=int, help='restart a worker after this many jobs', default=50)
+    p.add_argument('--max-rss', type=float, help='restart a worker above this peak memory (MB), 0 to disable', default=0)
+    p.add_argument('--threads', type=int, help='render threads of each worker, 0 for the render profile '
+                                               'of the config (default: the cores divided by the workers)')
+    p.add_argument('--blender', help='blender executable', default='blender')
+    args = parser.parse_args()
+
+    if args.command in ('plan', 'serve'):
+        folder = args.leases or os.path.join('leases', args.folder)
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        if os.path.exists(os.path.join(folder, PLAN)):
+            # a restarted server keeps the plan of its completed leases
+            with open(os.path.join(folder, PLAN), 'r') as f:
+                leases = json.load(f)
+            print('using the plan in {}'.format(folder))
+        else:
+            leases = make_plan(args.folder, args.id1, args.id2, args.conf, args.lease_size, args.seed)
+            write_json(os.path.join(folder, PLAN), leases)
+        print('{} leases in {}'.format(len(leases), folder))
+
+    if args.command == 'serve':
+        server = LeaseServer(leases, os.path.join(folder, 'leases.jsonl'), args.ttl)
+        LeaseManager.register('get_leases', callable=lambda: server)
+        manager = LeaseManager(address=('', args.port), authkey=args.authkey.encode())
+        print('serving {} leases on port {}'.format(len(leases), args.port))
+        manager.get_server().serve_forever()
+    elif args.command == 'work':
+        if args.server:
+            backend = socket_backend(args.server, args.authkey)
+        elif args.leases:
+            backend = FileBackend(args.leases, args.ttl)
+        else:
+            parser.error('--leases or --server is needed')
+        pool = batch_render.WorkerPool(args.nproc, args.blender, args.max_jobs, args.max_rss,
+                                       batch_render.worker_threads(args.nproc, args.threads))
+        work(backend, pool, args.ttl)
+    elif args.command is None:
+        parser.print_help()
@@ -0,0 +1,258 @@
+'''
+Code for rendering the groundtruths of Doc3D dataset
+https://www3.cs.stonybrook.edu/~cvl/projects/dewarpnet/storage/paper.pdf (ICCV 2019)
+
+This code deforms a flat page grid into folded, creased, curled and
+crumpled pages with numpy, for render_mesh.py --generate with
+"generator": {"type": "deform"} in the config (book.py makes the single
+bent sheet of the default "book" generator).
+A page is a dict {"wdh", "resolution", "ops"}: a width 2 page in the xy
+plane (height 2 * wdh, resolution cells across), the uv of the flat grid,
+and a list of operations applied in order:
+crumple: ridged noise along the page normal
+crease: a sharp fold by a small angle along a line
+fold: the page beyond a line turned by an angle over a band of a width
+curl: the page beyond a line rolled on a cylinder, or a cone with a slope,
+up to one turn
+Lines are a point and the angle of their normal in the xy plane, the part
+of the page on the side of the normal moves. Each operation keeps the
+lengths of a flat page, a later operation bending a part already moved
+by another one does not. random_page draws the
+operations from the generator of the sample, so a page is rebuilt from
+the scene record (scenerecord.py) with build_page.
+
+python deform.py -n 1000 --wdh 1.294 -o meshcache/pages
+writes 1000 random pages to the mesh cache (meshcache.py), and their
+operations to pages.jsonl.
+'''
+import os
+import json
+import math
+import argparse
+import numpy as np
+
+import meshcache
+import seeding
+
+# default counts (min, max) and sizes of the random operations
+DEFAULTS = {
+    "resolution": 100,
+    "crumple": [0.0, 0.02],
+    "creases": [0, 3],
+    "folds": [0, 2],
+    "curls": [0, 2],
+}
+
+
+def flat_grid(wdh, resolution=100):
+    '''
+    The flat page, a dict of objmesh.read_obj with the vertices in rows of
+    constant y, and its (n, 2) rest positions.
+    '''
+    nx = resolution + 1
+    ny = max(2, int(round(resolution * wdh)) + 1)
+    u, v = np.meshgrid(np.linspace(0.0, 1.0, nx), np.linspace(0.0, 1.0, ny))
+    rest = np.stack([2.0 * u - 1.0, (2.0 * v - 1.0) * wdh], axis=-1).reshape(-1, 2)
+    co = np.zeros((len(rest), 3))
+    co[:, :2] = rest
+    i, j = np.meshgrid(np.arange(nx - 1), np.arange(ny - 1))
+    p1 = (j * nx + i).ravel()
+    p2, p3, p4 = p1 + 1, p1 + nx, p1 + nx + 1
+    faces = np.concatenate([np.stack([p1, p2, p4], axis=1), np.stack([p1, p4, p3], axis=1)]).astype(np.int32)
+    uv = np.stack([u, v], axis=-1).reshape(-1, 2).astype(np.float32)
+    return {'co': co, 'uv': uv, 'faces': faces, 'face_uvs': faces.copy()}, rest
+
+
+def line_frame(point, phi):
+    # signed distance axis (normal) and axis along a line
+    normal = np.array([math.cos(phi), math.sin(phi)])
+    return np.asarray(point, dtype=np.float64), normal, np.array([-normal[1], normal[0]])
+
+
+def bend(co, point, phi, radius, angle=None, side=1):
+    '''
+    Rolls the page beyond the line on a cylinder of radius (an array gives
+    a radius per vertex, e.g. a cone), up to angle when given and straight
+    beyond it. The offsets of the vertices along z follow the normal, the
+    lengths in the page are kept.
+    '''
+    point, normal, _ = line_frame(point, phi)
+    s = (co[:, :2] - point) @ normal
+    moved = s > 0
+    t = np.where(moved, s, 0.0)
+    radius = np.maximum(radius, 1e-6)
+    theta = t / radius
+    if angle is not None:
+        theta = np.minimum(theta, angle)
+    rest = t - theta * radius
+    z0 = co[:, 2]
+    new_s = radius * np.sin(theta) + rest * np.cos(theta) - side * z0 * np.sin(theta)
+    new_z = side * (radius * (1 - np.cos(theta)) + rest * np.sin(theta)) + z0 * np.cos(theta)
+    co = co.copy()
+    co[:, :2] += (np.where(moved, new_s, s) - s)[:, None] * normal
+    co[:, 2] = np.where(moved, new_z, z0)
+    return co
+
+
+def fold(co, point, phi, angle, width, side=1):
+    return bend(co, point, phi, width / max(angle, 1e-6), angle, side)
+
+
+def crease(co, point, phi, angle, side=1, width=0.01):
+    return fold(co, point, phi, angle, width, side)
+
+
+def cone(co, point, phi, radius, slope, angle=None, side=1):
+    '''
+    Rolls the page beyond the line on a cone touching the page along the
+    line, with radius at point growing by slope along the line (the apex is
+    on the line where the radius is 0), up to angle around the axis and
+    straight beyond it. The offsets along z follow the normal, the lengths
+    in the page are kept when the apex is outside of the page.
+    '''
+    point, normal, along = line_frame(point, phi)
+    ruling = along * np.sign(slope)
+    apex = point - ruling * radius / abs(slope)
+    alpha = math.atan(abs(slope))
+    ez = np.array([0.0, 0.0, 1.0])
+    ruling3, normal3 = np.append(ruling, 0.0), np.append(normal, 0.0)
+    axis = math.cos(alpha) * ruling3 + math.sin(alpha) * side * ez
+    down = math.sin(alpha) * ruling3 - math.cos(alpha) * side * ez
+    d = co[:, :2] - apex
+    rho = np.linalg.norm(d, axis=1)
+    psi = np.arctan2(d @ normal, d @ ruling)
+    # angle around the axis, the rest of psi is straight in the tangent plane
+    turn = psi / math.sin(alpha)
+    if angle is not None:
+        turn = np.minimum(turn, angle)
+    rest = psi - turn * math.sin(alpha)
+    c, s = np.cos(turn)[:, None], np.sin(turn)[:, None]
+    generator = math.cos(alpha) * axis + math.sin(alpha) * (c * down + s * normal3)
+    tangent = -s * down + c * normal3
+    surface = np.append(apex, 0.0) + rho[:, None] * (np.cos(rest)[:, None] * generator +
+                                                     np.sin(rest)[:, None] * tangent)
+    # the normal of the page, +z on the line
+    page_normal = np.cross(generator, tangent) * np.cross(ruling3, normal3)[2]
+    moved = (co[:, :2] - point) @ normal > 0
+    co = co.copy()
+    co[moved] = surface[moved] + co[moved, 2:3] * page_normal[moved]
+    return co
+
+
+def curl(co, point, phi, radius, slope=0.0, side=1, angle=2 * math.pi):
+    # cylindrical curl, conical when the radius changes along the line by slope,
+    # one turn at most so that the page does not go through itself
+    if slope == 0:
+        return bend(co, point, phi, radius, angle, side)
+    return cone(co, point, phi, radius, slope, angle, side)
+
+
+def crumple(co, rest, amplitude, seed, waves=24):
+    # ridged noise of random plane waves, smaller amplitude at higher frequency
+    state = np.random.RandomState(seed)
+    freq = state.uniform(1.0, 12.0, waves)
+    direction = state.uniform(0, 2 * np.pi, waves)
+    phase = state.uniform(0, 2 * np.pi, waves)
+    k = np.stack([np.cos(direction), np.sin(direction)], axis=1) * freq[:, None]
+    ridges = 1.0 - 2.0 * np.abs(np.sin(rest @ k.T + phase))
+    height = ridges @ (1.0 / freq) / np.sum(1.0 / freq)
+    co = co.copy()
+    co[:, 2] += amplitude * height
+    return co
+
+
+def apply(co, rest, op):
+    params = {k: v for k, v in op.items() if k != 'op'}
+    if op['op'] == 'crumple':
+        return crumple(co, rest, **params)
+    return {'crease': crease, 'fold': fold, 'curl': curl}[op['op']](co, **params)
+
+
+def build_page(page):
+    # the mesh of a page, a dict of objmesh.read_obj, identity object matrix
+    mesh, rest = flat_grid(page['wdh'], page.get('resolution', DEFAULTS['resolution']))
+    co = mesh['co']
+    for op in page['ops']:
+        co = apply(co, rest, op)
+    mesh['co'] = co.astype(np.float32)
+    return mesh
+
+
+def random_line(rng, wdh, margin=0.8):
+    # a line through the page
+    return [rng.uniform(-margin, margin), rng.uniform(-margin * wdh, margin * wdh)], rng.uniform(0, 2 * math.pi)
+
+
+def random_page(rng, wdh, opts=None):
+    '''
+    Draws the operations of a page from rng (random.Random), opts overrides
+    DEFAULTS ("generator" of the config).
+    '''
+    opts = dict(DEFAULTS, **(opts or {}))
+    ops = []
+    amplitude = rng.uniform(*opts["crumple"])
+    if amplitude > 0:
+        ops.append({'op': 'crumple', 'amplitude': amplitude, 'seed': rng.getrandbits(31)})
+    for _ in range(rng.randint(*opts["creases"])):
+        point, phi = random_line(rng, wdh)
+        ops.append({'op': 'crease', 'point': point, 'phi': phi, 'angle': rng.uniform(0.05, 0.3),
+                    'side': rng.choice([-1, 1])})
+    for _ in range(rng.randint(*opts["folds"])):
+        point, phi = random_line(rng, wdh, 0.5)
+        ops.append({'op': 'fold', 'point': point, 'phi': phi, 'angle': rng.uniform(0.2, 1.2),
+                    'width': rng.uniform(0.05, 0.3), 'side': rng.choice([-1, 1])})
+    for _ in range(rng.randint(*opts["curls"])):
+        # from one of the edges, the line parallel to it
+        edge = rng.randint(0, 3)
+        phi = edge * math.pi / 2
+        half = 1.0 if edge % 2 == 0 else wdh
+        depth = rng.uniform(0.1, 0.6) * half
+        point = [(half - depth) * math.cos(phi), (half - depth) * math.sin(phi)]
+        slope = rng.uniform(-0.3, 0.3) if rng.random() > 0.5 else 0.0
+        phi += rng.uniform(-0.3, 0.3)
+        radius = rng.uniform(0.2, 1.0)
+        # the radius of a cone stays above half of it across the page
+        along = np.array([-math.sin(phi), math.cos(phi)])
+        corners = np.array([[-1, -wdh], [-1, wdh], [1, -wdh], [1, wdh]]) - point
+        bound = 0.5 * radius / np.max(np.abs(corners @ along))
+        slope = float(np.clip(slope, -bound, bound))
+        ops.append({'op': 'curl', 'point': point, 'phi': phi, 'radius': radius, 'slope': slope,
+                    'side': rng.choice([-1, 1])})
+    return {'wdh': wdh, 'resolution': opts["resolution"], 'ops': ops}
+
+
+def sample_pages(n, wdhs, seed=0, opts=None):
+    pages = []
+    for k in range(n):
+        rng = seeding.sample_rng(seed, 'page:{}'.format(k))
+        pages.append(('page-{:06d}'.format(k), random_page(rng, rng.choice(wdhs), opts)))
+    return pages
+
+
+def write_cache(pages, cache_dir):
+    # one cache entry per page, the operations in pages.jsonl
+    with open(os.path.join(cache_dir, 'pages.jsonl'), 'w') as f:
+        for name, page in pages:
+            meshcache.save(build_page(page), os.path.join(cache_dir, name))
+            f.write(json.dumps(dict(page, name=name)) + '\n')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate deformed page meshes to the mesh cache')
+    parser.add_argument('-n', '--num', type=int, help='number of pages', default=1000)
+    parser.add_argument('--wdh', type=float, nargs='+', help='height / width of the pages', default=[1.294])
+    parser.add_argument('-c', '--conf', help='configuration with a "generator" entry')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--out', help='cache folder', default='meshcache/pages')
+    args = parser.parse_args()
+
+    opts = None
+    if args.conf:
+        with open(args.conf, 'r', encoding='utf-8') as fs:
+            opts = json.load(fs).get("generator")
+    if not os.path.exists(args.out):
+        os.makedirs(args.out)
+    pages = sample_pages(args.num, args.wdh, args.seed, opts)
+    write_cache(pages, args.out)
+    print('{} pages in {}'.format(len(pages), args.out))
+    print('---output:' + os.path.abspath(os.path.join(args.out, 'pages.jsonl')) + '---')
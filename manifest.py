@@ -0,0 +1,114 @@
+'''
+Code for rendering the groundtruths of Doc3D dataset
+https://www3.cs.stonybrook.edu/~cvl/projects/dewarpnet/storage/paper.pdf (ICCV 2019)
+
+This code keeps the render state of the samples in a manifest, so that a
+restarted run skips what is done without looking at the output folders.
+manifest/<folder-id>.jsonl is an append-only log of
+{"sample", "gt", "state": "start" | "done" | <failure>} records.
+A gt is done once its "done" record is written, after its files; a crash in
+between leaves a "start" record and the sample is rendered again.
+A "done" record can list the other gts rendered with it ("outputs"),
+e.g. render_mesh.py with fusedPasses also writes norm and dmap.
+A json lines file and not sqlite since Blender's python has no sqlite3 on
+every platform; appends of one line are atomic enough with O_APPEND for
+the processes of one machine or one NFS client.
+'''
+import os
+import json
+import time
+import socket
+
+MANIFEST_DIR = 'manifest'
+
+
+class AppendLog:
+    '''
+    Append-only json lines file shared by several processes.
+    Each record is written with one write, refresh reads only the new lines.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.offset = 0
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder, exist_ok=True)
+
+    def append(self, record):
+        line = (json.dumps(record, sort_keys=True) + '\n').encode('utf-8')
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+    def refresh(self):
+        # records appended since the last call, a partly written last line is read next time
+        if not os.path.exists(self.path):
+            return []
+        records = []
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                self.offset += len(line)
+                if line.strip():
+                    try:
+                        records.append(json.loads(line.decode('utf-8')))
+                    except ValueError:
+                        # garbage from an interrupted write
+                        pass
+        return records
+
+
+class Manifest:
+    '''
+    State of (sample, gt) pairs of one folder id, loaded once, then O(1) per sample.
+    '''
+
+    def __init__(self, path):
+        self.log = AppendLog(path)
+        self.states = {}
+        self.refresh()
+
+    def refresh(self):
+        for record in self.log.refresh():
+            self.states[(record['sample'], record['gt'])] = record['state']
+            if record['state'] == 'done':
+                for gt in record.get('outputs', []):
+                    self.states[(record['sample'], gt)] = 'done'
+
+    def state(self, sample, gt):
+        # None when the manifest has no record of it
+        return self.states.get((sample, gt))
+
+    def is_done(self, sample, gt):
+        return self.states.get((sample, gt)) == 'done'
+
+    def record(self, sample, gt, state, **fields):
+        record = dict(fields, sample=sample, gt=gt, state=state, time=time.time(),
+                      host=socket.gethostname(), pid=os.getpid())
+        self.log.append(record)
+        self.states[(sample, gt)] = state
+        if state == 'done':
+            for output in fields.get('outputs', []):
+                self.states[(sample, output)] = 'done'
+
+    def start(self, sample, gt):
+        self.record(sample, gt, 'start')
+
+    def finish(self, sample, gt, state='done', **fields):
+        self.record(sample, gt, state, **fields)
+
+
+_manifests = {}
+
+
+def open_manifest(folder, root='.'):
+    # the manifest of a folder id, one per process
+    path = os.path.abspath(os.path.join(root, MANIFEST_DIR, '{}.jsonl'.format(folder)))
+    if path not in _manifests:
+        _manifests[path] = Manifest(path)
+    return _manifests[path]
@@ -0,0 +1,124 @@
+'''
+Code for rendering the groundtruths of Doc3D dataset
+https://www3.cs.stonybrook.edu/~cvl/projects/dewarpnet/storage/paper.pdf (ICCV 2019)
+
+This code converts the .obj meshes to a binary cache so that they are not
+parsed again for every sample. Each mesh is a folder of raw .npy arrays
+<cache>/<mesh name>-<hash of its path>/{co,uv,faces,face_uvs}.npy (see objmesh.read_obj)
+that numpy can memory map, and that to_blender turns into a Blender mesh
+with foreach_set. Polygons are stored triangulated.
+
+python meshcache.py objs.csv -o meshcache
+'''
+import os
+import csv
+import uuid
+import hashlib
+import argparse
+import functools
+import multiprocessing
+import numpy as np
+
+import objmesh
+
+ARRAYS = ('co', 'uv', 'faces', 'face_uvs')
+
+
+def cache_path(objpath, cache_dir):
+    # meshes of the same name in different folders have their own entry
+    key = hashlib.sha1(os.path.abspath(objpath).encode('utf-8')).hexdigest()[:12]
+    return os.path.join(cache_dir, '{}-{}'.format(os.path.splitext(os.path.basename(objpath))[0], key))
+
+
+def is_cached(objpath, cache_dir):
+    # cached and newer than the .obj
+    path = cache_path(objpath, cache_dir)
+    if not os.path.exists(os.path.join(path, 'faces.npy')):
+        return False
+    return os.path.getmtime(os.path.join(path, 'faces.npy')) >= os.path.getmtime(objpath)
+
+
+def save(mesh, path):
+    if not os.path.exists(path):
+        os.makedirs(path)
+    # faces.npy last, it marks a complete entry, removed first when the entry is rewritten
+    if os.path.exists(os.path.join(path, 'faces.npy')):
+        os.remove(os.path.join(path, 'faces.npy'))
+    for name in sorted(ARRAYS, key=lambda name: name == 'faces'):
+        # write then rename, a crash never leaves a partial array
+        tmp = os.path.join(path, '{}.{}.tmp'.format(name, uuid.uuid4().hex))
+        with open(tmp, 'wb') as f:
+            np.save(f, mesh[name])
+        os.replace(tmp, os.path.join(path, name + '.npy'))
+
+
+def load(path, mmap_mode='r'):
+    return {name: np.load(os.path.join(path, name + '.npy'), mmap_mode=mmap_mode) for name in ARRAYS}
+
+
+def convert(objpath, cache_dir):
+    save(objmesh.read_obj(objpath), cache_path(objpath, cache_dir))
+    return objpath
+
+
+def read_mesh(objpath, cache_dir=None):
+    # arrays of an .obj, from the cache when there is one
+    if cache_dir and is_cached(objpath, cache_dir):
+        return load(cache_path(objpath, cache_dir))
+    return objmesh.read_obj(objpath)
+
+
+def to_blender(mesh, name, matrix=objmesh.OBJ_AXIS):
+    '''
+    Builds a Blender mesh object from the arrays, like bpy.ops.import_scene.obj
+    (same vertex order, flat shading, UVMap, object matrix).
+    '''
+    import bpy
+    from mathutils import Matrix
+
+    co = np.ascontiguousarray(mesh['co'], dtype=np.float32)
+    faces = np.ascontiguousarray(mesh['faces'], dtype=np.int32)
+    nf = len(faces)
+    me = bpy.data.meshes.new(name)
+    me.vertices.add(len(co))
+    me.vertices.foreach_set('co', co.ravel())
+    me.loops.add(nf * 3)
+    me.loops.foreach_set('vertex_index', faces.ravel())
+    me.polygons.add(nf)
+    me.polygons.foreach_set('loop_start', np.arange(0, nf * 3, 3, dtype=np.int32))
+    if bpy.app.version < (4, 0, 0):
+        me.polygons.foreach_set('loop_total', np.full(nf, 3, dtype=np.int32))
+    if len(mesh['uv']):
+        face_uvs = np.asarray(mesh['face_uvs']).ravel()
+        loop_uv = np.where(face_uvs[:, None] >= 0, np.asarray(mesh['uv'])[np.maximum(face_uvs, 0)], 0)
+        me.uv_layers.new(name='UVMap').data.foreach_set('uv', np.ascontiguousarray(loop_uv, dtype=np.float32).ravel())
+    me.update(calc_edges=True)
+
+    obj = bpy.data.objects.new(name, me)
+    bpy.context.scene.collection.objects.link(obj)
+    obj.matrix_world = Matrix(np.asarray(matrix).tolist())
+    return obj
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert .obj meshes to the binary mesh cache')
+    parser.add_argument('meshes', nargs='+', help='.obj files or .csv lists of them (objs.csv)')
+    parser.add_argument('-o', '--out', help='cache folder', default='meshcache')
+    parser.add_argument('-n', '--nproc', type=int, help='number of processes', default=os.cpu_count())
+    args = parser.parse_args()
+
+    objpaths = []
+    for path in args.meshes:
+        if path.endswith('.csv'):
+            with open(path, 'r') as f:
+                objpaths += [row[0] for row in csv.reader(f) if row]
+        else:
+            objpaths.append(path)
+    todo = [p for p in objpaths if not is_cached(p, args.out)]
+    print('{} meshes, {} to convert'.format(len(objpaths), len(todo)))
+
+    pool = multiprocessing.Pool(processes=args.nproc)
+    for objpath in pool.imap_unordered(functools.partial(convert, cache_dir=args.out), todo):
+        print(objpath)
+    pool.close()
+    pool.join()
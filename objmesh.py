@@ -0,0 +1,86 @@
+'''
+Code for rendering the groundtruths of Doc3D dataset
+https://www3.cs.stonybrook.edu/~cvl/projects/dewarpnet/storage/paper.pdf (ICCV 2019)
+
+This code reads the .obj meshes into numpy arrays for the parts of the
+pipeline that do not run in Blender (rasterize.py, plan.py).
+Polygons are triangulated as fans, the vertex order is the one of the file,
+which is also the order bpy.ops.import_scene.obj gives.
+'''
+import numpy as np
+
+# object matrix set by bpy.ops.import_scene.obj (forward -Z, up Y),
+# maps the .obj coordinates to the Blender world
+OBJ_AXIS = np.array([[1.0, 0.0, 0.0, 0.0],
+                     [0.0, 0.0, -1.0, 0.0],
+                     [0.0, 1.0, 0.0, 0.0],
+                     [0.0, 0.0, 0.0, 1.0]])
+
+
+def read_obj(path):
+    '''
+    Returns a dict of
+    co: (n, 3) float32 vertex coordinates
+    uv: (m, 2) float32 texture coordinates
+    faces: (f, 3) int32 vertex indices of the triangles
+    face_uvs: (f, 3) int32 uv indices of the triangles, -1 without uv
+    '''
+    co = []
+    uv = []
+    faces = []
+    face_uvs = []
+    with open(path, 'r') as f:
+        for line in f:
+            if line.startswith('v '):
+                co.append(line.split()[1:4])
+            elif line.startswith('vt '):
+                uv.append(line.split()[1:3])
+            elif line.startswith('f '):
+                vids = []
+                tids = []
+                for token in line.split()[1:]:
+                    ids = token.split('/')
+                    vids.append(int(ids[0]))
+                    tids.append(int(ids[1]) if len(ids) > 1 and ids[1] else 0)
+                for k in range(1, len(vids) - 1):
+                    faces.append((vids[0], vids[k], vids[k + 1]))
+                    face_uvs.append((tids[0], tids[k], tids[k + 1]))
+
+    co = np.array(co, dtype=np.float32).reshape(-1, 3)
+    uv = np.array(uv, dtype=np.float32).reshape(-1, 2)
+    faces = np.array(faces, dtype=np.int64).reshape(-1, 3)
+    face_uvs = np.array(face_uvs, dtype=np.int64).reshape(-1, 3)
+    # 1-based, negative indices count from the end
+    faces = np.where(faces > 0, faces - 1, faces + len(co))
+    face_uvs = np.where(face_uvs > 0, face_uvs - 1, np.where(face_uvs < 0, face_uvs + len(uv), -1))
+    return {'co': co, 'uv': uv, 'faces': faces.astype(np.int32), 'face_uvs': face_uvs.astype(np.int32)}
+
+
+def transform(co, matrix):
+    matrix = np.asarray(matrix, dtype=np.float64)
+    return np.asarray(co, dtype=np.float64) @ matrix[:3, :3].T + matrix[:3, 3]
+
+
+def face_normals(co, faces):
+    # unit normals of the triangles, counter-clockwise winding
+    v0, v1, v2 = co[faces[:, 0]], co[faces[:, 1]], co[faces[:, 2]]
+    n = np.cross(v1 - v0, v2 - v0)
+    length = np.linalg.norm(n, axis=1, keepdims=True)
+    return n / np.where(length == 0, 1.0, length)
+
+
+def vertex_normals(co, faces):
+    # unit vertex normals, face normals weighted by the corner angles like Blender
+    co = np.asarray(co, dtype=np.float64)
+    tri = co[faces]
+    n = np.cross(tri[:, 1] - tri[:, 0], tri[:, 2] - tri[:, 0])
+    length = np.linalg.norm(n, axis=1, keepdims=True)
+    n /= np.where(length == 0, 1.0, length)
+    normals = np.zeros_like(co)
+    for k in range(3):
+        e1 = tri[:, (k + 1) % 3] - tri[:, k]
+        e2 = tri[:, (k + 2) % 3] - tri[:, k]
+        cos = (e1 * e2).sum(axis=1) / np.maximum(np.linalg.norm(e1, axis=1) * np.linalg.norm(e2, axis=1), 1e-30)
+        np.add.at(normals, faces[:, k], n * np.arccos(np.clip(cos, -1.0, 1.0))[:, None])
+    length = np.linalg.norm(normals, axis=1, keepdims=True)
+    return normals / np.where(length == 0, 1.0, length)
@@ -0,0 +1,180 @@
+'''
+Code for rendering the groundtruths of Doc3D dataset
+https://www3.cs.stonybrook.edu/~cvl/projects/dewarpnet/storage/paper.pdf (ICCV 2019)
+
+This code draws all the random parameters of the samples before rendering,
+outside of Blender, into a plan: a numpy structured array with one row per
+sample (mesh, texture, env map, view transform, env rotation and strength,
+focal length, camera matrix). The draws are the ones render_mesh.py makes,
+in the same order from the same per sample generator (seeding.py), and the
+camera search of randCam runs here against the vertices of the mesh
+(meshcache.py, visibility.py), so the renderer only executes the rows and
+never spends time on rejected cameras. The plan also gives the dataset
+statistics before rendering.
+
+python plan.py <folder-id> <start-mesh> <end-mesh> -c <config> -o plans/<folder-id>.npy
+blender --background --python render_mesh.py -- --plan plans/<folder-id>.npy --rows <start> <end>
+'''
+import os
+import json
+import hashlib
+import argparse
+import functools
+import multiprocessing
+import numpy as np
+
+import objmesh
+import meshcache
+import campose
+import visibility
+import seeding
+
+# tries of randCam
+MAX_CAMERAS = 50
+
+PLAN_DTYPE = np.dtype([
+    ('sample', 'U160'), ('mesh', 'U256'), ('texture', 'U256'), ('env', 'U256'),
+    ('conf', 'U256'), ('out', 'U32'), ('seed', 'u8'),
+    ('view_transform', 'U8'), ('lighting', 'U8'), ('env_rotation', 'f8'), ('env_strength', 'f8'),
+    ('lens', 'f8'), ('cam_matrix', 'f8', (4, 4)), ('cameras_tried', 'i4'), ('visible', '?'),
+])
+
+
+def sample_name(meshpath, texpath, envpath, confpath):
+    # name of the outputs of a sample, see render_mesh.py
+    confHash = hashlib.md5(open(confpath, 'rb').read()).hexdigest()
+    return os.path.split(meshpath)[1][:-4] + '-' + os.path.split(texpath)[1][:-4] \
+        + '-' + os.path.split(envpath)[1][:-4] + '-' + confHash[0:5]
+
+
+def mesh_arrays(objpath, cache_dir=None):
+    # world coordinates and local vertex normals as render_mesh.mesh_arrays reads them
+    mesh = meshcache.read_mesh(objpath, cache_dir)
+    return objmesh.transform(mesh['co'], objmesh.OBJ_AXIS), objmesh.vertex_normals(mesh['co'], mesh['faces'])
+
+
+def search_camera(rng, co, normals, config, batch=10):
+    '''
+    randCam without Blender. Returns lens, the camera matrix of the first
+    visible candidate (the last one tried otherwise), the number of
+    candidates tried and whether one was visible.
+    '''
+    lens, d, campos = campose.sample_camera(rng)
+    state = rng.getstate()
+    tried = 0
+    found = None
+    while tried < MAX_CAMERAS and found is None:
+        mats = campose.sample_candidates(rng, d, campos, min(batch, MAX_CAMERAS - tried))
+        found = visibility.first_visible(co, normals, mats, lens, 36.0,
+                                         config["resolution_x"], config["resolution_y"])
+        tried += len(mats)
+    ntried = MAX_CAMERAS if found is None else tried - len(mats) + found + 1
+    # leave the generator where the one-by-one search would
+    rng.setstate(state)
+    mats = campose.sample_candidates(rng, d, campos, ntried)
+    return lens, mats[-1], ntried, found is not None
+
+
+def plan_row(job, cache_dir=None):
+    '''
+    The parameters of a batch_render.py job, drawn like render_mesh.render_img.
+    '''
+    with open(job['conf'], 'r', encoding='utf-8') as fs:
+        config = json.load(fs)
+    row = np.zeros((), dtype=PLAN_DTYPE)
+    sample = sample_name(job['mesh'], job['texture'], job['env'], job['conf'])
+    seed = seeding.sample_seed(config.get("seed", 0), sample)
+    rng = seeding.sample_rng(config.get("seed", 0), sample)
+    row['sample'] = sample
+    for key in ('mesh', 'texture', 'env', 'conf', 'out'):
+        row[key] = job[key]
+    row['seed'] = seed
+
+    # prepare_scene
+    row['view_transform'] = 'Filmic' if rng.random() > 0.5 else 'Standard'
+    # hdrLighting or pointLight
+    row['lighting'] = config["lighting"]
+    if config["lighting"] == 'hdr':
+        row['env_rotation'] = rng.uniform(0, 6.28)
+        row['env_strength'] = rng.uniform(0.4 * config["hdrStr"], 0.6 * config["hdrStr"])
+    elif config["lighting"] == 'point':
+        rng.uniform(3, 5)
+    # randCam or reset_camera
+    if config["randCam"]:
+        co, normals = mesh_arrays(job['mesh'], cache_dir or config.get("meshCache"))
+        lens, mat, ntried, visible = search_camera(rng, co, normals, config, config.get("camBatch", 10))
+    else:
+        lens = config["camLens"]
+        mat = campose.camera_matrix(campose.euler_matrix(config["camEul"]), config["campos"])
+        ntried, visible = 1, True
+    row['lens'] = lens
+    row['cam_matrix'] = mat
+    row['cameras_tried'] = ntried
+    row['visible'] = visible
+    return row
+
+
+def make_plan(jobs, nproc=1, cache_dir=None):
+    task = functools.partial(plan_row, cache_dir=cache_dir)
+    if nproc > 1:
+        pool = multiprocessing.Pool(processes=nproc)
+        rows = pool.map(task, jobs, chunksize=8)
+        pool.close()
+        pool.join()
+    else:
+        rows = [task(job) for job in jobs]
+    plan = np.zeros(len(rows), dtype=PLAN_DTYPE)
+    for k, row in enumerate(rows):
+        plan[k] = row
+    return plan
+
+
+def load(path):
+    return np.load(path, mmap_mode='r')
+
+
+def statistics(plan):
+    # summary of a plan, before any rendering
+    lines = ['{} samples, {} visible ({:.1f}%)'.format(len(plan), np.count_nonzero(plan['visible']),
+                                                      100. * np.mean(plan['visible']) if len(plan) else 0.)]
+    if len(plan):
+        lines.append('cameras tried per sample: mean {:.2f}, max {}'.format(plan['cameras_tried'].mean(),
+                                                                            plan['cameras_tried'].max()))
+        for name in ('view_transform', 'lighting'):
+            values, counts = np.unique(plan[name], return_counts=True)
+            lines.append('{}: {}'.format(name, ', '.join('{} {}'.format(v, c) for v, c in zip(values, counts))))
+        lens, counts = np.unique(plan['lens'], return_counts=True)
+        lines.append('lens: ' + ', '.join('{:g}mm {}'.format(v, c) for v, c in zip(lens, counts)))
+        dist = np.linalg.norm(plan['cam_matrix'][:, :3, 3], axis=1)
+        lines.append('camera distance: {:.2f} - {:.2f}'.format(dist.min(), dist.max()))
+        lines.append('meshes {}, textures {}, env maps {}'.format(
+            len(np.unique(plan['mesh'])), len(np.unique(plan['texture'])), len(np.unique(plan['env']))))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    import batch_render
+
+    parser = argparse.ArgumentParser(description='Draw the render parameters of the samples')
+    parser.add_argument('folder', help='output folder id')
+    parser.add_argument('id1', type=int, help='first line in objs.csv')
+    parser.add_argument('id2', type=int, help='last line in objs.csv (exclusive)')
+    parser.add_argument('-c', '--conf', help='configuration path', default='conf/config.json')
+    parser.add_argument('-o', '--out', help='plan file, plans/<folder-id>.npy by default')
+    parser.add_argument('--seed', type=int, help='seed of the texture and env map choices', default=0)
+    parser.add_argument('--cache', help='binary mesh cache folder (meshcache.py)', default=None)
+    parser.add_argument('-n', '--nproc', type=int, help='number of processes', default=os.cpu_count())
+    parser.add_argument('--stats', action='store_true', help='only print the statistics of an existing plan')
+    args = parser.parse_args()
+
+    out = args.out or os.path.join('plans', '{}.npy'.format(args.folder))
+    if args.stats:
+        print(statistics(load(out)))
+    else:
+        jobs = batch_render.make_jobs(args.folder, args.id1, args.id2, args.conf, args.seed)
+        plan = make_plan(jobs, args.nproc, args.cache)
+        if os.path.dirname(out) and not os.path.exists(os.path.dirname(out)):
+            os.makedirs(os.path.dirname(out))
+        np.save(out, plan)
+        print(statistics(plan))
+        print('---output:' + os.path.abspath(out) + '---')
@@ -0,0 +1,230 @@
+'''
+Code for rendering the groundtruths of Doc3D dataset
+https://www3.cs.stonybrook.edu/~cvl/projects/dewarpnet/storage/paper.pdf (ICCV 2019)
+
+This code renders the geometric groundtruths (world coordinates, uv,
+normal, depth) of a mesh with a numpy rasterizer, without Blender.
+They do not depend on the lighting, so a z-buffer with perspective correct
+barycentric interpolation at the pixel centers gives the same maps as the
+1 sample Cycles renders of render_mesh.py, render_norm.py and render_dmap.py:
+wc: world coordinates, 0 on the background
+uv: (u, v, 1) like the Cycles uv pass, 0 on the background
+norm: world space face normal facing the camera, 0 on the background
+dmap: distance along the camera axis, 1e10 on the background
+
+python rasterize.py -m <mesh.obj> -c <config.json> -o <folder-id>
+renders with the fixed camera of the config (campos, camEul, camLens).
+python rasterize.py --book <wdh> <r> <k1> <k2> -c <config.json> -o <folder-id>
+renders a generated page (book.py) instead.
+python rasterize.py --record bld/<folder-id>/<sample>.json -o <folder-id>
+renders the page of a rendered sample with its camera, from its scene record
+(scenerecord.py), e.g. to check or replace its Cycles gts.
+The files are named like the ones of the renderers, <fn>-1.exr for wc and
+uv and <fn>0001.exr for norm and dmap.
+'''
+import os
+import json
+import argparse
+import numpy as np
+
+import objmesh
+import meshcache
+import campose
+import visibility
+import book
+import deform
+import scenerecord
+
+# Cycles defaults
+CLIP_START = 0.1
+BACKGROUND_DEPTH = 1e10
+# file suffixes of the gts after the sample name, as render_mesh.py, render_norm.py and render_dmap.py
+SUFFIXES = {'wc': '-1.exr', 'uv': '-1.exr', 'norm': '0001.exr', 'dmap': '0001.exr'}
+
+
+def project(co, cam_matrix, lens, sensor_width, res_x, res_y):
+    # pixel coordinates (x to the right, y down, pixel centers at .5) and depth
+    ndc = visibility.camera_view(co, cam_matrix, lens, sensor_width, res_x, res_y)
+    return ndc[:, 0] * res_x, (1.0 - ndc[:, 1]) * res_y, ndc[:, 2]
+
+
+def rasterize(px, py, z, faces, res_x, res_y, budget=1 << 20):
+    '''
+    Z-buffer the triangles given the projected vertices.
+    Triangles are processed in tiles: all the pixels of the bounding boxes
+    of a group of triangles with similar sizes are tested at once, at most
+    budget pixels per group.
+    Returns the triangle index per pixel (-1 on the background), the
+    perspective correct barycentric coordinates (h, w, 3) and the depth (h, w).
+    '''
+    npix = res_x * res_y
+    best_depth = np.full(npix, np.inf)
+    best_face = np.full(npix, -1, dtype=np.int64)
+    best_bary = np.zeros((npix, 3))
+
+    fx, fy, fz = px[faces], py[faces], z[faces]
+    # drop triangles crossing the near plane
+    keep = np.all(fz > CLIP_START, axis=1)
+    x0 = np.clip(np.ceil(fx.min(axis=1) - 0.5), 0, res_x).astype(np.int64)
+    x1 = np.clip(np.floor(fx.max(axis=1) - 0.5), -1, res_x - 1).astype(np.int64)
+    y0 = np.clip(np.ceil(fy.min(axis=1) - 0.5), 0, res_y).astype(np.int64)
+    y1 = np.clip(np.floor(fy.max(axis=1) - 0.5), -1, res_y - 1).astype(np.int64)
+    keep &= (x1 >= x0) & (y1 >= y0)
+    ids = np.flatnonzero(keep)
+    bw = x1[ids] - x0[ids] + 1
+    bh = y1[ids] - y0[ids] + 1
+    order = np.argsort(bw * bh, kind='stable')
+    ids, bw, bh = ids[order], bw[order], bh[order]
+
+    start = 0
+    while start < len(ids):
+        # the largest group whose padded boxes fit in the budget
+        mw = np.maximum.accumulate(bw[start:])
+        mh = np.maximum.accumulate(bh[start:])
+        cost = np.arange(1, len(mw) + 1) * mw * mh
+        n = max(1, int(np.searchsorted(cost, budget, side='right')))
+        t = ids[start:start + n]
+        mw, mh = mw[n - 1], mh[n - 1]
+        start += n
+
+        gx = x0[t, None, None] + np.arange(mw)[None, None, :]
+        gy = y0[t, None, None] + np.arange(mh)[None, :, None]
+        cx = gx + 0.5
+        cy = gy + 0.5
+        ax, ay = fx[t, 0, None, None], fy[t, 0, None, None]
+        bx, by = fx[t, 1, None, None], fy[t, 1, None, None]
+        qx, qy = fx[t, 2, None, None], fy[t, 2, None, None]
+        denom = (by - qy) * (ax - qx) + (qx - bx) * (ay - qy)
+        denom = np.where(denom == 0, np.nan, denom)
+        w0 = ((by - qy) * (cx - qx) + (qx - bx) * (cy - qy)) / denom
+        w1 = ((qy - ay) * (cx - qx) + (ax - qx) * (cy - qy)) / denom
+        w2 = 1.0 - w0 - w1
+        eps = -1e-9
+        inside = (w0 >= eps) & (w1 >= eps) & (w2 >= eps) \
+            & (gx <= x1[t, None, None]) & (gy <= y1[t, None, None])
+
+        tri, iy, ix = np.nonzero(inside)
+        w = np.stack([w0[tri, iy, ix], w1[tri, iy, ix], w2[tri, iy, ix]], axis=1)
+        # perspective correct interpolation
+        w = w / fz[t[tri]]
+        inv_depth = w.sum(axis=1)
+        depth = 1.0 / inv_depth
+        bary = w * depth[:, None]
+        pix = gy[tri, iy, 0] * res_x + gx[tri, 0, ix]
+
+        # nearest fragment per pixel in this group, then against the z-buffer
+        order = np.lexsort((depth, pix))
+        pix, depth, bary, face = pix[order], depth[order], bary[order], t[tri[order]]
+        first = np.ones(len(pix), dtype=bool)
+        first[1:] = pix[1:] != pix[:-1]
+        pix, depth, bary, face = pix[first], depth[first], bary[first], face[first]
+        closer = depth < best_depth[pix]
+        pix = pix[closer]
+        best_depth[pix] = depth[closer]
+        best_face[pix] = face[closer]
+        best_bary[pix] = bary[closer]
+
+    return (best_face.reshape(res_y, res_x), best_bary.reshape(res_y, res_x, 3),
+            best_depth.reshape(res_y, res_x))
+
+
+def render_gts(mesh, cam_matrix, lens, sensor_width=36.0, res_x=448, res_y=448, mesh_matrix=objmesh.OBJ_AXIS):
+    '''
+    Renders wc, uv, norm and dmap of a mesh (dict of objmesh.read_obj or meshcache.load)
+    for a camera given by its 4x4 matrix_world and focal length.
+    mesh_matrix is the object matrix of the mesh in the Blender scene.
+    Returns a dict of (res_y, res_x, 3) arrays and the (res_y, res_x) dmap.
+    '''
+    co = objmesh.transform(mesh['co'], mesh_matrix)
+    faces = mesh['faces']
+    px, py, z = project(co, cam_matrix, lens, sensor_width, res_x, res_y)
+    face, bary, depth = rasterize(px, py, z, faces, res_x, res_y)
+
+    hit = face >= 0
+    f = face[hit]
+    b = bary[hit][:, :, None]
+    gts = {}
+
+    wc = np.zeros((res_y, res_x, 3), dtype=np.float32)
+    wc[hit] = (co[faces[f]] * b).sum(axis=1)
+    gts['wc'] = wc
+
+    uv = np.zeros((res_y, res_x, 3), dtype=np.float32)
+    if len(mesh['uv']):
+        face_uvs = mesh['face_uvs'][f]
+        tex = mesh['uv'][np.maximum(face_uvs, 0)] * (face_uvs[:, :, None] >= 0)
+        uv[hit, :2] = (tex * b).sum(axis=1)
+        uv[hit, 2] = 1.0
+    gts['uv'] = uv
+
+    # flat shading as imported, flipped towards the camera like Cycles does
+    normals = objmesh.face_normals(co, faces)[f]
+    view = wc[hit] - np.asarray(cam_matrix)[:3, 3]
+    normals *= np.where((normals * view).sum(axis=1) > 0, -1.0, 1.0)[:, None]
+    norm = np.zeros((res_y, res_x, 3), dtype=np.float32)
+    norm[hit] = normals
+    gts['norm'] = norm
+
+    gts['dmap'] = np.where(hit, depth, BACKGROUND_DEPTH).astype(np.float32)
+    return gts
+
+
+def render_record(record, cache_dir=None):
+    # the gts of a scene record of render_mesh.py, with its mesh, camera and resolution
+    if 'book' in record:
+        mesh = book.make_book(*record['book'])
+    elif 'page' in record:
+        mesh = deform.build_page(record['page'])
+    else:
+        mesh = meshcache.read_mesh(record['mesh'], cache_dir)
+    camera = record['camera']
+    render = record['render']
+    return render_gts(mesh, np.array(camera['matrix_world']), camera['lens'], camera['sensor_width'],
+                      res_x=render['resolution_x'] * render['resolution_percentage'] // 100,
+                      res_y=render['resolution_y'] * render['resolution_percentage'] // 100,
+                      mesh_matrix=np.array(record['mesh_matrix']))
+
+
+def save_exr(path, img):
+    os.environ.setdefault('OPENCV_IO_ENABLE_OPENEXR', '1')
+    import cv2
+    if img.ndim == 3:
+        # opencv writes BGR
+        img = img[:, :, ::-1]
+    cv2.imwrite(path, np.ascontiguousarray(img, dtype=np.float32))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rasterize the geometric gts of a mesh')
+    parser.add_argument('-m', '--mesh', help='mesh path', default='obj/1_1.obj')
+    parser.add_argument('-c', '--conf', help='configuration path', default='conf/config.json')
+    parser.add_argument('-o', '--out', help='output folder name', default='1')
+    parser.add_argument('--cache', help='binary mesh cache folder (meshcache.py)', default=None)
+    parser.add_argument('--book', type=float, nargs=4, metavar=('WDH', 'R', 'K1', 'K2'),
+                        help='render a generated page instead of the mesh')
+    parser.add_argument('--record', help='render the sample of a scene record (bld/<folder-id>/<sample>.json)')
+    args = parser.parse_args()
+
+    with open(args.conf, 'r', encoding='utf-8') as fs:
+        config = json.load(fs)
+    cam_matrix = campose.camera_matrix(campose.euler_matrix(config["camEul"]), config["campos"])
+    res_x = config["resolution_x"] * config["resolution_percentage"] // 100
+    res_y = config["resolution_y"] * config["resolution_percentage"] // 100
+
+    if args.record:
+        gts = render_record(scenerecord.load(args.record), args.cache)
+        fn = scenerecord.sample_name(args.record)
+    elif args.book:
+        gts = render_gts(book.make_book(*args.book), cam_matrix, config["camLens"], res_x=res_x, res_y=res_y,
+                         mesh_matrix=book.BOOK_MATRIX)
+        fn = 'book-{:.2f}-{:.2f}-{:.2f}-{:.2f}'.format(*args.book)
+    else:
+        gts = render_gts(meshcache.read_mesh(args.mesh, args.cache), cam_matrix, config["camLens"],
+                         res_x=res_x, res_y=res_y)
+        fn = os.path.split(args.mesh)[1][:-4]
+    for gt, img in gts.items():
+        out_path = './{}/{}/'.format(gt, args.out)
+        if not os.path.exists(out_path):
+            os.makedirs(out_path)
+        save_exr(os.path.join(out_path, fn + SUFFIXES[gt]), img)
+        print("---output:" + os.path.abspath(os.path.join(out_path, fn + SUFFIXES[gt])) + "---")
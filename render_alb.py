@@ -4,6 +4,7 @@ https://www3.cs.stonybrook.edu/~cvl/projects/dewarpnet/storage/paper.pdf (ICCV 2
 
 This code renders the albedo maps using the .blend files 
 saved from render_mesh.py 
+(or the .json scene records, see scenerecord.py)
 
 Written by: Sagnik Das
 Stony Brook University, New York
@@ -20,6 +21,10 @@ import math
 from mathutils import Vector, Euler
 import string
 
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import scenerecord
+import manifest
+
 def select_object(ob):
     bpy.ops.object.select_all(action='DESELECT')
     bpy.context.scene.objects.active = None
@@ -97,12 +102,17 @@ if not os.path.exists(path_to_output_alb):
 with open(blend_list,'r') as b:
     blendlist = list(csv.reader(b))
 
+log = manifest.open_manifest(rridx)
 for bfile in blendlist[strt:end]:
     bfname=bfile[0]
-    fn=bfname.split('/')[-1][:-6]
+    fn=scenerecord.sample_name(bfname)
+    if log.is_done(fn, 'alb'):
+        continue
+    log.start(fn, 'alb')
     #load blend file 
-    bpy.ops.wm.open_mainfile(filepath=bfname)
+    scenerecord.open_sample(bfname)
     prepare_rendersettings()
     prepare_no_env_render()
     get_albedo_img(fn)
     render()
+    log.finish(fn, 'alb')
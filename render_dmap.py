@@ -4,6 +4,7 @@ https://www3.cs.stonybrook.edu/~cvl/projects/dewarpnet/storage/paper.pdf (ICCV 2
 
 This code renders the depth maps using the .blend files 
 saved from render_mesh.py 
+(or the .json scene records, see scenerecord.py)
 
 Written by: Sagnik Das
 Stony Brook University, New York
@@ -19,6 +20,10 @@ import random
 import math
 import string
 
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import scenerecord
+import manifest
+
 
 def select_object(ob):
     bpy.ops.object.select_all(action='DESELECT')
@@ -89,10 +94,15 @@ with open(blend_list,'r') as b:
     blendlist = list(csv.reader(b))
 
 
+log = manifest.open_manifest(rridx)
 for bfile in blendlist[strt:end]:
-    bpy.ops.wm.read_factory_settings()
     bfname=bfile[0]
-    fn=bfname.split('/')[-1][:-6]
-    bpy.ops.wm.open_mainfile(filepath=bfname)
+    fn=scenerecord.sample_name(bfname)
+    if log.is_done(fn, 'dmap'):
+        continue
+    log.start(fn, 'dmap')
+    bpy.ops.wm.read_factory_settings()
+    scenerecord.open_sample(bfname)
     get_depth_map(fn)  
-    render()
\ No newline at end of file
+    render()
+    log.finish(fn, 'dmap')
\ No newline at end of file
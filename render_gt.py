@@ -0,0 +1,164 @@
+'''
+Code for rendering the groundtruths of Doc3D dataset
+https://www3.cs.stonybrook.edu/~cvl/projects/dewarpnet/storage/paper.pdf (ICCV 2019)
+
+This code renders the albedos, normals, depths and checkerboards of the
+.blend files (or .json scene records) saved by render_mesh.py in one pass
+over each file, instead of render_alb.py, render_norm.py, render_dmap.py
+and render_recon.py opening and rendering it once each.
+Albedo and depth are the diffuse color and depth passes of one render
+without lighting, the normal the true normal of render_norm.py as an AOV
+of the same render (one more 1 sample render before Blender 2.92), the
+checkerboard needs its texture and one more 1 sample render. Outputs, names and manifest records are the ones of
+the four scripts, done gts are skipped. The samples come from the
+catalog (catalog.py), or the blend list of blendnames.py without one.
+The "gt" render profile of the config (-c, see render_mesh.apply_render_profile)
+sets the Cycles settings of the renders, --threads the render threads.
+
+blender --background --python render_gt.py -- <folder-id> <start-mesh> <end-mesh> [--gts alb norm dmap recon] [-c conf.json] [--threads n]
+'''
+import os
+import sys
+import time
+import json
+import argparse
+import bpy
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import scenerecord
+import manifest
+import render_mesh
+import catalog
+
+GTS = ('alb', 'norm', 'dmap', 'recon')
+PASS_GTS = ('alb', 'norm', 'dmap')
+TEXPATH = './recon_tex/chess48.png'
+
+
+def output_dirs(folder):
+    return {gt: os.path.abspath('./{}/{}/'.format(gt, folder)) for gt in GTS}
+
+
+def todo_gts(log, sample, gts, dirs):
+    # the requested gts of a sample not done yet
+    todo = []
+    texname = os.path.basename(TEXPATH)[:-4]
+    for gt in gts:
+        state = log.state(sample, gt)
+        if gt == 'recon' and state is None and \
+                os.path.isfile(os.path.join(dirs['recon'], sample + texname + '0001.png')):
+            # rendered before the manifest
+            continue
+        if state != 'done':
+            todo.append(gt)
+    return todo
+
+
+def get_pass_outputs(sample, gts, dirs, mesh):
+    # albedo, normal and depth of the same render, see render_mesh.get_fused_passes
+    scene = bpy.data.scenes['Scene']
+    scene.use_nodes = True
+    tree = scene.node_tree
+    for n in tree.nodes:
+        tree.nodes.remove(n)
+    normal_aov = render_mesh.true_normal_aov(mesh) if 'norm' in gts else None
+    render_layers = tree.nodes.new('CompositorNodeRLayers')
+    view_layer = bpy.context.view_layer
+    view_layer.use_pass_diffuse_color = 'alb' in gts
+    view_layer.use_pass_z = 'dmap' in gts
+    if 'alb' in gts:
+        render_mesh.add_file_output(tree, render_layers.outputs["DiffCol"], dirs['alb'], 'PNG', sample)
+    if 'norm' in gts:
+        render_mesh.add_file_output(tree, render_layers.outputs[normal_aov], dirs['norm'], 'OPEN_EXR', sample)
+    if 'dmap' in gts:
+        render_mesh.add_file_output(tree, render_layers.outputs["Depth"], dirs['dmap'], 'OPEN_EXR', sample)
+
+
+def render_sample(path, gts, dirs, log, samples=None, profile=None, threads=None):
+    '''
+    Opens a sample once and renders its requested gts,
+    samples is the number of samples of the pass render,
+    profile and threads the render profile of the gts.
+    '''
+    sample = scenerecord.sample_name(path)
+    scenerecord.open_sample(path)
+    scene = bpy.data.scenes['Scene']
+    scene.camera = bpy.data.objects['Camera']
+    # the BVH stays for the checkerboard render
+    scene.render.use_persistent_data = True
+    mesh = bpy.data.objects[bpy.data.meshes[0].name]
+    # the albedo keeps the samples of the image (render_alb.py), the other passes need one
+    image_samples = scene.cycles.samples
+    render_mesh.prepare_no_env_render()
+    render_mesh.apply_render_profile(scene, profile or {}, threads)
+
+    # the normal is an AOV of the pass render from Blender 2.92 on
+    has_aovs = hasattr(bpy.context.view_layer, 'aovs')
+    pass_gts = [gt for gt in gts if gt in PASS_GTS and (gt != 'norm' or has_aovs)]
+    if pass_gts:
+        for gt in pass_gts:
+            log.start(sample, gt)
+        scene.cycles.use_square_samples = False
+        scene.cycles.samples = samples or (image_samples if 'alb' in pass_gts else 1)
+        get_pass_outputs(sample, pass_gts, dirs, mesh)
+        bpy.ops.render.render(write_still=False)
+        for gt in pass_gts:
+            log.finish(sample, gt)
+
+    if 'norm' in gts and not has_aovs:
+        # the emission of the true normal, as render_norm.py
+        log.start(sample, 'norm')
+        scene.cycles.use_square_samples = False
+        scene.cycles.samples = 1
+        bpy.context.view_layer.use_pass_diffuse_color = False
+        bpy.context.view_layer.use_pass_z = False
+        render_mesh.color_geometry_material(mesh, 'normColor', 'True Normal')
+        render_mesh.get_worldcoord_img(sample, dirs['norm'])
+        bpy.ops.render.render(write_still=False)
+        log.finish(sample, 'norm')
+
+    if 'recon' in gts:
+        log.start(sample, 'recon')
+        scene.cycles.use_square_samples = False
+        scene.cycles.samples = 1
+        view_layer = bpy.context.view_layer
+        view_layer.use_pass_z = False
+        render_mesh.select_object(mesh)
+        render_mesh.page_texturing(mesh, TEXPATH)
+        render_mesh.get_albedo_img(sample + os.path.basename(TEXPATH)[:-4], dirs['recon'])
+        bpy.ops.render.render(write_still=False)
+        log.finish(sample, 'recon')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Render the gts of the saved samples')
+    parser.add_argument('folder', help='output folder id')
+    parser.add_argument('id1', type=int, help='first sample in the catalog (or the blend list)')
+    parser.add_argument('id2', type=int, help='last sample in the catalog (or the blend list), exclusive')
+    parser.add_argument('--gts', nargs='+', choices=GTS, default=list(GTS))
+    parser.add_argument('--samples', type=int, help='samples of the pass render, by default the ones of the image '
+                                                    'with the albedo and 1 without')
+    parser.add_argument('-c', '--conf', help='configuration with the "gt" render profile')
+    parser.add_argument('--threads', type=int, help='render threads, 0 for all the cores')
+    args = parser.parse_args(sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else sys.argv[1:])
+
+    blendlist = catalog.work_list(args.folder)
+    dirs = output_dirs(args.folder)
+    for gt in args.gts:
+        if not os.path.exists(dirs[gt]):
+            os.makedirs(dirs[gt])
+
+    profile = {}
+    if args.conf:
+        with open(args.conf, 'r', encoding='utf-8') as fs:
+            profile = json.load(fs).get("renderProfiles", {}).get("gt", {})
+
+    log = manifest.open_manifest(args.folder)
+    for path in blendlist[args.id1:args.id2]:
+        sample = scenerecord.sample_name(path)
+        gts = todo_gts(log, sample, args.gts, dirs)
+        if not gts:
+            continue
+        start = time.time()
+        render_sample(path, gts, dirs, log, args.samples, profile, args.threads)
+        print('{} {} {:.1f}s'.format(sample, ' '.join(gts), time.time() - start))
@@ -6,6 +6,13 @@ This code renders the gts needed for the DewarpNet training (image, uv, 3D coord
 and saves the .blend files. The .blend files can be later used 
 to render other gts (normal, depth, checkerboard, albedo). 
 Each .blend file takes ~2.5MB set the save_blend_file flag to False if you don't need.
+The saveSceneRecord flag saves a small .json of the sample parameters instead,
+the other renderers can rebuild the scene from it (see scenerecord.py).
+The random parameters of a sample are drawn from a generator seeded with
+the "seed" of the config and the sample name (see seeding.py).
+With "warmScene" the samples of the same mesh and config in one Blender
+session keep the page object, its material and the world nodes, only the
+images, env mapping, light and camera change (see warm_reset).
 
 Written by: Sagnik Das and Ke Ma
 Stony Brook University, New York
@@ -15,22 +22,90 @@ Updated for blender 2.8 by Jiang Xudong
 HKUST
 July 2020
 '''
+import re
 import glob
 import json
 import sys
 import csv
 import bpy
-import bmesh
 import random
 import math
-from mathutils import Vector, Euler
+from mathutils import Vector, Euler, Matrix
 import os
 import string
-from bpy_extras.object_utils import world_to_camera_view
 import argparse
-import hashlib
+import atexit
+import numpy as np
 from bpy import ops,context
 
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import visibility
+import campose
+import scenerecord
+import assetcache
+import meshcache
+import shards
+import manifest
+import seeding
+import plan
+import telemetry
+import book
+import deform
+import catalog
+
+# parameters of the sample being rendered, saved by scenerecord
+scene_record = {}
+# assets kept across samples when "assetCache" is set, see assetcache.py
+asset_cache = None
+world_defaults = None
+render_defaults = None
+# cycles settings of the image render set from the config, when the Blender version has them
+SAMPLING_SETTINGS = ('use_adaptive_sampling', 'adaptive_threshold', 'adaptive_min_samples',
+                     'use_denoising', 'denoiser', 'time_limit')
+# AOV of the true normal of the page, the normal gt of the fused passes and render_gt.py
+TRUE_NORMAL_AOV = 'true_normal'
+# the page object, its material and the world nodes kept with "warmScene", see warm_reset
+warm = None
+# final states of samples that are not rendered, the same again with the same seed
+FINAL_FAILURES = ('out of view', 'bad texture')
+# "Sample <n>/<total>" of the last render, from the render stats
+samples_reached = None
+# GPU compute device type found once per process with "device": "GPU", '' without a GPU
+compute_device = None
+# keys of the render profiles of the config -> (scene.render or scene.cycles, setting),
+# see apply_render_profile
+PROFILE_SETTINGS = {
+    "maxBounces": ('cycles', 'max_bounces'),
+    "diffuseBounces": ('cycles', 'diffuse_bounces'),
+    "glossyBounces": ('cycles', 'glossy_bounces'),
+    "transmissionBounces": ('cycles', 'transmission_bounces'),
+    "transparentBounces": ('cycles', 'transparent_max_bounces'),
+    "volumeBounces": ('cycles', 'volume_bounces'),
+    "causticsReflective": ('cycles', 'caustics_reflective'),
+    "causticsRefractive": ('cycles', 'caustics_refractive'),
+    "blurGlossy": ('cycles', 'blur_glossy'),
+    "persistentData": ('render', 'use_persistent_data'),
+    "bvhType": ('cycles', 'debug_bvh_type'),
+    "spatialSplits": ('cycles', 'debug_use_spatial_splits'),
+    "simplify": ('render', 'use_simplify'),
+    "simplifySubdivision": ('render', 'simplify_subdivision_render'),
+    "textureLimit": ('cycles', 'texture_limit_render'),
+}
+# settings of the render profiles outside PROFILE_SETTINGS
+PROFILE_EXTRA_SETTINGS = (('cycles', 'caustics_reflective'), ('cycles', 'caustics_refractive'),
+                          ('cycles', 'use_auto_tile'), ('cycles', 'tile_size'), ('render', 'tile_x'),
+                          ('render', 'tile_y'), ('render', 'threads_mode'), ('render', 'threads'))
+
+# shards of the samples when "shards" is set, see shards.py
+shard_writer = None
+packed_samples = {}
+# random numbers of the sample being rendered, see seeding.py
+rng = random.Random()
+seed = None
+# row of a plan being rendered, its parameters replace the random draws (see plan.py)
+plan_row = None
+plans = {}
+
 
 
 def reset_blend():
@@ -48,35 +123,16 @@ def reset_blend():
             bpy_data_iter.remove(id_data, do_unlink=True)
 
 
-def isVisible(mesh, cam):
-    bm = bmesh.new()  # create an empty BMesh
-    bm.from_mesh(mesh.data)
-    cam_direction = cam.matrix_world.to_quaternion() @ Vector((0.0, 0.0, -1.0))
-    cam_pos = cam.location
-    # print(cam_direction)
-    mat_world = mesh.matrix_world
-    ct1 = 0
-    ct2 = 0
-    for v in bm.verts:
-        co_ndc = world_to_camera_view(bpy.context.scene, cam, mat_world @ v.co)
-        nm_ndc = cam_direction.angle(v.normal)
-        # v1 = v.co - cam_pos
-        # nm_ndc = v1.angle(v.normal)
-        if (co_ndc.x < 0.03 or co_ndc.x > 0.97 or co_ndc.y < 0.03 or co_ndc.y > 0.97):
-            bm.free()
-            print('out of view')
-            return False
-        # normal may be in two directions
-        if nm_ndc < math.radians(120):
-            ct1 += 1
-        if nm_ndc > math.radians(60):
-            ct2 += 1
-    if min(ct1, ct2) / 1000000. > 0.03:
-        bm.free()
-        print('ct1: {}, ct2: {}\n'.format(ct1, ct2))
-        return False
-    bm.free()
-    return True
+def mesh_arrays(mesh):
+    # world coordinates and local normals of the vertices, read once per mesh
+    verts = mesh.data.vertices
+    co = np.empty(len(verts) * 3, dtype=np.float32)
+    normals = np.empty(len(verts) * 3, dtype=np.float32)
+    verts.foreach_get('co', co)
+    verts.foreach_get('normal', normals)
+    mat_world = np.array(mesh.matrix_world)
+    co = co.reshape(-1, 3) @ mat_world[:3, :3].T + mat_world[:3, 3]
+    return co, normals.reshape(-1, 3)
 
 
 def select_object(ob):
@@ -86,41 +142,332 @@ def select_object(ob):
     bpy.context.view_layer.objects.active = ob
 
 
-def prepare_scene():
+def reset_scene():
+    '''
+    Resets the per sample state (objects, lights, materials, world,
+    compositor) but keeps the assets of the cache, replaces reset_blend
+    when the asset cache is on.
+    '''
+    scene = bpy.data.scenes['Scene']
+    for obj in list(bpy.data.objects):
+        if obj.name != 'Camera':
+            bpy.data.objects.remove(obj, do_unlink=True)
+    cached_meshes = asset_cache.cached('mesh')
+    for mesh in list(bpy.data.meshes):
+        if mesh.name in cached_meshes:
+            mesh.materials.clear()
+        else:
+            bpy.data.meshes.remove(mesh, do_unlink=True)
+    cached_images = asset_cache.cached('image')
+    for image in list(bpy.data.images):
+        if image.name not in cached_images:
+            bpy.data.images.remove(image, do_unlink=True)
+    for bpy_data_iter in (
+            bpy.data.lights,
+            bpy.data.materials,
+            bpy.data.curves
+    ):
+        for id_data in list(bpy_data_iter):
+            bpy_data_iter.remove(id_data, do_unlink=True)
+
+    # factory world background
+    world = bpy.data.worlds['World']
+    world.use_nodes = True
+    wnodes = world.node_tree.nodes
+    for node in list(wnodes):
+        if node.type not in ['OUTPUT_WORLD', 'BACKGROUND']:
+            wnodes.remove(node)
+    bg_node = wnodes['Background']
+    bg_node.inputs[0].default_value = world_defaults[0]
+    bg_node.inputs[1].default_value = world_defaults[1]
+    out_node = [node for node in wnodes if node.type == 'OUTPUT_WORLD'][0]
+    world.node_tree.links.new(bg_node.outputs[0], out_node.inputs[0])
+    reset_outputs(scene)
+
+
+def warm_reset():
+    '''
+    Resets the per sample state but keeps the page object, its material
+    and the world nodes of the previous sample, replaces reset_scene and
+    reset_blend for the samples of the same mesh with "warmScene".
+    The sample then only swaps the images (warm_texturing, hdrLighting),
+    the env mapping, the light and the camera, so that Cycles with
+    persistent data reuses the rest.
+    '''
+    scene = bpy.data.scenes['Scene']
+    for obj in list(bpy.data.objects):
+        if obj.name not in ('Camera', warm['object']):
+            bpy.data.objects.remove(obj, do_unlink=True)
+    for lamp in list(bpy.data.lights):
+        bpy.data.lights.remove(lamp, do_unlink=True)
+    # the checkerboard and world coordinate materials of the other gts
+    for mat in list(bpy.data.materials):
+        if mat.name != warm['material']:
+            bpy.data.materials.remove(mat, do_unlink=True)
+    # images and meshes nothing uses anymore, the cached ones have a fake user
+    for bpy_data_iter in (bpy.data.images, bpy.data.meshes):
+        for id_data in list(bpy_data_iter):
+            if id_data.users == 0:
+                bpy_data_iter.remove(id_data)
+    # the world output, unlinked by prepare_no_env_render
+    world = bpy.data.worlds['World']
+    wnodes = world.node_tree.nodes
+    out_node = [node for node in wnodes if node.type == 'OUTPUT_WORLD'][0]
+    world.node_tree.links.new(wnodes['Background'].outputs[0], out_node.inputs[0])
+    reset_outputs(scene)
+
+
+def reset_outputs(scene):
+    # render settings of the last sample, compositor and passes
+    owners = {'render': scene.render, 'cycles': scene.cycles}
+    for (owner, setting), value in render_defaults.items():
+        # turning persistent data off frees it, a changed setting makes Cycles sync again
+        if (owner, setting) == ('render', 'use_persistent_data') and config.get("warmScene"):
+            continue
+        if getattr(owners[owner], setting) != value:
+            setattr(owners[owner], setting, value)
+    if scene.node_tree is not None:
+        for n in list(scene.node_tree.nodes):
+            scene.node_tree.nodes.remove(n)
+    view_layer = bpy.context.view_layer
+    for p in ('use_pass_uv', 'use_pass_z', 'use_pass_normal', 'use_pass_diffuse_color', 'use_pass_position'):
+        if hasattr(view_layer, p):
+            setattr(view_layer, p, False)
+    scene.cursor.location = (0.0, 0.0, 0.0)
+
+
+def factory_reset():
+    # reset_blend, keeping the defaults reset_scene and warm_reset go back to
+    global world_defaults, render_defaults
     reset_blend()
+    bg_node = bpy.data.worlds['World'].node_tree.nodes['Background']
+    world_defaults = (tuple(bg_node.inputs[0].default_value), bg_node.inputs[1].default_value)
+    scene = bpy.data.scenes['Scene']
+    owners = {'render': scene.render, 'cycles': scene.cycles}
+    settings = [('cycles', k) for k in SAMPLING_SETTINGS] + list(PROFILE_SETTINGS.values()) + \
+        list(PROFILE_EXTRA_SETTINGS)
+    render_defaults = {(owner, setting): getattr(owners[owner], setting) for owner, setting in settings
+                       if hasattr(owners[owner], setting)}
+
+
+def warm_key(objpath):
+    # the samples that can keep the scene of the previous one: same config and mesh (or generator)
+    if not config.get("warmScene"):
+        return None
+    return json.dumps(config, sort_keys=True), 'generate' if args.generate else os.path.abspath(objpath)
+
+
+def keep_warm(key, obj):
+    global warm
+    if key is not None:
+        warm = {'key': key, 'object': obj.name, 'material': obj.material_slots[0].material.name}
+
+
+def prepare_scene(key=None):
+    global asset_cache, warm
+    if warm is not None and warm['key'] == key:
+        warm_reset()
+        if asset_cache is not None:
+            asset_cache.begin_sample()
+    elif config.get("assetCache"):
+        warm = None
+        if asset_cache is None:
+            factory_reset()
+            asset_cache = assetcache.AssetCache(config["assetCache"]["budgetMB"])
+        else:
+            reset_scene()
+        asset_cache.begin_sample()
+    else:
+        warm = None
+        factory_reset()
 
     scene = bpy.data.scenes['Scene']
+    if config.get("warmScene"):
+        # Cycles keeps the BVH and the shaders of the unchanged objects between the renders
+        scene.render.use_persistent_data = True
     scene.render.engine = 'CYCLES'
     scene.cycles.samples = config["numSamples"]
     scene.cycles.use_square_samples = False
     scene.display_settings.display_device = 'sRGB'
-    if random.random() > 0.5:
+    if plan_row is not None:
+        bpy.data.scenes['Scene'].view_settings.view_transform = str(plan_row['view_transform'])
+    elif rng.random() > 0.5:
         bpy.data.scenes['Scene'].view_settings.view_transform = 'Filmic'
     else:
         bpy.data.scenes['Scene'].view_settings.view_transform = 'Standard'
 
+    scene_record.clear()
+    scene_record['seed'] = seed
+    scene_record['view_transform'] = scene.view_settings.view_transform
+    scene_record['render'] = {'samples': config["numSamples"], 'resolution_x': config["resolution_x"],
+                              'resolution_y': config["resolution_y"],
+                              'resolution_percentage': config["resolution_percentage"]}
+    prepare_sampling(scene)
+
+
+def prepare_sampling(scene):
+    '''
+    Adaptive sampling ("noiseThreshold", "minSamples"), denoising ("denoiser",
+    e.g. OPENIMAGEDENOISE, runs on the CPU) and time limit per image
+    ("timeLimit", seconds) of the image render. Settings the Blender
+    version does not have are skipped, the rest goes to the scene record.
+    '''
+    global samples_reached
+    cycles = scene.cycles
+    quality = {}
+    if config.get("noiseThreshold") and hasattr(cycles, 'use_adaptive_sampling'):
+        cycles.use_adaptive_sampling = True
+        cycles.adaptive_threshold = config["noiseThreshold"]
+        cycles.adaptive_min_samples = config.get("minSamples", 0)
+        quality['noise_threshold'] = config["noiseThreshold"]
+    if "denoiser" in config:
+        if hasattr(cycles, 'use_denoising'):
+            cycles.use_denoising = bool(config["denoiser"])
+            if config["denoiser"]:
+                cycles.denoiser = config["denoiser"]
+        else:
+            # before 2.90, only the denoiser of the view layer
+            bpy.context.view_layer.cycles.use_denoising = bool(config["denoiser"])
+        quality['denoiser'] = config["denoiser"]
+    if config.get("timeLimit") and hasattr(cycles, 'time_limit'):
+        cycles.time_limit = config["timeLimit"]
+        quality['time_limit'] = config["timeLimit"]
+    scene_record['render'].update(quality)
+    samples_reached = None
+    if render_stats not in bpy.app.handlers.render_stats:
+        bpy.app.handlers.render_stats.append(render_stats)
+
+
+def render_stats(*args):
+    # the stats line of a background render, keeps the sample count it reached
+    global samples_reached
+    for arg in args:
+        if isinstance(arg, str):
+            match = re.search(r'Sample (\d+)/(\d+)', arg)
+            if match:
+                samples_reached = int(match.group(1))
+
+
+def find_compute_device(cprefs):
+    # the builds accept a device type without any device of it, the first type with one
+    for compute_device_type in ('CUDA', 'OPENCL'):
+        try:
+            cprefs.compute_device_type = compute_device_type
+        except TypeError:
+            continue
+        cprefs.get_devices()
+        if any(device.type == compute_device_type for device in cprefs.devices):
+            return compute_device_type
+    # Cycles would fall back to the CPU without saying it
+    print("no GPU found, rendering on the CPU")
+    return ''
+
 
 def prepare_rendersettings():
+    global compute_device
     bpy.ops.object.select_all(action='DESELECT')  # ...
     bpy.data.scenes['Scene'].cycles.device = config["device"]
     if config["device"]=="GPU" :
         cprefs = bpy.context.preferences.addons['cycles'].preferences
-        print("previous compute device is "+cprefs.compute_device_type)
-		# Attempt to set GPU device types if available
-        for compute_device_type in ('CUDA', 'OPENCL', 'NONE'):
-            try:
-                cprefs.compute_device_type = compute_device_type
-                print("compute device is "+cprefs.compute_device_type)
-                break
-            except TypeError:
-                pass
-
-		#Enable all CPU and GPU devices
-        for device in cprefs.devices:
-            device.use = True
+		# Attempt to set GPU device types if available, once per process
+        if compute_device is None:
+            print("previous compute device is "+cprefs.compute_device_type)
+            compute_device = find_compute_device(cprefs)
+            print("compute device is "+(compute_device or 'CPU'))
+        if not compute_device:
+            bpy.data.scenes['Scene'].cycles.device = 'CPU'
+        else:
+            if cprefs.compute_device_type != compute_device:
+                # the factory reset of a sample resets the preferences too
+                cprefs.compute_device_type = compute_device
+                cprefs.get_devices()
+
+			#Enable all CPU and GPU devices
+            for device in cprefs.devices:
+                device.use = True
     bpy.data.scenes['Scene'].render.resolution_x = config["resolution_x"]
     bpy.data.scenes['Scene'].render.resolution_y = config["resolution_y"]
     bpy.data.scenes['Scene'].render.resolution_percentage = config["resolution_percentage"]
+    use_render_profile('image')
+
+
+def apply_render_profile(scene, profile, threads=None):
+    '''
+    Sets the Cycles settings of a render profile (a dict of the config, keys
+    of PROFILE_SETTINGS, "caustics", "tileSize", "threads"). threads overrides
+    the one of the profile, 0 lets Blender use all the cores. Settings the
+    Blender version does not have are skipped.
+    '''
+    owners = {'render': scene.render, 'cycles': scene.cycles}
+    for key, value in profile.items():
+        if key in PROFILE_SETTINGS:
+            owner, setting = PROFILE_SETTINGS[key]
+            if hasattr(owners[owner], setting):
+                setattr(owners[owner], setting, value)
+        elif key == "caustics":
+            scene.cycles.caustics_reflective = value
+            scene.cycles.caustics_refractive = value
+        elif key == "tileSize":
+            if hasattr(scene.cycles, 'tile_size'):
+                # Blender 3.0
+                scene.cycles.use_auto_tile = True
+                scene.cycles.tile_size = value
+            else:
+                scene.render.tile_x = value
+                scene.render.tile_y = value
+    if threads is None:
+        threads = profile.get("threads")
+    if threads is not None:
+        scene.render.threads_mode = 'FIXED' if threads > 0 else 'AUTO'
+        if threads > 0:
+            scene.render.threads = threads
+
+
+def use_render_profile(name):
+    # "image" for the photoreal render, "gt" for the 1 sample renders of the gts
+    apply_render_profile(bpy.data.scenes['Scene'], config.get("renderProfiles", {}).get(name, {}),
+                         getattr(args, 'threads', None) or None)
+
+
+def load_image(path):
+    if asset_cache is not None:
+        return asset_cache.image(path)
+    return bpy.data.images.load(os.path.abspath(path))
+
+
+def swap_image(node, path):
+    # a new image in an image node, the previous one removed when nothing else uses it
+    old = node.image
+    node.image = load_image(path)
+    if old is not None and old != node.image and old.users == 0:
+        bpy.data.images.remove(old)
+
+
+def import_mesh(objpath):
+    # a new object of an .obj mesh, built from the binary mesh cache when there is one
+    cache_dir = config.get("meshCache")
+    if cache_dir and meshcache.is_cached(objpath, cache_dir):
+        return meshcache.to_blender(meshcache.load(meshcache.cache_path(objpath, cache_dir)),
+                                    os.path.splitext(os.path.basename(objpath))[0])
+    bpy.ops.object.select_all(action='DESELECT')
+    bpy.ops.import_scene.obj(filepath=os.path.abspath(objpath))
+    return bpy.context.selected_objects[0]
+
+
+def load_mesh(objpath):
+    # the object of an .obj mesh, imported or from the asset cache
+    if asset_cache is None:
+        return import_mesh(objpath)
+    hit = asset_cache.get('mesh', objpath)
+    if hit is None:
+        obj = import_mesh(objpath)
+        asset_cache.put('mesh', objpath, obj.data, assetcache.mesh_size(obj.data), obj.matrix_world.copy())
+        return obj
+    data, matrix = hit
+    obj = bpy.data.objects.new(data.name, data)
+    bpy.context.scene.collection.objects.link(obj)
+    obj.matrix_world = matrix
+    return obj
 
 
 def position_object(mesh_name):
@@ -141,24 +488,38 @@ def hdrLighting(envp, envstr):
     bg_node = wnodes['Background']
     # hdr lighting
 
-    # remove old node
-    for node in wnodes:
-        if node.type in ['OUTPUT_WORLD', 'BACKGROUND']:
-            continue
-        else:
-            wnodes.remove(node)
+    if warm is None:
+        # remove old node
+        for node in wnodes:
+            if node.type in ['OUTPUT_WORLD', 'BACKGROUND']:
+                continue
+            else:
+                wnodes.remove(node)
 
-    # hdr world lighting
+        # hdr world lighting
 
-    texcoord = wnodes.new(type='ShaderNodeTexCoord')
-    mapping = wnodes.new(type='ShaderNodeMapping')
-    mapping.inputs["Rotation"].default_value = (0.0, 0.0, random.uniform(0, 6.28))
+        texcoord = wnodes.new(type='ShaderNodeTexCoord')
+        mapping = wnodes.new(type='ShaderNodeMapping')
+        envnode = wnodes.new(type='ShaderNodeTexEnvironment')
+    else:
+        # the nodes of the previous sample, unlinked by prepare_no_env_render
+        texcoord, mapping, envnode = [[node for node in wnodes if node.type == t][0]
+                                      for t in ('TEX_COORD', 'MAPPING', 'TEX_ENVIRONMENT')]
+    if plan_row is not None:
+        rotation = float(plan_row['env_rotation'])
+    else:
+        rotation = rng.uniform(0, 6.28)
+    mapping.inputs["Rotation"].default_value = (0.0, 0.0, rotation)
     wlinks.new(texcoord.outputs[0], mapping.inputs[0])
-    envnode = wnodes.new(type='ShaderNodeTexEnvironment')
     wlinks.new(mapping.outputs[0], envnode.inputs[0])
-    envnode.image = bpy.data.images.load(os.path.abspath(envp))
-    bg_node.inputs[1].default_value = random.uniform(0.4 * envstr, 0.6 * envstr)
+    swap_image(envnode, envp)
+    if plan_row is not None:
+        strength = float(plan_row['env_strength'])
+    else:
+        strength = rng.uniform(0.4 * envstr, 0.6 * envstr)
+    bg_node.inputs[1].default_value = strength
     wlinks.new(envnode.outputs[0], bg_node.inputs[0])
+    scene_record['env'] = {'path': os.path.abspath(envp), 'rotation': rotation, 'strength': strength}
 
 def pointLight():
     world = bpy.data.worlds['World']
@@ -167,7 +528,7 @@ def pointLight():
     bg_node = wnodes['Background']
     bg_node.inputs[1].default_value = 0
 
-    d = random.uniform(3, 5)
+    d = rng.uniform(3, 5)
     litpos = Vector(config["litpos"])
     eul = Euler((0, 0, 0), 'XYZ')
     eul.rotate_axis('Z', config["litEulerZ"])
@@ -191,6 +552,7 @@ def pointLight():
     color_temp = config["litColorTemp"]
     bbody.inputs[0].default_value = color_temp
     links.new(bbody.outputs[0], lamp_node.inputs[0])
+    scene_record['light'] = {'location': list(litpos), 'strength': strngth, 'color_temp': color_temp}
 
 
     ## Area Lighting
@@ -240,42 +602,39 @@ def pointLight():
 def randCam(mesh):
     bpy.ops.object.select_all(action='DESELECT')
     camera = bpy.data.objects['Camera']
-
-    # sample camera config until find a valid one
+    if plan_row is not None:
+        return plan_camera(camera)
+
+    # focal length and cam position
+    lens, d, campos = campose.sample_camera(rng)
+    bpy.data.cameras['Camera'].lens = lens
+    camera.location = Vector(campos)
+    co, normals = mesh_arrays(mesh)
+    render = bpy.context.scene.render
+
+    # sample camera config until find a valid one,
+    # scoring a batch of look-at/roll candidates at a time
+    state = rng.getstate()
+    batch = config.get("camBatch", 10)
     id = 0
-    vid = False
-    # focal length
-    bpy.data.cameras['Camera'].lens = random.randint(25, 35)
-    # cam position
-    d = random.uniform(2.3, 3.3)
-    campos = Vector((0, d, 0))
-    eul = Euler((0, 0, 0), 'XYZ')
-    eul.rotate_axis('Z', random.uniform(0, 3.1415))
-    eul.rotate_axis('X', random.uniform(math.radians(60), math.radians(120)))
-
-    campos.rotate(eul)
-    camera.location = campos
-
-    while id < 50:
-        # look at pos
-        st = (d - 2.3) / 1.0 * 0.2 + 0.3
-        lookat = Vector((random.uniform(-st, st), random.uniform(-st, st), 0))
-        eul = Euler((0, 0, 0), 'XYZ')
-
-        eul.rotate_axis('X', math.atan2(lookat.y - campos.y, campos.z))
-        eul.rotate_axis('Y', math.atan2(campos.x - lookat.x, campos.z))
-        st = (d - 2.3) / 1.0 * 15 + 5.
-        eul.rotate_axis('Z', random.uniform(math.radians(-90 - st), math.radians(-90 + st)))
-
-        camera.rotation_euler = eul
-        bpy.context.view_layer.update()
-
-        if isVisible(mesh, camera):
-            vid = True
-            break
-
-        id += 1
-    return vid
+    found = None
+    while id < 50 and found is None:
+        mats = campose.sample_candidates(rng, d, campos, min(batch, 50 - id))
+        found = visibility.first_visible(co, normals, mats, lens, camera.data.sensor_width,
+                                         render.resolution_x, render.resolution_y)
+        id += len(mats)
+    ntried = 50 if found is None else id - len(mats) + found + 1
+    telemetry.record('cameras_tried', ntried)
+
+    # only consume the random numbers of the candidates a one-by-one search would have tried
+    rng.setstate(state)
+    mats = campose.sample_candidates(rng, d, campos, ntried)
+    if found is None:
+        return False
+    camera.rotation_euler = Matrix(mats[-1][:3, :3].tolist()).to_euler('XYZ')
+    bpy.context.view_layer.update()
+    record_camera(camera)
+    return True
 
 def reset_camera(mesh):
     bpy.ops.object.select_all(action='DESELECT')
@@ -314,11 +673,34 @@ def reset_camera(mesh):
     #         break
     #
     #     id += 1
+    bpy.context.view_layer.update()
+    record_camera(camera)
     return True
 
+
+def plan_camera(camera):
+    # the camera the plan found, searched without Blender
+    mat = np.asarray(plan_row['cam_matrix'])
+    telemetry.record('cameras_tried', int(plan_row['cameras_tried']))
+    bpy.data.cameras['Camera'].lens = float(plan_row['lens'])
+    camera.location = Vector(mat[:3, 3].tolist())
+    camera.rotation_euler = Matrix(mat[:3, :3].tolist()).to_euler('XYZ')
+    bpy.context.view_layer.update()
+    record_camera(camera)
+    return bool(plan_row['visible'])
+
+
+def record_camera(camera):
+    scene_record['camera'] = {'lens': camera.data.lens, 'sensor_width': camera.data.sensor_width,
+                              'location': list(camera.location), 'rotation_euler': list(camera.rotation_euler),
+                              'matrix_world': [list(row) for row in camera.matrix_world]}
+
+
 def page_texturing(obj, texpath):
     bpy.ops.object.mode_set(mode="OBJECT")
-    bpy.ops.object.material_slot_add()
+    # the material replaces the one of the first slot
+    if not obj.material_slots:
+        bpy.ops.object.material_slot_add()
     mat = bpy.data.materials.new('Material.001')
     mat.use_nodes = True
     obj.material_slots[0].material = mat
@@ -330,7 +712,7 @@ def page_texturing(obj, texpath):
     bsdf_node = nodes.new(type='ShaderNodeBsdfDiffuse')
     texture_node = nodes.new(type='ShaderNodeTexImage')
 
-    texture_node.image = bpy.data.images.load(os.path.abspath(texpath) )
+    texture_node.image = load_image(texpath)
 
     links = mat.node_tree.links
     links.new(bsdf_node.outputs[0], out_node.inputs[0])
@@ -342,6 +724,15 @@ def page_texturing(obj, texpath):
     links.new(texture_node.inputs[0], texturecoord_node.outputs[2])
 
 
+def warm_texturing(obj, texpath):
+    # the material of the previous sample with the new texture image
+    mat = bpy.data.materials[warm['material']]
+    if not obj.material_slots:
+        bpy.ops.object.material_slot_add()
+    obj.material_slots[0].material = mat
+    swap_image([node for node in mat.node_tree.nodes if node.type == 'TEX_IMAGE'][0], texpath)
+
+
 # def get_image(objpath, texpath):
 #     bpy.context.scene.use_nodes = True
 #     tree = bpy.context.scene.node_tree
@@ -368,6 +759,11 @@ def page_texturing(obj, texpath):
 
 
 def color_wc_material(obj, mat_name):
+    color_geometry_material(obj, mat_name, 'Position')
+
+
+def color_geometry_material(obj, mat_name, output):
+    # emission of an output of the geometry node, Position (world coordinates) or True Normal
     # Remove lamp
     for lamp in bpy.data.lights:
         bpy.data.lights.remove(lamp, do_unlink=True)
@@ -394,11 +790,11 @@ def color_wc_material(obj, mat_name):
     # Connect each other
     tree = mat.node_tree
     links = tree.links
-    links.new(geo_node.outputs[0], em_node.inputs[0])
+    links.new(geo_node.outputs[output], em_node.inputs[0])
     links.new(em_node.outputs[0], mat_node.inputs[0])
 
 
-def get_albedo_img(img_name):
+def get_albedo_img(img_name, out_path=None):
     scene=bpy.data.scenes['Scene']
     bpy.context.view_layer.use_pass_diffuse_color = True
     bpy.context.scene.use_nodes = True
@@ -415,7 +811,8 @@ def get_albedo_img(img_name):
     comp_node = tree.nodes.new('CompositorNodeComposite')
 
     # file_output_node_0.format.file_format = 'OPEN_EXR'
-    out_path=path_to_output_alb
+    if out_path is None:
+        out_path=path_to_output_alb
     if not os.path.exists(out_path):
         os.makedirs(out_path)
     
@@ -425,7 +822,7 @@ def get_albedo_img(img_name):
     links.new(render_layers.outputs["DiffCol"], comp_node.inputs[0])
 
 
-def get_worldcoord_img(img_name):
+def get_worldcoord_img(img_name, out_path=None):
     bpy.context.scene.use_nodes = True
     tree = bpy.context.scene.node_tree
     links = tree.links
@@ -439,7 +836,11 @@ def get_worldcoord_img(img_name):
 
     file_output_node_0 = tree.nodes.new("CompositorNodeOutputFile")
     file_output_node_0.format.file_format = 'OPEN_EXR'
-    file_output_node_0.base_path = path_to_output_wc
+    if out_path is None:
+        out_path = path_to_output_wc
+    if not os.path.exists(out_path):
+        os.makedirs(out_path)
+    file_output_node_0.base_path = out_path
     file_output_node_0.file_slots[0].path = img_name
 
     links.new(render_layers.outputs[0], file_output_node_0.inputs[0])
@@ -461,8 +862,111 @@ def prepare_no_env_render():
     scene.cycles.samples = 1
     scene.cycles.use_square_samples = True
     scene.view_settings.view_transform = 'Standard'
+    # the 1 sample gts are exact, denoising would only blur the world coordinates
+    if hasattr(scene.cycles, 'use_denoising'):
+        scene.cycles.use_denoising = False
+    else:
+        bpy.context.view_layer.cycles.use_denoising = False
+
+
+
+
+def add_file_output(tree, socket, out_path, file_format, img_name):
+    if not os.path.exists(out_path):
+        os.makedirs(out_path)
+    file_output_node = tree.nodes.new('CompositorNodeOutputFile')
+    file_output_node.format.file_format = file_format
+    file_output_node.base_path = out_path
+    file_output_node.file_slots[0].path = img_name
+    tree.links.new(socket, file_output_node.inputs[0])
+    return file_output_node
+
+
+def true_normal_aov(obj):
+    '''
+    Adds the true normal of the page to the render as an AOV, the normal gt
+    of render_norm.py (the Normal pass is the smooth shading normal).
+    Returns the name of the render layer output, None before Blender 2.92
+    (no AOVs). Before the render layer node is created.
+    '''
+    view_layer = bpy.context.view_layer
+    if not hasattr(view_layer, 'aovs'):
+        return None
+    if TRUE_NORMAL_AOV not in [aov.name for aov in view_layer.aovs]:
+        aov = view_layer.aovs.add()
+        aov.name = TRUE_NORMAL_AOV
+        aov.type = 'COLOR'
+    tree = obj.material_slots[0].material.node_tree
+    if not [node for node in tree.nodes if node.type == 'OUTPUT_AOV']:
+        geo_node = tree.nodes.new(type='ShaderNodeNewGeometry')
+        aov_node = tree.nodes.new(type='ShaderNodeOutputAOV')
+        if hasattr(aov_node, 'aov_name'):
+            aov_node.aov_name = TRUE_NORMAL_AOV
+        else:
+            # Blender 2.9x
+            aov_node.name = TRUE_NORMAL_AOV
+        tree.links.new(geo_node.outputs['True Normal'], aov_node.inputs['Color'])
+    return TRUE_NORMAL_AOV
+
+
+def get_fused_passes(tree, render_layers, img_name, normal_aov=None):
+    '''
+    Writes the gts from the passes of the image render: uv, depth, normal
+    (the true normal AOV, see true_normal_aov), albedo (diffuse color of the
+    page texture, as render_alb.py) and, from Blender 3.0 on, world
+    coordinates from the position pass.
+    Depth and position come from the first sample, uv and normal are
+    averaged over the samples like the image.
+    The files are named like the other renderers of each gt: uv and wc
+    <img_name>-1.exr, alb, norm and dmap <img_name>0001.* as render_gt.py.
+    '''
+    view_layer = bpy.context.view_layer
+    view_layer.use_pass_uv = True
+    view_layer.use_pass_z = True
+    view_layer.use_pass_diffuse_color = True
+    add_file_output(tree, render_layers.outputs["UV"], path_to_output_uv, 'OPEN_EXR', img_name+'-#')
+    add_file_output(tree, render_layers.outputs["Depth"], path_to_output_dmap, 'OPEN_EXR', img_name)
+    if normal_aov is not None:
+        add_file_output(tree, render_layers.outputs[normal_aov], path_to_output_norm, 'OPEN_EXR', img_name)
+    alb_node = add_file_output(tree, render_layers.outputs["DiffCol"], path_to_output_alb, 'PNG', img_name)
+    if hasattr(alb_node.format, 'color_management'):
+        # keep the albedo out of the Filmic view transform of the image
+        alb_node.format.color_management = 'OVERRIDE'
+        alb_node.format.view_settings.view_transform = 'Standard'
+    if hasattr(view_layer, 'use_pass_position'):
+        view_layer.use_pass_position = True
+        add_file_output(tree, render_layers.outputs["Position"], path_to_output_wc, 'OPEN_EXR', img_name+'-#')
+
+
+def render_fused_rest(obj):
+    # gts that cannot come from the image render, each one more 1 sample render
+    if config.get("renderRecon"):
+        prepare_no_env_render()
+        texpath = './recon_tex/chess48.png'
+        page_texturing(obj,texpath)
+        # named like render_recon.py, with the texture name
+        get_albedo_img(fn+os.path.basename(texpath)[:-4], path_to_output_recon)
+        render_stage('render_recon')
+
+    if not hasattr(bpy.context.view_layer, 'aovs'):
+        # no true normal AOV before Blender 2.92
+        prepare_no_env_render()
+        color_geometry_material(obj, 'normColor', 'True Normal')
+        get_worldcoord_img(fn, path_to_output_norm)
+        render_stage('render_norm')
+
+    if not hasattr(bpy.context.view_layer, 'use_pass_position'):
+        # no position pass before Blender 3.0
+        prepare_no_env_render()
+        color_wc_material(obj,'wcColor')
+        get_worldcoord_img(fn+"-#")
+        render_stage('render_wc')
 
 
+def render_stage(name):
+    # one render, timed as a stage of the sample
+    with telemetry.stage(name):
+        bpy.ops.render.render(write_still=False)
 
 
 def render_pass(obj, objpath, texpath,envpath,confpath):
@@ -480,6 +984,8 @@ def render_pass(obj, objpath, texpath,envpath,confpath):
     for n in tree.nodes:
         tree.nodes.remove(n)
 
+    # the AOV output exists once the render layer node is created
+    normal_aov = true_normal_aov(obj) if config.get("fusedPasses") else None
     # create input render layer node
     render_layers = tree.nodes.new('CompositorNodeRLayers')
 
@@ -488,14 +994,32 @@ def render_pass(obj, objpath, texpath,envpath,confpath):
     file_output_node_img.base_path = path_to_output_images
     file_output_node_img.file_slots[0].path = fn+'-#'
     imglk = links.new(render_layers.outputs["Image"], file_output_node_img.inputs[0])
+    if config.get("fusedPasses"):
+        get_fused_passes(tree, render_layers, fn, normal_aov)
     # scene.cycles.samples = 128
-    bpy.ops.render.render(write_still=False)
+    render_stage('render_image')
+    scene_record['render']['samples_reached'] = samples_reached
+    telemetry.record('samples', samples_reached)
 
     # save_blend_file
-    if config["saveBlendFile"]:
-        bpy.ops.wm.save_mainfile(filepath=os.path.join(path_to_output_blends,fn+ '.blend') )
-
-    if config["renderOthers"]:
+    with telemetry.stage('save'):
+        if config["saveBlendFile"]:
+            if asset_cache is None:
+                bpy.ops.wm.save_mainfile(filepath=os.path.join(path_to_output_blends,fn+ '.blend') )
+            else:
+                # only the data of this sample, not every cached asset
+                bpy.data.libraries.write(os.path.join(path_to_output_blends,fn+ '.blend'), {scene})
+        if config.get("saveSceneRecord"):
+            scenerecord.save(os.path.join(path_to_output_blends,fn+ '.json'), scene_record)
+        if config["saveBlendFile"] or config.get("saveSceneRecord"):
+            # the saved sample in the work list of the downstream scripts
+            ext = '.blend' if config["saveBlendFile"] else '.json'
+            catalog.open_catalog(output_name).add(fn, os.path.join('./bld', str(output_name), fn + ext))
+
+    use_render_profile('gt')
+    if config.get("fusedPasses"):
+        render_fused_rest(obj)
+    elif config["renderOthers"]:
         # prepare to render without environment
         prepare_no_env_render()
 
@@ -509,7 +1033,7 @@ def render_pass(obj, objpath, texpath,envpath,confpath):
         file_output_node_uv.file_slots[0].path = fn+"-#"
         uvlk = links.new(render_layers.outputs["UV"], file_output_node_uv.inputs[0])
         scene.cycles.samples = 1
-        bpy.ops.render.render(write_still=False)
+        render_stage('render_uv')
         page_texturing(obj,'./recon_tex/chess48.png')
 
         get_albedo_img(fn+"-#")
@@ -518,144 +1042,365 @@ def render_pass(obj, objpath, texpath,envpath,confpath):
         bpy.data.scenes['Scene'].render.image_settings.color_mode='RGB'
         # bpy.data.scenes['Scene'].render.image_settings.file_format='OPEN_EXR'
         bpy.data.scenes['Scene'].render.image_settings.compression=0
-        bpy.ops.render.render(write_still=False)
+        render_stage('render_alb')
 
         # render world coordinates
         color_wc_material(obj,'wcColor')
         get_worldcoord_img(fn+"-#")
-        bpy.ops.render.render(write_still=False)
+        render_stage('render_wc')
 
     camera = bpy.data.objects['Camera']
     print(camera.location)
     print(camera.rotation_euler)
+    # before packing, which can remove the loose files
+    telemetry.record('outputs', output_sizes())
+    if config.get("shards"):
+        with telemetry.stage('pack'):
+            pack_sample()
 
-def createBook(wdh,r,k1,k2):
-    for bpy_data_iter in (
-        bpy.data.meshes,
-        bpy.data.lights,
-        bpy.data.images,
-        bpy.data.materials,
-        bpy.data.curves
-):
-        for id_data in bpy_data_iter:
-            bpy_data_iter.remove(id_data, do_unlink=True)
 
-    ops.curve.primitive_bezier_curve_add(radius=2*r,enter_editmode=True)
-    ops.curve.subdivide()
-    curve=context.active_object
-    bez_points = curve.data.splines[0].bezier_points
-    bez_points[0].handle_right_type="FREE"
-    bez_points[0].handle_left.y=0
-    bez_points[0].handle_right.y=0
-    bez_points[0].handle_right.x=-r
-   
-    bez_points[1].handle_right_type="FREE"
-    bez_points[1].handle_left_type="FREE"
-    bez_points[1].co=Vector((0,0,0))
-    bez_points[1].handle_left=Vector((-0.5*r,-0.5*k1*r,0))
-    bez_points[1].handle_right=Vector((0.5*r,-0.5*k2*r,0))
-
-
-    curve.data.resolution_u=100
-    curve.data.extrude=wdh*curve.data.splines[0].calc_length()*0.5
-
-    ops.object.mode_set(mode='OBJECT')
-
-    ops.object.convert(target='MESH')
-    ops.transform.rotate(value=math.pi/2,orient_axis='Y')
-    ops.transform.rotate(value=-math.pi/2,orient_axis='X')
-
-
-    # if not os.path.exists(args.out):
-    #     os.makedirs(args.out)
-    # fn='{:.2f}-{:.2f}-{:.2f}-{:.2f}.obj'.format(wdh,r,k1,k2)
-    # fPath = os.path.abspath(os.path.join(args.out, fn))
-    # if args.overwirte or not os.path.exists(fPath):
-    #     ops.export_scene.obj(filepath=fPath)
-    #     print("---output:"+fPath+"---")
-    # else:
-    #     print("exists")
+def output_sizes():
+    # bytes of every output file of this sample
+    return {path: os.path.getsize(path) for path in shards.sample_files(fn, output_name).values()}
+
+
+def shard_dir():
+    return os.path.join(config["shards"]["dir"], str(output_name))
+
+
+def pack_sample():
+    # moves the gts of this sample into the shards of this process
+    global shard_writer
+    opts = config["shards"]
+    if shard_writer is None or shard_writer.shard_dir != shard_dir():
+        if shard_writer is not None:
+            shard_writer.close()
+        shard_writer = shards.ShardWriter(shard_dir(), max_size=opts.get("maxSizeMB", 1024) * 1024 * 1024,
+                                          max_samples=opts.get("maxSamples", 1000))
+        atexit.register(shard_writer.close)
+    shards.pack(shard_writer, fn, output_name, remove=opts.get("removeLoose", False))
+
+
+def is_packed(name):
+    # samples packed before this session, their loose files may be gone
+    if shard_dir() not in packed_samples:
+        packed_samples[shard_dir()] = set(shards.read_index(shard_dir())) if os.path.exists(shard_dir()) else set()
+    return name in packed_samples[shard_dir()]
+
+def createBook(wdh,r,k1,k2):
+    # the page mesh of book.py, built from its arrays instead of the curve operators
+    # reset_scene already cleared everything but the cached assets, warm_reset the unused data
+    if asset_cache is None and warm is None:
+        for bpy_data_iter in (
+            bpy.data.meshes,
+            bpy.data.lights,
+            bpy.data.images,
+            bpy.data.materials,
+            bpy.data.curves
+    ):
+            for id_data in bpy_data_iter:
+                bpy_data_iter.remove(id_data, do_unlink=True)
+
+    return generated_object(book.make_book(wdh, r, k1, k2), 'BezierCurve', book.BOOK_MATRIX)
+
+
+def smooth_shading(obj):
+    # converted curves are smooth shaded, the generated pages too
+    polygons = obj.data.polygons
+    polygons.foreach_set('use_smooth', np.ones(len(polygons), dtype=bool))
+    obj.data.update()
+
+
+def createPage(page):
+    # a folded, creased, curled or crumpled page of deform.py
+    return generated_object(deform.build_page(page), 'Page', np.eye(4))
+
+
+def generated_object(mesh, name, matrix):
+    '''
+    The object of a generated page, or the kept one of the warm scene with
+    the new vertices when the page has the same topology.
+    '''
+    if warm is not None:
+        obj = bpy.data.objects[warm['object']]
+        if len(obj.data.vertices) == len(mesh['co']) and len(obj.data.polygons) == len(mesh['faces']):
+            obj.data.vertices.foreach_set('co', np.ascontiguousarray(mesh['co'], dtype=np.float32).ravel())
+            obj.data.update()
+            select_object(obj)
+            return obj
+        data = obj.data
+        bpy.data.objects.remove(obj, do_unlink=True)
+        bpy.data.meshes.remove(data)
+    obj = meshcache.to_blender(mesh, name, matrix)
+    smooth_shading(obj)
+    select_object(obj)
+    return obj
 
 def render_img( texpath,objpath,envpath,confpath):
-    prepare_scene()
-    prepare_rendersettings()
-    if args.generate:
-        image=bpy.data.images.load(os.path.abspath(texpath) )
-        if image.size[0]==0:
-            return 2
-        wdh=image.size[1]/image.size[0]
-        createBook(wdh,0.5,random.uniform(0.1,1.7),random.uniform(0.1,1.7))
-    else:
-    	bpy.ops.import_scene.obj(filepath=os.path.abspath(objpath))
-    mesh_name=bpy.data.meshes[0].name
-    mesh=position_object(mesh_name)
-    if config["lighting"]=='hdr':
-        hdrLighting(envpath,config["hdrStr"])
-    elif config["lighting"]=='point':
-        pointLight()
-
-    if(config["randCam"]):
-    	v=randCam(mesh)
-    else:
-    	v = reset_camera(mesh)
+    key = warm_key(objpath)
+    with telemetry.stage('reset'):
+        prepare_scene(key)
+        prepare_rendersettings()
+    with telemetry.stage('mesh'):
+        if args.generate:
+            image=load_image(texpath)
+            if image.size[0]==0:
+                return 2
+            wdh=image.size[1]/image.size[0]
+            generator=config.get("generator", {})
+            if generator.get("type", 'book') == 'deform':
+                page=deform.random_page(rng, wdh, generator)
+                mesh_name=createPage(page).name
+                scene_record['page'] = page
+            else:
+                params=[wdh,0.5,rng.uniform(0.1,1.7),rng.uniform(0.1,1.7)]
+                mesh_name=createBook(*params).name
+                scene_record['book'] = params
+        elif warm is not None:
+            if asset_cache is not None:
+                # still used, not evicted
+                asset_cache.get('mesh', objpath)
+            mesh_name=warm['object']
+            scene_record['mesh'] = os.path.abspath(objpath)
+        else:
+            mesh_name=load_mesh(objpath).name
+            scene_record['mesh'] = os.path.abspath(objpath)
+        mesh=position_object(mesh_name)
+    scene_record['mesh_matrix'] = [list(row) for row in mesh.matrix_world]
+    scene_record['texture'] = os.path.abspath(texpath)
+    with telemetry.stage('lighting'):
+        if config["lighting"]=='hdr':
+            hdrLighting(envpath,config["hdrStr"])
+        elif config["lighting"]=='point':
+            pointLight()
+
+    with telemetry.stage('camera'):
+        if(config["randCam"]):
+            v=randCam(mesh)
+        else:
+            v = reset_camera(mesh)
     
     if not v:
         return 1
     else:
         #add texture
-        page_texturing(mesh, texpath)
+        with telemetry.stage('texture'):
+            if warm is not None:
+                warm_texturing(mesh, texpath)
+            else:
+                page_texturing(mesh, texpath)
+        keep_warm(key, mesh)
         render_pass(mesh, objpath, texpath,envpath,confpath)
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Render mesh')
+    parser.add_argument('-t','--texture',help='texture path',default='tex/pp_Page_001.jpg')
+    parser.add_argument('-m','--mesh',help='mesh path',default='obj/1_1.obj')
+    parser.add_argument('-e','--env',help='environment path',default='env/0001.hdr')
+    parser.add_argument('-c','--conf',help='configuration path',default='config.json')
+    parser.add_argument('-o','--out',help='output folder name',default='1')
+    parser.add_argument('-b' ,'--batch', action='store_true',
+                            help='batch render files in folder')
+    parser.add_argument('-s' ,'--selectmesh', action='store_true',
+                            help='batch render 1000 meshes')
+    parser.add_argument('--generate', action='store_true',
+                            help='generate mesh')
+    parser.add_argument('--overwrite', action='store_true',
+                            help='overwirte')
+    parser.add_argument('--plan', help='render the rows of a plan (plan.py)')
+    parser.add_argument('--rows', type=int, nargs=2, help='first and last (exclusive) rows of the plan')
+    parser.add_argument('--retry-failed', action='store_true',
+                        help='render again the samples that ended out of view or with a bad texture')
+    parser.add_argument('--threads', type=int, default=0,
+                        help='render threads of this process, 0 for the profile of the config or all the cores')
+    return parser
+
+
+def load_config(confpath):
+    with open(confpath, 'r', encoding='utf-8') as fs:
+        return json.load(fs)
+
+
+def prepare_output(out):
+    global path_to_output_images, path_to_output_uv, path_to_output_wc, path_to_output_alb, path_to_output_blends
+    global path_to_output_norm, path_to_output_dmap, path_to_output_recon, output_name
+    output_name = out
+    path_to_output_images=os.path.abspath('./img/{}/'.format(out))
+    path_to_output_uv = os.path.abspath('./uv/{}/'.format(out))
+    path_to_output_wc = os.path.abspath('./wc/{}/'.format(out))
+    path_to_output_alb =os.path.abspath('./alb/{}/'.format(out))
+    path_to_output_blends=os.path.abspath('./bld/{}/'.format(out))
+    # only used by the fused passes, created on demand
+    path_to_output_norm = os.path.abspath('./norm/{}/'.format(out))
+    path_to_output_dmap = os.path.abspath('./dmap/{}/'.format(out))
+    path_to_output_recon = os.path.abspath('./recon/{}/'.format(out))
+
+    for fd in [path_to_output_images, path_to_output_uv, path_to_output_wc,path_to_output_alb, path_to_output_blends]:
+        if not os.path.exists(fd):
+            os.makedirs(fd)
+
+
+def sample_name(meshpath, texpath, envpath, confpath):
+    return plan.sample_name(meshpath, texpath, envpath, confpath)
+
+
+def rendered_gts():
+    # the gts render_pass writes besides the image, with the current config
+    gts = []
+    if config.get("fusedPasses"):
+        gts += ['uv', 'dmap', 'norm', 'alb', 'wc']
+        if config.get("renderRecon"):
+            gts.append('recon')
+    elif config["renderOthers"]:
+        gts += ['uv', 'wc']
+    if config["saveBlendFile"] or config.get("saveSceneRecord"):
+        gts.append('bld')
+    return gts
+
+
+def is_rendered(fPath):
+    '''
+    The final state of the sample, None when it has to be rendered: from the
+    manifest, the output files only for samples rendered before it.
+    The sample seeds make 'out of view' and 'bad texture' final too,
+    unless --retry-failed.
+    '''
+    state = manifest.open_manifest(output_name).state(fn, 'img')
+    if state == 'done' or (state in FINAL_FAILURES and not args.retry_failed):
+        return state
+    if state is None and (os.path.exists(fPath) or bool(config.get("shards") and is_packed(fn))):
+        return 'done'
+    return None
+
+
+def seed_sample(key):
+    # the random numbers of a sample only depend on the dataset seed and its name
+    global rng, seed
+    seed = seeding.sample_seed(config.get("seed", 0), key)
+    rng = random.Random(seed)
+
+
+def telemetry_sink():
+    opts = config["telemetry"]
+    return telemetry.open_sink(opts.get("sink", os.path.join('telemetry', str(output_name) + '.jsonl')))
+
+
+def render_sample(texpath, objpath, envpath, confpath):
+    # render_img with its start and finish records in the manifest and its telemetry events
+    seed_sample(fn)
+    telemetry.begin_sample()
+    opts = config.get("telemetry")
+    if opts:
+        telemetry_sink().append(telemetry.event('start', sample=fn, out=output_name, mesh=objpath,
+                                                texture=texpath, env=envpath, conf=confpath, seed=seed))
+    log = manifest.open_manifest(output_name)
+    log.start(fn, 'img')
+    if opts:
+        with telemetry.profile(opts.get("profile"), fn, opts.get("profileDir", 'profiles')):
+            v = render_img(texpath, objpath, envpath, confpath)
+    else:
+        v = render_img(texpath, objpath, envpath, confpath)
+    status = {1: 'out of view', 2: 'bad texture'}.get(v, 'done')
+    if status == 'done':
+        log.finish(fn, 'img', outputs=rendered_gts())
+    else:
+        log.finish(fn, 'img', status)
+    if opts:
+        telemetry_sink().append(telemetry.event(
+            'sample', sample=fn, out=output_name, status=status, seed=seed, duration=telemetry.sample_time(),
+            stages=telemetry.sample_timings(), spans=telemetry.spans, peak_rss_mb=telemetry.peak_rss(),
+            params={k: scene_record[k] for k in ('view_transform', 'render', 'env', 'light', 'camera', 'book', 'page')
+                    if k in scene_record},
+            **telemetry.fields))
+    return v
+
+
+def run_job(job):
+    '''
+    Render one job of batch_render.py (a dict with mesh, texture, env, conf, out)
+    the same way as the single file mode, and return its status.
+    The module level args must be set by the caller.
+    '''
+    global config, fn
+    if 'row' in job:
+        return run_row(job['plan'], job['row'])
+    config = load_config(job['conf'])
+    prepare_output(job['out'])
+    fn = sample_name(job['mesh'], job['texture'], job['env'], job['conf'])
+    fPath = os.path.join(path_to_output_images, fn + '-1.png')
+    state = None if job.get('overwrite') else is_rendered(fPath)
+    if state is not None:
+        return 'exists' if state == 'done' else state
+    v = render_sample(job['texture'], job['mesh'], job['env'], job['conf'])
+    if v == 1:
+        return 'out of view'
+    elif v == 2:
+        return 'bad texture'
+    print("---output:"+fPath+"---")
+    return 'done'
+
+
+def run_row(plan_path, k):
+    '''
+    Render the sample of row k of a plan with the parameters of the row,
+    rows without a visible camera are not rendered.
+    '''
+    global config, fn, plan_row
+    if plan_path not in plans:
+        plans[plan_path] = plan.load(plan_path)
+    row = plans[plan_path][k]
+    config = load_config(str(row['conf']))
+    prepare_output(str(row['out']))
+    fn = str(row['sample'])
+    if not row['visible']:
+        return 'out of view'
+    fPath = os.path.join(path_to_output_images, fn + '-1.png')
+    state = None if args.overwrite else is_rendered(fPath)
+    if state is not None:
+        return 'exists' if state == 'done' else state
+    plan_row = row
+    try:
+        v = render_sample(str(row['texture']), str(row['mesh']), str(row['env']), str(row['conf']))
+    finally:
+        plan_row = None
+    if v == 1:
+        return 'out of view'
+    print("---output:"+fPath+"---")
+    return 'done'
+
+
 if __name__ == '__main__':
 
 	#parse argument
-	parser = argparse.ArgumentParser(description='Render mesh')
-	parser.add_argument('-t','--texture',help='texture path',default='tex/pp_Page_001.jpg')
-	parser.add_argument('-m','--mesh',help='mesh path',default='obj/1_1.obj')
-	parser.add_argument('-e','--env',help='environment path',default='env/0001.hdr')
-	parser.add_argument('-c','--conf',help='configuration path',default='config.json')
-	parser.add_argument('-o','--out',help='output folder name',default='1')
-	parser.add_argument('-b' ,'--batch', action='store_true',
-	                        help='batch render files in folder')
-	parser.add_argument('-s' ,'--selectmesh', action='store_true',
-	                        help='batch render 1000 meshes')
-	parser.add_argument('--generate', action='store_true',
-	                        help='generate mesh')
-	parser.add_argument('--overwrite', action='store_true',
-	                        help='overwirte')
-	args, unknown = parser.parse_known_args(sys.argv[5:])
+	args, unknown = build_parser().parse_known_args(sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else [])
 	print(args)
 
 
 	try:
-	    with open(args.conf, 'r', encoding='utf-8') as fs:
-	        config=json.load(fs)
-	        print(config)
+	    config = load_config(args.conf)
+	    print(config)
 	except IOError as e:
 	    print(e)
 
 
 	#prepare output directory
-	path_to_output_images=os.path.abspath('./img/{}/'.format(args.out))
-	path_to_output_uv = os.path.abspath('./uv/{}/'.format(args.out))
-	path_to_output_wc = os.path.abspath('./wc/{}/'.format(args.out))
-	path_to_output_alb =os.path.abspath('./alb/{}/'.format(args.out)) 
-	path_to_output_blends=os.path.abspath('./bld/{}/'.format(args.out))
-
-	for fd in [path_to_output_images, path_to_output_uv, path_to_output_wc,path_to_output_alb, path_to_output_blends]:
-	    if not os.path.exists(fd):
-	        os.makedirs(fd)
+	prepare_output(args.out)
 
-	if args.batch:
+	if args.plan:
+		rows = args.rows or [0, len(plan.load(args.plan))]
+		for k in range(*rows):
+			print(run_row(args.plan, k))
+	elif args.batch:
 		# meshList=glob.glob(os.path.join(args.mesh,"*.obj"))
-		envList=os.listdir(args.env)
+		envList=sorted(os.listdir(args.env))
 		for fname in sorted(os.listdir(args.texture)):
 			if '.jpg' in fname or '.JPG' in fname or '.png' in fname:
 				# randMesh=os.path.join(args.mesh,random.choice(meshList) )
-				randEnv=os.path.join(args.env,random.choice(envList))
+				randEnv=os.path.join(args.env,seeding.sample_rng(config.get("seed", 0), 'env:'+fname).choice(envList))
 				fn=fname[:-4] 
 				fPath =os.path.join(os.path.abspath(path_to_output_images),fn+'-1.png')
-				if not os.path.exists(fPath):
-					render_img(os.path.join(args.texture,fname),"randMesh",randEnv,args.conf)
+				if not is_rendered(fPath):
+					render_sample(os.path.join(args.texture,fname),"randMesh",randEnv,args.conf)
 					print("---output:"+fPath+"---")
 				else:
 					print("exists")
@@ -663,23 +1408,21 @@ if __name__ == '__main__':
 		texpath='./recon_tex/chess48.png'
 		for fname in sorted(os.listdir(args.mesh)):
 			meshPath=os.path.join(args.mesh,fname)
-			randEnv=os.path.join(args.env,random.choice(os.listdir(args.env)))
+			randEnv=os.path.join(args.env,seeding.sample_rng(config.get("seed", 0), 'env:'+fname).choice(sorted(os.listdir(args.env))))
 			fn=fname[:-4] 
 			fPath =os.path.join(os.path.abspath(path_to_output_images),fn+'-1.png')
-			if not os.path.exists(fPath):
-				render_img(texpath,meshPath,randEnv,args.conf)
+			if not is_rendered(fPath):
+				render_sample(texpath,meshPath,randEnv,args.conf)
 				print("---output:"+fPath+"---")
 			else:
 				print("exists")
 
 
 	else:
-		confHash=hashlib.md5(open(args.conf, 'rb').read()).hexdigest()
-		fn=os.path.split(args.mesh)[1][:-4] +'-' + os.path.split(args.texture)[1][:-4] \
-		   + '-' +  os.path.split(args.env)[1][:-4] +'-'+ confHash[0:5]
+		fn=sample_name(args.mesh, args.texture, args.env, args.conf)
 		fPath =os.path.join(os.path.abspath(path_to_output_images),fn+'-1.png')
-		if args.overwrite or not os.path.exists(fPath):
-			render_img(args.texture,args.mesh,args.env,args.conf)
+		if args.overwrite or not is_rendered(fPath):
+			render_sample(args.texture,args.mesh,args.env,args.conf)
 			print("---output:"+fPath+"---")
 		else:
 			print("exists")
@@ -4,6 +4,7 @@ https://www3.cs.stonybrook.edu/~cvl/projects/dewarpnet/storage/paper.pdf (ICCV 2
 
 This code renders the normals using the .blend files 
 saved from render_mesh.py 
+(or the .json scene records, see scenerecord.py)
 
 Written by: Sagnik Das
 Stony Brook University, New York
@@ -21,6 +22,10 @@ import math
 from mathutils import Vector, Euler
 import string
 
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import scenerecord
+import manifest
+
 
 def select_object(ob):
     bpy.ops.object.select_all(action='DESELECT')
@@ -120,12 +125,16 @@ with open(blend_list,'r') as b:
     blendlist = list(csv.reader(b))
 
 
+log = manifest.open_manifest(rridx)
 for bfile in blendlist[strt:end]:
-    bpy.ops.wm.read_factory_settings()
     bfname=bfile[0]
+    fn=scenerecord.sample_name(bfname)
+    if log.is_done(fn, 'norm'):
+        continue
+    log.start(fn, 'norm')
+    bpy.ops.wm.read_factory_settings()
     #load blend file 
-    bpy.ops.wm.open_mainfile(filepath=bfname)
-    fn=bfname.split('/')[-1][:-6]
+    scenerecord.open_sample(bfname)
     mesh=bpy.data.objects[bpy.data.meshes[0].name]
 
     # render world coordinates
@@ -133,4 +142,5 @@ for bfile in blendlist[strt:end]:
     color_norm_material(mesh,'nColor')
     get_normal_img(fn)
     render()
+    log.finish(fn, 'norm')
  
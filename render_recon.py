@@ -4,6 +4,7 @@ https://www3.cs.stonybrook.edu/~cvl/projects/dewarpnet/storage/paper.pdf (ICCV 2
 
 This code renders the checkerboards using the .blend files 
 saved from render_mesh.py 
+(or the .json scene records, see scenerecord.py)
 
 Written by: Sagnik Das
 Stony Brook University, New York
@@ -20,6 +21,10 @@ import math
 from mathutils import Vector, Euler
 import string
 
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import scenerecord
+import manifest
+
 
 def select_object(ob):
     bpy.ops.object.select_all(action='DESELECT')
@@ -130,16 +135,22 @@ if not os.path.exists(path_to_output_alb):
 with open(blend_list,'r') as b:
     blendlist = list(csv.reader(b))
 
+texname=texpath.split('/')[-1][:-4]
+log = manifest.open_manifest(rridx)
 for bfile in blendlist[strt:end]:
     bfname=bfile[0]
+    sample=scenerecord.sample_name(bfname)
+    fn=sample+texname
+    # the output file only for samples rendered before the manifest
+    state=log.state(sample, 'recon')
+    if state == 'done' or (state is None and os.path.isfile(os.path.join(path_to_output_alb,fn+'0001.png'))):
+        continue
+    log.start(sample, 'recon')
     #load blend file 
-    bpy.ops.wm.open_mainfile(filepath=bfname)
+    scenerecord.open_sample(bfname)
 
-    texname=texpath.split('/')[-1][:-4]
     render_img_newtex(texpath)
-    fn=bfname.split('/')[-1][:-6]+texname
-    if os.path.isfile(os.path.join(path_to_output_alb,fn+'0001.png')):
-        continue
     prepare_no_env_render()
     get_albedo_img(fn,texname)
     render()
+    log.finish(sample, 'recon')
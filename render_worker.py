@@ -0,0 +1,77 @@
+'''
+Code for rendering the groundtruths of Doc3D dataset
+https://www3.cs.stonybrook.edu/~cvl/projects/dewarpnet/storage/paper.pdf (ICCV 2019)
+
+This code is a resident Blender worker for batch_render.py.
+It connects to the job queue served by batch_render.py, renders the chunks
+of jobs with render_mesh.py in the same Blender session and reports the
+results back. The worker exits after the chunk that reaches --max-jobs jobs
+or when its peak memory goes over --max-rss, batch_render.py then starts a
+fresh one. --threads pins the render threads of the worker.
+
+blender --background --python render_worker.py -- --address <host:port> --authkey <key> --worker <id>
+'''
+import os
+import sys
+import argparse
+import traceback
+from multiprocessing.managers import BaseManager
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import render_mesh
+import telemetry
+
+
+class QueueManager(BaseManager):
+    pass
+
+
+QueueManager.register('get_jobs')
+QueueManager.register('get_results')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Resident render worker')
+    parser.add_argument('--address', help='job queue address host:port', required=True)
+    parser.add_argument('--authkey', help='job queue authentication key', required=True)
+    parser.add_argument('--worker', type=int, help='worker id', default=0)
+    parser.add_argument('--token', help='job queue token of this worker process', default=None)
+    parser.add_argument('--max-jobs', type=int, help='exit after this many jobs', default=50)
+    parser.add_argument('--max-rss', type=float, help='exit when peak memory exceeds this (MB), 0 to disable', default=0)
+    parser.add_argument('--threads', type=int, help='render threads, 0 for the render profile of the config', default=0)
+    args = parser.parse_args(sys.argv[sys.argv.index('--') + 1:])
+
+    host, port = args.address.rsplit(':', 1)
+    manager = QueueManager(address=(host, int(port)), authkey=args.authkey.encode())
+    manager.connect()
+    jobs = manager.get_jobs()
+    results = manager.get_results()
+
+    # render_mesh.py reads its command line options from the module level args
+    render_mesh.args = render_mesh.build_parser().parse_args(['--threads', str(args.threads)])
+
+    njobs = 0
+    while True:
+        # the pool knows the chunk is with this worker before the 'take' message
+        chunk = jobs.get(args.token)
+        if chunk is None:
+            break
+        results.put(('take', args.worker, chunk, None))
+        for job in chunk:
+            results.put(('start', args.worker, job, None))
+            try:
+                status = render_mesh.run_job(job)
+            except Exception:
+                traceback.print_exc()
+                status = 'error'
+            results.put(('done', args.worker, job, status))
+            njobs += 1
+
+        # checked between chunks, the jobs of a chunk are not handed back
+        if njobs >= args.max_jobs:
+            break
+        rss = telemetry.peak_rss()
+        if args.max_rss > 0 and rss is not None and rss > args.max_rss:
+            print('worker {} peak memory {:.0f}MB, restarting'.format(args.worker, rss))
+            break
+    results.put(('exit', args.worker, None, None))
@@ -0,0 +1,111 @@
+'''
+Code for rendering the groundtruths of Doc3D dataset
+https://www3.cs.stonybrook.edu/~cvl/projects/dewarpnet/storage/paper.pdf (ICCV 2019)
+
+This code saves and loads the per sample scene records of render_mesh.py.
+A record is a small .json next to (or instead of) the .blend file in
+bld/<folder-id>/ with everything needed to rebuild the scene:
+mesh (path, generated book parameters or deform.py page) and its object matrix, texture,
+env map with rotation and strength or point light, camera lens and matrix,
+view transform and render settings.
+render_alb.py, render_norm.py, render_dmap.py and render_recon.py accept
+both, see open_sample.
+'''
+import os
+import json
+
+
+def save(path, record):
+    with open(path, 'w') as f:
+        json.dump(record, f, indent=1)
+
+
+def load(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def sample_name(path):
+    # name of the sample of a .blend or .json file
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def rebuild_scene(record):
+    '''
+    Rebuilds the scene of a record in the current Blender session,
+    the same scene render_mesh.py had when it rendered the image.
+    '''
+    import bpy
+    from mathutils import Matrix, Vector
+    import render_mesh
+
+    render_mesh.reset_blend()
+    scene = bpy.data.scenes['Scene']
+    scene.render.engine = 'CYCLES'
+    scene.cycles.samples = record['render']['samples']
+    scene.cycles.use_square_samples = False
+    scene.display_settings.display_device = 'sRGB'
+    scene.view_settings.view_transform = record['view_transform']
+    scene.render.resolution_x = record['render']['resolution_x']
+    scene.render.resolution_y = record['render']['resolution_y']
+    scene.render.resolution_percentage = record['render']['resolution_percentage']
+
+    # mesh
+    if 'book' in record:
+        render_mesh.createBook(*record['book'])
+    elif 'page' in record:
+        render_mesh.createPage(record['page'])
+    else:
+        bpy.ops.import_scene.obj(filepath=record['mesh'])
+    mesh = render_mesh.position_object(bpy.data.meshes[0].name)
+    mesh.matrix_world = Matrix(record['mesh_matrix'])
+    render_mesh.page_texturing(mesh, record['texture'])
+
+    # lighting
+    world = bpy.data.worlds['World']
+    world.use_nodes = True
+    wnodes = world.node_tree.nodes
+    wlinks = world.node_tree.links
+    bg_node = wnodes['Background']
+    if record.get('env'):
+        texcoord = wnodes.new(type='ShaderNodeTexCoord')
+        mapping = wnodes.new(type='ShaderNodeMapping')
+        mapping.inputs["Rotation"].default_value = (0.0, 0.0, record['env']['rotation'])
+        wlinks.new(texcoord.outputs[0], mapping.inputs[0])
+        envnode = wnodes.new(type='ShaderNodeTexEnvironment')
+        wlinks.new(mapping.outputs[0], envnode.inputs[0])
+        envnode.image = bpy.data.images.load(record['env']['path'])
+        bg_node.inputs[1].default_value = record['env']['strength']
+        wlinks.new(envnode.outputs[0], bg_node.inputs[0])
+    if record.get('light'):
+        bg_node.inputs[1].default_value = 0
+        bpy.ops.object.add(type='LIGHT', location=Vector(record['light']['location']))
+        lamp = bpy.data.lights[0]
+        lamp.use_nodes = True
+        nodes = lamp.node_tree.nodes
+        lamp_node = [node for node in nodes if node.type == 'EMISSION'][0]
+        lamp_node.inputs[1].default_value = record['light']['strength']
+        bbody = nodes.new(type='ShaderNodeBlackbody')
+        bbody.inputs[0].default_value = record['light']['color_temp']
+        lamp.node_tree.links.new(bbody.outputs[0], lamp_node.inputs[0])
+
+    # camera
+    camera = bpy.data.objects['Camera']
+    bpy.data.cameras['Camera'].lens = record['camera']['lens']
+    bpy.data.cameras['Camera'].sensor_width = record['camera']['sensor_width']
+    camera.location = Vector(record['camera']['location'])
+    camera.rotation_euler = record['camera']['rotation_euler']
+    scene.camera = camera
+    bpy.context.view_layer.update()
+    return mesh
+
+
+def open_sample(path):
+    '''
+    Loads a sample saved by render_mesh.py, a .blend file or a .json record.
+    '''
+    import bpy
+    if path.endswith('.json'):
+        rebuild_scene(load(path))
+    else:
+        bpy.ops.wm.open_mainfile(filepath=path)
@@ -0,0 +1,101 @@
+'''
+Code for rendering the groundtruths of Doc3D dataset
+https://www3.cs.stonybrook.edu/~cvl/projects/dewarpnet/storage/paper.pdf (ICCV 2019)
+
+This code hands out the render jobs of batch_render.py to the workers.
+Jobs go out in chunks on demand, large while there is a lot of work left
+and down to single jobs at the end (guided scheduling), so that a worker
+stuck on slow meshes does not hold back work the others could do.
+Crashed or failed jobs are retried a bounded number of times,
+and the throughput and remaining time are printed as jobs finish.
+'''
+import math
+import time
+from collections import deque
+
+# statuses of render_mesh.run_job worth another try, the others are final
+RETRY = ('crashed', 'error')
+
+
+class Throughput:
+    '''
+    Jobs per minute over the last window seconds and the remaining time.
+    '''
+
+    def __init__(self, total, window=300.0):
+        self.total = total
+        self.window = window
+        self.start = time.time()
+        self.times = deque()
+        self.count = 0
+
+    def update(self):
+        self.count += 1
+        self.times.append(time.time())
+
+    def rate(self):
+        # jobs per second
+        now = time.time()
+        while self.times and now - self.times[0] > self.window:
+            self.times.popleft()
+        elapsed = min(now - self.start, self.window)
+        return len(self.times) / elapsed if elapsed > 0 else 0.0
+
+    def line(self):
+        rate = self.rate()
+        eta = (self.total - self.count) / rate if rate > 0 else float('inf')
+        return '{:.1f} jobs/min, eta {}'.format(rate * 60, format_time(eta))
+
+
+def format_time(seconds):
+    if math.isinf(seconds):
+        return '?'
+    seconds = int(seconds)
+    return '{}:{:02d}:{:02d}'.format(seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+
+class Scheduler:
+    '''
+    Pending jobs, chunking, retries and final results of a batch.
+    '''
+
+    def __init__(self, jobs, nworkers, min_chunk=1, max_chunk=8, max_retries=2):
+        self.pending = deque(jobs)
+        self.nworkers = max(1, nworkers)
+        self.min_chunk = min_chunk
+        self.max_chunk = max_chunk
+        self.max_retries = max_retries
+        self.total = len(jobs)
+        self.results = []
+        self.throughput = Throughput(self.total)
+
+    def next_chunk(self):
+        # guided: a share of what is left per worker, within [min_chunk, max_chunk]
+        if not self.pending:
+            return None
+        n = math.ceil(len(self.pending) / (2 * self.nworkers))
+        n = max(self.min_chunk, min(self.max_chunk, n))
+        return [self.pending.popleft() for _ in range(min(n, len(self.pending)))]
+
+    def requeue(self, jobs):
+        # jobs handed out but never started, first in line again
+        self.pending.extendleft(reversed(jobs))
+
+    def report(self, job, status):
+        '''
+        Result of a job, retried later if it crashed or failed and has tries left.
+        Returns True when the result is final.
+        '''
+        attempt = job.get('attempt', 0)
+        if status in RETRY and attempt < self.max_retries:
+            job = dict(job, attempt=attempt + 1)
+            self.pending.append(job)
+            print('{} {}, retry {}/{}'.format(job['mesh'], status, attempt + 1, self.max_retries))
+            return False
+        self.results.append((job, status))
+        self.throughput.update()
+        print('[{}/{}] {} {} ({})'.format(len(self.results), self.total, job['mesh'], status, self.throughput.line()))
+        return True
+
+    def finished(self):
+        return len(self.results) >= self.total
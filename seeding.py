@@ -0,0 +1,22 @@
+'''
+Code for rendering the groundtruths of Doc3D dataset
+https://www3.cs.stonybrook.edu/~cvl/projects/dewarpnet/storage/paper.pdf (ICCV 2019)
+
+This code derives the random number generator of a sample from the dataset
+seed ("seed" in the config) and a key of the sample (its name), so that the
+parameters drawn for a sample (view transform, env rotation and strength,
+camera, book shape) do not depend on the samples rendered before it in the
+process: any subset can be rendered again, on any worker, in any order.
+'''
+import random
+import hashlib
+
+
+def sample_seed(dataset_seed, key):
+    # 64 bit seed from a hash of the dataset seed and the sample key
+    digest = hashlib.sha256('{}:{}'.format(dataset_seed, key).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'little')
+
+
+def sample_rng(dataset_seed, key):
+    return random.Random(sample_seed(dataset_seed, key))
@@ -0,0 +1,176 @@
+'''
+Code for rendering the groundtruths of Doc3D dataset
+https://www3.cs.stonybrook.edu/~cvl/projects/dewarpnet/storage/paper.pdf (ICCV 2019)
+
+This code packs the gts of the samples into tar shards (WebDataset style)
+instead of one loose file per sample and gt. The files of a sample are
+contiguous in a shard, <sample>.<gt>.<ext> (e.g. 1_1-pp_Page_001-0001-1a2b3.uv.exr),
+and an index gives their byte range so that a loader reads a whole sample
+with one sequential read (read_sample).
+Every writer (process) has its own shards and index, <prefix>-000000.tar ...
+and index-<prefix>.jsonl in the shard folder, read_index merges them.
+
+python shards.py <folder-id> -o shards/<folder-id> [--max-size MB] [--max-samples N] [--remove]
+packs the outputs of render_mesh.py and the other renderers after rendering.
+render_mesh.py packs its own outputs inline with the "shards" config, e.g.
+"shards": {"dir": "shards", "maxSizeMB": 1024, "maxSamples": 1000, "removeLoose": false}
+'''
+import os
+import json
+import glob
+import socket
+import tarfile
+import argparse
+
+# gts, their folders and the suffixes of their files after the sample name:
+# img, uv and wc are <sample>-1.*, the other gts <sample>0001.* (also with
+# "fusedPasses"), recon adds the name of the texture. The albedo folder also
+# has the checkerboard albedo of "renderOthers" as <sample>-1.png, a gt of its own
+GTS = [
+    ('img', 'img', ['-1.png']),
+    ('uv', 'uv', ['-1.exr']),
+    ('wc', 'wc', ['-1.exr']),
+    ('alb', 'alb', ['0001.png']),
+    ('chess', 'alb', ['-1.png']),
+    ('norm', 'norm', ['0001.exr']),
+    ('dmap', 'dmap', ['0001.exr']),
+    ('recon', 'recon', ['chess480001.png']),
+    ('bld', 'bld', ['.blend', '.json']),
+]
+
+
+def sample_files(sample, out, root='.'):
+    # existing gt files of a sample: member name -> path
+    files = {}
+    for gt, folder, suffixes in GTS:
+        for suffix in suffixes:
+            path = os.path.join(root, folder, str(out), sample + suffix)
+            if os.path.isfile(path):
+                files['{}.{}{}'.format(sample, gt, suffix[suffix.rfind('.'):])] = path
+    return files
+
+
+def list_samples(out, root='.'):
+    # samples of a folder id, from the rendered images
+    return sorted(os.path.basename(p)[:-len('-1.png')] for p in glob.glob(os.path.join(root, 'img', str(out), '*-1.png')))
+
+
+class ShardWriter:
+    '''
+    Writes samples to <shard_dir>/<prefix>-NNNNNN.tar, a new shard when the
+    current one has max_size bytes or max_samples samples, and one line per
+    sample to <shard_dir>/index-<prefix>.jsonl once its data is on disk.
+    '''
+
+    def __init__(self, shard_dir, prefix=None, max_size=1 << 30, max_samples=1000):
+        self.shard_dir = shard_dir
+        self.prefix = prefix or '{}-{}'.format(socket.gethostname(), os.getpid())
+        self.max_size = max_size
+        self.max_samples = max_samples
+        if not os.path.exists(shard_dir):
+            os.makedirs(shard_dir)
+        self.index = open(os.path.join(shard_dir, 'index-{}.jsonl'.format(self.prefix)), 'a')
+        # never append to a shard of a previous run, start after the last one
+        self.shard_id = len(glob.glob(os.path.join(shard_dir, self.prefix + '-*.tar')))
+        self.tar = None
+        self.count = 0
+
+    def next_shard(self):
+        self.close_shard()
+        self.shard_name = '{}-{:06d}.tar'.format(self.prefix, self.shard_id)
+        self.shard_id += 1
+        self.tar = tarfile.open(os.path.join(self.shard_dir, self.shard_name), 'w', format=tarfile.GNU_FORMAT)
+        self.count = 0
+
+    def close_shard(self):
+        if self.tar is not None:
+            self.tar.close()
+            self.tar = None
+
+    def write(self, sample, files):
+        '''
+        Adds a sample, files maps the member names to the file paths.
+        Returns its index entry.
+        '''
+        if self.tar is None or self.tar.offset >= self.max_size or self.count >= self.max_samples:
+            self.next_shard()
+        start = self.tar.offset
+        members = {}
+        for name in sorted(files):
+            info = self.tar.gettarinfo(files[name], arcname=name)
+            info.uid = info.gid = 0
+            info.uname = info.gname = ''
+            with open(files[name], 'rb') as f:
+                self.tar.addfile(info, f)
+            # offset_data is only set when reading, the data ends the member padded to blocks
+            blocks = (info.size + tarfile.BLOCKSIZE - 1) // tarfile.BLOCKSIZE
+            offset_data = self.tar.offset - blocks * tarfile.BLOCKSIZE
+            members[name] = [offset_data - start, info.size]
+        self.tar.fileobj.flush()
+        entry = {'sample': sample, 'shard': self.shard_name, 'offset': start,
+                 'size': self.tar.offset - start, 'members': members}
+        self.index.write(json.dumps(entry) + '\n')
+        self.index.flush()
+        self.count += 1
+        return entry
+
+    def close(self):
+        self.close_shard()
+        self.index.close()
+
+
+def read_index(shard_dir):
+    # index entries of all the writers of a shard folder, by sample
+    entries = {}
+    for path in sorted(glob.glob(os.path.join(shard_dir, 'index-*.jsonl'))):
+        with open(path, 'r') as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    entries[entry['sample']] = entry
+    return entries
+
+
+def read_sample(shard_dir, entry):
+    # member name -> bytes of a sample, one read
+    with open(os.path.join(shard_dir, entry['shard']), 'rb') as f:
+        f.seek(entry['offset'])
+        data = f.read(entry['size'])
+    return {name: data[offset:offset + size] for name, (offset, size) in entry['members'].items()}
+
+
+def pack(writer, sample, out, root='.', remove=False):
+    # packs the gt files of a sample, the loose files are removed with remove
+    # except the .blend and .json the renderers of the other gts open
+    files = sample_files(sample, out, root)
+    if not files:
+        return None
+    entry = writer.write(sample, files)
+    if remove:
+        for name, path in files.items():
+            if not name.startswith(sample + '.bld.'):
+                os.remove(path)
+    return entry
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Pack the gts of a folder id into tar shards')
+    parser.add_argument('folder', help='folder id')
+    parser.add_argument('-o', '--out', help='shard folder, shards/<folder-id> by default')
+    parser.add_argument('--root', help='folder of img/, uv/, ...', default='.')
+    parser.add_argument('--max-size', type=int, help='shard size in MB', default=1024)
+    parser.add_argument('--max-samples', type=int, help='samples per shard', default=1000)
+    parser.add_argument('--prefix', help='shard name prefix', default='shard')
+    parser.add_argument('--remove', action='store_true', help='remove the loose files once packed (not the bld files)')
+    args = parser.parse_args()
+
+    shard_dir = args.out or os.path.join('shards', args.folder)
+    done = read_index(shard_dir) if os.path.exists(shard_dir) else {}
+    samples = [s for s in list_samples(args.folder, args.root) if s not in done]
+    print('{} samples to pack'.format(len(samples)))
+    writer = ShardWriter(shard_dir, args.prefix, args.max_size * 1024 * 1024, args.max_samples)
+    for sample in samples:
+        entry = pack(writer, sample, args.folder, args.root, args.remove)
+        if entry is not None:
+            print('{} {} {}'.format(sample, entry['shard'], len(entry['members'])))
+    writer.close()
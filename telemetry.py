@@ -0,0 +1,166 @@
+'''
+Code for rendering the groundtruths of Doc3D dataset
+https://www3.cs.stonybrook.edu/~cvl/projects/dewarpnet/storage/paper.pdf (ICCV 2019)
+
+This code times the stages of the rendering of a sample (scene reset, mesh
+import, lighting, camera search, texturing, each render, saving).
+render_mesh.py wraps its stages in stage(), benchmark.py reads the times
+of every sample with sample_timings().
+With "telemetry" in the config render_mesh.py also sends one json event per
+sample start and end (stage spans, camera candidates tried, drawn
+parameters, output files and sizes, peak memory) to a sink: a json lines
+file, appended like the manifest, or tcp://host:port / udp://host:port.
+"profile": "cprofile" saves the profile of every sample to profileDir,
+"profile": "tracemalloc" adds the peak and the top allocations of the
+sample to its event.
+'''
+import os
+import sys
+import json
+import time
+import socket
+import cProfile
+import tracemalloc
+from contextlib import contextmanager
+from collections import OrderedDict
+try:
+    import resource
+except ImportError:
+    # windows, no peak memory
+    resource = None
+
+import manifest
+
+# stage -> seconds, of the current sample
+timings = OrderedDict()
+# [stage, start, seconds] from the start of the sample, in order
+spans = []
+# other values of the current sample (camera candidates tried, outputs, ...)
+fields = {}
+sample_start = time.perf_counter()
+
+sinks = {}
+
+
+def begin_sample():
+    global sample_start
+    timings.clear()
+    del spans[:]
+    fields.clear()
+    sample_start = time.perf_counter()
+
+
+@contextmanager
+def stage(name):
+    # adds the time spent in the block to the stage, a stage can run several times per sample
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        timings[name] = timings.get(name, 0.0) + elapsed
+        spans.append([name, start - sample_start, elapsed])
+
+
+def record(key, value):
+    fields[key] = value
+
+
+def sample_timings():
+    return dict(timings)
+
+
+def sample_time():
+    return time.perf_counter() - sample_start
+
+
+def peak_rss():
+    # peak resident memory of this process in MB (ru_maxrss is KB on linux, bytes on macOS)
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        rss /= 1024.
+    return rss / 1024.
+
+
+class SocketSink:
+    '''
+    Sends the events as json lines over tcp or as udp datagrams. Events
+    are dropped while the receiver is unreachable, rendering goes on.
+    '''
+
+    def __init__(self, url):
+        scheme, address = url.split('://', 1)
+        host, port = address.rsplit(':', 1)
+        self.address = (host, int(port))
+        self.udp = scheme == 'udp'
+        self.sock = None
+
+    def append(self, event):
+        line = (json.dumps(event, sort_keys=True) + '\n').encode('utf-8')
+        try:
+            if self.udp:
+                if self.sock is None:
+                    self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                self.sock.sendto(line, self.address)
+            else:
+                if self.sock is None:
+                    self.sock = socket.create_connection(self.address, timeout=1)
+                self.sock.sendall(line)
+        except OSError as e:
+            print('telemetry: {}:{} unreachable ({})'.format(self.address[0], self.address[1], e))
+            if self.sock is not None:
+                self.sock.close()
+            self.sock = None
+
+
+def open_sink(target):
+    # one sink per target and process
+    if target not in sinks:
+        if target.startswith('tcp://') or target.startswith('udp://'):
+            sinks[target] = SocketSink(target)
+        else:
+            sinks[target] = manifest.AppendLog(target)
+    return sinks[target]
+
+
+def event(kind, **values):
+    return dict(values, event=kind, time=time.time(), host=socket.gethostname(), pid=os.getpid())
+
+
+@contextmanager
+def profile(mode, name, profile_dir='profiles'):
+    '''
+    Profiles the block: "cprofile" writes <profile_dir>/<name>.prof,
+    "tracemalloc" records the peak and top allocations in the fields.
+    '''
+    if mode == 'cprofile':
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            if not os.path.exists(profile_dir):
+                os.makedirs(profile_dir, exist_ok=True)
+            path = os.path.join(profile_dir, name + '.prof')
+            profiler.dump_stats(path)
+            record('profile', os.path.abspath(path))
+    elif mode == 'tracemalloc':
+        tracing = tracemalloc.is_tracing()
+        if not tracing:
+            tracemalloc.start()
+        elif hasattr(tracemalloc, 'reset_peak'):
+            # python 3.9, older Blenders report the peak since tracing started
+            tracemalloc.reset_peak()
+        try:
+            yield
+        finally:
+            stats = tracemalloc.take_snapshot().statistics('lineno')[:10]
+            record('tracemalloc', {'peak_mb': tracemalloc.get_traced_memory()[1] / 1048576.,
+                                   'top': [[str(s.traceback), s.size, s.count] for s in stats]})
+            if not tracing:
+                tracemalloc.stop()
+    else:
+        yield
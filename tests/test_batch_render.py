@@ -0,0 +1,33 @@
+import threading
+
+import batch_render
+
+
+def test_get_of_a_retired_worker_puts_the_chunk_back():
+    jobs = batch_render.JobQueue()
+    got = []
+    # a get of a worker that dies while waiting for a chunk
+    blocked = threading.Thread(target=lambda: got.append(jobs.get('0-1')))
+    blocked.start()
+    assert jobs.retire('0-1') is None
+    jobs.put(['a'])
+    blocked.join(5)
+    assert got == [None]
+    # the respawned worker gets it
+    assert jobs.get('0-2') == ['a']
+    assert jobs.taken('0-2') == ['a']
+    assert jobs.taken('0-1') is None
+
+
+def test_retire_returns_the_chunk_not_taken():
+    jobs = batch_render.JobQueue()
+    jobs.put(['a'])
+    jobs.put(['b'])
+    assert jobs.get('0-1') == ['a']
+    assert jobs.taken('0-1') == ['a']
+    assert jobs.get('0-1') == ['b']
+    assert jobs.retire('0-1') == ['b']
+    jobs.put(None)
+    assert jobs.get('0-1') is None
+    # the end of the batch is not swallowed by a dead worker
+    assert jobs.get('1-2') is None
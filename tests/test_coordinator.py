@@ -0,0 +1,64 @@
+import os
+import time
+
+import coordinator
+
+
+def make_backend(tmp_path, nleases=2, ttl=60):
+    leases = [{'id': k, 'jobs': [{'mesh': 'obj/{}.obj'.format(k)}]} for k in range(nleases)]
+    coordinator.write_json(str(tmp_path / coordinator.PLAN), leases)
+    return coordinator.FileBackend(str(tmp_path), ttl)
+
+
+def expire(backend, lid):
+    old = time.time() - 2 * backend.ttl
+    os.utime(backend.path(lid, 'lock'), (old, old))
+
+
+def test_claims_and_completes_in_order(tmp_path):
+    backend = make_backend(tmp_path)
+    assert backend.claim('a')['id'] == 0
+    assert backend.claim('b')['id'] == 1
+    assert backend.claim('c') is None
+    assert backend.heartbeat(0, 'a')
+    assert backend.complete(0, 'a', {'done': 1})
+    assert backend.complete(1, 'b', {'done': 1})
+    assert backend.finished()
+    assert not os.path.exists(backend.path(0, 'lock'))
+
+
+def test_expired_lease_goes_to_another_worker(tmp_path):
+    backend = make_backend(tmp_path, 1)
+    backend.claim('a')
+    assert backend.claim('b') is None
+    expire(backend, 0)
+    assert backend.claim('b')['id'] == 0
+    assert backend.owner(0) == 'b'
+    # the first owner finds out and does not complete it
+    assert not backend.heartbeat(0, 'a')
+    assert not backend.complete(0, 'a', {'done': 1})
+    assert not backend.finished()
+    assert backend.complete(0, 'b', {'done': 1})
+    assert backend.finished()
+    assert [f for f in os.listdir(str(tmp_path)) if 'expired' in f] == []
+
+
+def test_lock_taken_over_after_the_check_is_restored(tmp_path):
+    backend = make_backend(tmp_path, 1)
+    backend.claim('a')
+    expire(backend, 0)
+    owner = backend.owner
+
+    def owner_then_takeover(lid):
+        # worker c replaces the expired lock between the checks and the rename of b
+        checked = owner(lid)
+        os.remove(backend.path(lid, 'lock'))
+        backend.try_lock(lid, 'c')
+        return checked
+
+    backend.owner = owner_then_takeover
+    assert backend.claim('b') is None
+    backend.owner = owner
+    assert backend.owner(0) == 'c'
+    assert time.time() - os.path.getmtime(backend.path(0, 'lock')) < backend.ttl
+    assert [f for f in os.listdir(str(tmp_path)) if 'expired' in f] == []
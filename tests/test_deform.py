@@ -0,0 +1,36 @@
+import numpy as np
+
+import deform
+
+
+def edge_lengths(co, faces):
+    return np.concatenate([np.linalg.norm(co[faces[:, i]] - co[faces[:, (i + 1) % 3]], axis=1) for i in range(3)])
+
+
+def test_operations_keep_edge_lengths():
+    # every fold, crease and curl of random pages, on the flat page
+    flat = {}
+    for name, page in deform.sample_pages(100, [1.294, 0.7], seed=3):
+        for op in page['ops']:
+            if op['op'] == 'crumple':
+                continue
+            key = (page['wdh'], page['resolution'])
+            if key not in flat:
+                mesh, _ = deform.flat_grid(*key)
+                flat[key] = edge_lengths(mesh['co'], mesh['faces'])
+            mesh = deform.build_page(dict(page, ops=[op]))
+            lengths = edge_lengths(mesh['co'].astype(np.float64), mesh['faces'])
+            assert np.max(np.abs(lengths - flat[key]) / flat[key]) < 0.02, op
+
+
+def test_cone_radius_stays_positive():
+    for name, page in deform.sample_pages(200, [1.294, 0.7], seed=4):
+        wdh = page['wdh']
+        corners = np.array([[-1, -wdh], [-1, wdh], [1, -wdh], [1, wdh]])
+        for op in page['ops']:
+            if op['op'] != 'curl':
+                continue
+            # the radius of a cone stays positive across the page
+            _, _, along = deform.line_frame(op['point'], op['phi'])
+            radius = op['radius'] + op['slope'] * ((corners - op['point']) @ along)
+            assert np.all(radius > 0), op
@@ -0,0 +1,35 @@
+import json
+
+import manifest
+
+
+def test_outputs_are_done_after_a_reload(tmp_path):
+    path = str(tmp_path / 'manifest' / '1.jsonl')
+    log = manifest.Manifest(path)
+    log.start('s', 'img')
+    assert log.state('s', 'img') == 'start'
+    log.finish('s', 'img', outputs=['norm', 'dmap'])
+    log.finish('t', 'img', 'out of view')
+    for m in (log, manifest.Manifest(path)):
+        assert m.is_done('s', 'img')
+        assert m.is_done('s', 'norm') and m.is_done('s', 'dmap')
+        assert m.state('s', 'alb') is None
+        assert m.state('t', 'img') == 'out of view'
+
+
+def test_refresh_waits_for_a_partly_written_line(tmp_path):
+    path = str(tmp_path / 'log.jsonl')
+    log = manifest.AppendLog(path)
+    assert log.refresh() == []
+    log.append({'n': 1})
+    line = json.dumps({'n': 2}).encode('utf-8')
+    with open(path, 'ab') as f:
+        f.write(line[:5])
+    assert log.refresh() == [{'n': 1}]
+    with open(path, 'ab') as f:
+        f.write(line[5:] + b'\n')
+        # garbage of an interrupted write is skipped
+        f.write(b'{"n": \n')
+    log.append({'n': 3})
+    assert log.refresh() == [{'n': 2}, {'n': 3}]
+    assert log.refresh() == []
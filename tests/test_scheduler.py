@@ -0,0 +1,53 @@
+import scheduler
+
+
+def make_jobs(n):
+    return [{'mesh': 'obj/{}.obj'.format(k)} for k in range(n)]
+
+
+def test_guided_chunks_shrink_to_single_jobs():
+    sched = scheduler.Scheduler(make_jobs(100), 4, max_chunk=8)
+    sizes = []
+    while True:
+        chunk = sched.next_chunk()
+        if chunk is None:
+            break
+        sizes.append(len(chunk))
+    assert sum(sizes) == 100
+    assert sizes[0] == 8
+    assert sizes[-1] == 1
+    assert sizes == sorted(sizes, reverse=True)
+
+
+def test_requeued_jobs_come_first_in_order():
+    jobs = make_jobs(20)
+    sched = scheduler.Scheduler(jobs, 2, max_chunk=4)
+    first = sched.next_chunk()
+    second = sched.next_chunk()
+    sched.requeue(first)
+    assert sched.next_chunk() == first
+    assert sched.next_chunk()[0] == jobs[len(first) + len(second)]
+
+
+def test_retries_are_bounded():
+    job = make_jobs(1)[0]
+    sched = scheduler.Scheduler([job], 1, max_retries=2)
+    sched.next_chunk()
+    for attempt in range(2):
+        assert not sched.report(job, 'crashed')
+        job = sched.next_chunk()[0]
+        assert job['attempt'] == attempt + 1
+        assert not sched.finished()
+    assert sched.report(job, 'error')
+    assert sched.finished()
+    assert sched.results == [(job, 'error')]
+
+
+def test_final_statuses_are_not_retried():
+    jobs = make_jobs(2)
+    sched = scheduler.Scheduler(jobs, 1)
+    assert sched.next_chunk() + sched.next_chunk() == jobs
+    assert sched.report(jobs[0], 'out of view')
+    assert sched.report(jobs[1], 'done')
+    assert sched.next_chunk() is None
+    assert sched.finished()
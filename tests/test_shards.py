@@ -0,0 +1,65 @@
+import os
+
+import shards
+
+
+def write_files(root, sample, sizes):
+    files = {}
+    for k, size in enumerate(sizes):
+        path = os.path.join(root, '{}-{}.bin'.format(sample, k))
+        with open(path, 'wb') as f:
+            f.write(os.urandom(size))
+        files['{}.gt{}.bin'.format(sample, k)] = path
+    return files
+
+
+def test_read_sample_round_trip(tmp_path):
+    shard_dir = str(tmp_path / 'shards')
+    writer = shards.ShardWriter(shard_dir, 'test', max_samples=2)
+    samples = {}
+    for k, sizes in enumerate([[1, 600], [512, 0, 1500], [10000], [3, 4, 5]]):
+        sample = 'sample{}'.format(k)
+        samples[sample] = write_files(str(tmp_path), sample, sizes)
+        writer.write(sample, samples[sample])
+    writer.close()
+
+    index = shards.read_index(shard_dir)
+    assert sorted(index) == sorted(samples)
+    for sample, files in samples.items():
+        data = shards.read_sample(shard_dir, index[sample])
+        assert sorted(data) == sorted(files)
+        for name, path in files.items():
+            with open(path, 'rb') as f:
+                assert data[name] == f.read()
+
+
+def test_sample_files_keeps_both_albedos(tmp_path):
+    root = str(tmp_path)
+    for path in ['img/1/s-1.png', 'alb/1/s-1.png', 'alb/1/s0001.png', 'bld/1/s.blend', 'bld/1/s.json']:
+        path = os.path.join(root, path)
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        open(path, 'wb').close()
+    files = shards.sample_files('s', 1, root)
+    assert files == {
+        's.img.png': os.path.join(root, 'img', '1', 's-1.png'),
+        's.chess.png': os.path.join(root, 'alb', '1', 's-1.png'),
+        's.alb.png': os.path.join(root, 'alb', '1', 's0001.png'),
+        's.bld.blend': os.path.join(root, 'bld', '1', 's.blend'),
+        's.bld.json': os.path.join(root, 'bld', '1', 's.json'),
+    }
+
+
+def test_pack_remove_keeps_the_bld_files(tmp_path):
+    root = str(tmp_path)
+    paths = [os.path.join(root, p) for p in ['img/1/s-1.png', 'uv/1/s-1.exr', 'bld/1/s.blend', 'bld/1/s.json']]
+    for path in paths:
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as f:
+            f.write(b'x')
+    writer = shards.ShardWriter(os.path.join(root, 'shards'), 'test')
+    entry = shards.pack(writer, 's', 1, root, remove=True)
+    writer.close()
+    assert len(entry['members']) == 4
+    assert [os.path.exists(p) for p in paths] == [False, False, True, True]
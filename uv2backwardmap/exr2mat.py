@@ -1,46 +1,130 @@
 '''
-Code for rendering the groundtruths of Doc3D dataset 
+Code for rendering the groundtruths of Doc3D dataset
 https://www3.cs.stonybrook.edu/~cvl/projects/dewarpnet/storage/paper.pdf (ICCV 2019)
 
-This code converts the .exr files to .mat, 
-run it before running the fm2bm.m 
+This code converts the .exr files to .mat,
+run it before running the fm2bm.m
+With --bm the backward mappings are computed in the same pass (see uv2bm.py),
+each .exr is read and decoded once; add --no-uvmat to skip the .mat for MatLab.
+Outputs newer than their .exr are skipped (--check mtime), or the ones of an
+.exr with an unchanged content hash (--check hash, hashes kept in
+<output folder>/exr2mat.sha1.json).
+
+python exr2mat.py <folder-id> [--workers N] [--bm] [--no-uvmat] [--check mtime|hash]
 
 Written by: Sagnik Das
 Stony Brook University, New York
 January 2019
 '''
-import sys
+import os
+import json
+import hashlib
+import argparse
+import threading
+import multiprocessing
+os.environ.setdefault('OPENCV_IO_ENABLE_OPENEXR', '1')
 import cv2
 import numpy as np
 from hdf5storage import savemat
 
-rridx=sys.argv[-1]
+HASH_FILE = 'exr2mat.sha1.json'
 
-def saveasmat(file_path, dst_path):
-    img = cv2.imread(file_path, cv2.IMREAD_ANYDEPTH | cv2.IMREAD_UNCHANGED)
-    savemat(dst_path, {'uv': img})
-    
-import os
-import multiprocessing
-pool = multiprocessing.Pool(processes=2)
 
-src_dir = '../uv/{}/'.format(rridx)
-dst_dir = '../uvmat/{}/'.format(rridx)
+def iter_exrs(src_dir):
+    # .exr files of the folder, without listing it at once
+    with os.scandir(src_dir) as it:
+        for entry in it:
+            if entry.name.endswith('.exr') and entry.is_file():
+                yield entry.name, entry.path, entry.stat().st_mtime
+
+
+def newer(dst_paths, mtime):
+    return all(os.path.exists(p) and os.path.getmtime(p) >= mtime for p in dst_paths)
+
 
-if not os.path.exists(dst_dir):
-    os.makedirs(dst_dir)
+def saveasmat(file_path, dst_paths, old_hash=None):
+    '''
+    Decodes one .exr and writes its outputs, dst_paths is a dict with
+    'uv' (.mat of the uv for fm2bm.m) and/or 'bm' (backward mapping).
+    With old_hash the outputs are kept if the file content did not change.
+    Returns the file hash (None without hash check) and whether it was converted.
+    '''
+    with open(file_path, 'rb') as f:
+        data = f.read()
+    digest = None
+    if old_hash is not None:
+        digest = hashlib.sha1(data).hexdigest()
+        if digest == old_hash and all(os.path.exists(p) for p in dst_paths.values()):
+            return file_path, digest, False
+    img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_ANYDEPTH | cv2.IMREAD_UNCHANGED)
+    if 'uv' in dst_paths:
+        savemat(dst_paths['uv'], {'uv': img})
+    if 'bm' in dst_paths:
+        # scipy is only needed with --bm
+        import uv2bm
+        savemat(dst_paths['bm'], {'bm': uv2bm.uv2mp(uv2bm.flip_uv(img))})
+    return file_path, digest, True
 
-for fname in os.listdir(src_dir):
-    if '.exr' in fname:
-        file_name = os.path.join(src_dir, fname)
-        if not os.path.isfile(file_name):
-            continue 
-        # t = os.path.join(dst_dir, str(fid))
-        t=dst_dir
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert the uv .exr files to .mat')
+    parser.add_argument('folder', help='folder id')
+    parser.add_argument('-w', '--workers', type=int, help='number of processes', default=2)
+    parser.add_argument('--queue', type=int, help='files in flight per worker', default=2)
+    parser.add_argument('--bm', action='store_true', help='also write the backward mappings to ../bm/<folder-id>/')
+    parser.add_argument('--no-uvmat', action='store_true', help='do not write the uv .mat files')
+    parser.add_argument('--check', choices=['mtime', 'hash'], default='mtime', help='how to skip the up to date outputs')
+    args = parser.parse_args()
+
+    src_dir = '../uv/{}/'.format(args.folder)
+    dst_dirs = {}
+    if not args.no_uvmat:
+        dst_dirs['uv'] = '../uvmat/{}/'.format(args.folder)
+    if args.bm:
+        dst_dirs['bm'] = '../bm/{}/'.format(args.folder)
+    if not dst_dirs:
+        parser.error('nothing to write')
+    for t in dst_dirs.values():
         if not os.path.exists(t):
             os.makedirs(t)
-        dst_name = os.path.join(t, fname[:-4])
-        pool.apply_async(saveasmat, (file_name, dst_name))
 
-pool.close()
-pool.join()
\ No newline at end of file
+    hash_path = os.path.join(list(dst_dirs.values())[0], HASH_FILE)
+    hashes = {}
+    if args.check == 'hash' and os.path.exists(hash_path):
+        with open(hash_path, 'r') as f:
+            hashes = json.load(f)
+
+    # at most workers * queue files decoded or waiting, the callbacks release the slots
+    slots = threading.BoundedSemaphore(args.workers * args.queue)
+    counts = {'converted': 0, 'skipped': 0, 'failed': 0}
+
+    def done(result):
+        file_path, digest, converted = result
+        if digest is not None:
+            hashes[os.path.basename(file_path)] = digest
+        counts['converted' if converted else 'skipped'] += 1
+        if converted:
+            print(file_path)
+        slots.release()
+
+    def failed(error):
+        counts['failed'] += 1
+        print('failed: {}'.format(error))
+        slots.release()
+
+    pool = multiprocessing.Pool(processes=args.workers)
+    for fname, file_name, mtime in iter_exrs(src_dir):
+        dst_paths = {gt: os.path.join(t, fname[:-4] + '.mat') for gt, t in dst_dirs.items()}
+        if args.check == 'mtime' and newer(dst_paths.values(), mtime):
+            counts['skipped'] += 1
+            continue
+        old_hash = hashes.get(fname, '') if args.check == 'hash' else None
+        slots.acquire()
+        pool.apply_async(saveasmat, (file_name, dst_paths, old_hash), callback=done, error_callback=failed)
+
+    pool.close()
+    pool.join()
+    if args.check == 'hash':
+        with open(hash_path, 'w') as f:
+            json.dump(hashes, f, indent=0, sort_keys=True)
+    print('{converted} converted, {skipped} up to date, {failed} failed'.format(**counts))
@@ -0,0 +1,146 @@
+'''
+Code for rendering the groundtruths of Doc3D dataset
+https://www3.cs.stonybrook.edu/~cvl/projects/dewarpnet/storage/paper.pdf (ICCV 2019)
+
+This code computes the backward mappings from the uv .exr files,
+a python port of fm2bm.m and uv2mp.m that reads the .exr files directly
+(no exr2mat.py step and no MatLab). The .mat files have the same layout
+as the ones of fm2bm.m: bm (448x448x2, MatLab 1-based pixel coordinates).
+
+Like scatteredInterpolant the default method interpolates linearly on the
+Delaunay triangulation of the valid uv pixels. Outside of their convex hull
+scatteredInterpolant extrapolates linearly, here the nearest pixel is used.
+The kdtree method is an inverse distance weighting of the nearest pixels,
+faster but less accurate.
+
+python uv2bm.py <folder-id> [--nproc N] [--method delaunay|kdtree]
+python uv2bm.py <folder-id> --reference <bm dir of fm2bm.m> compares with MatLab
+'''
+import os
+import time
+import argparse
+import functools
+import multiprocessing
+import numpy as np
+from scipy.interpolate import LinearNDInterpolator
+from scipy.spatial import cKDTree
+
+# size of the backward mapping
+S = 448
+
+
+def read_uv(file_path):
+    # uv .exr file to the layout uv2mp expects
+    os.environ.setdefault('OPENCV_IO_ENABLE_OPENEXR', '1')
+    import cv2
+    return flip_uv(cv2.imread(file_path, cv2.IMREAD_ANYDEPTH | cv2.IMREAD_UNCHANGED))
+
+
+def flip_uv(img):
+    '''
+    BGR uv image as read by opencv to u, flipped v, mask
+    (fm2bm.m: uv = cat(3, uv(:, :, 3), 1.0 - uv(:, :, 2), uv(:, :, 1)))
+    '''
+    img = img.astype(np.float32)
+    return np.stack([img[:, :, 2], 1.0 - img[:, :, 1], img[:, :, 0]], axis=2)
+
+
+def uv2mp(uv, s=S, method='delaunay', k=4):
+    '''
+    Convert uv map to inverse map, same as uv2mp.m.
+    uv is a h*w*3 array, u, v and the mask of uv in the 3rd dim.
+    Returns s*s*2, the x and y (1-based) of the uv image for every output pixel.
+    '''
+    return backward_map(uv, s, method, k)[0]
+
+
+def backward_map(uv, s=S, method='delaunay', k=4):
+    # uv2mp and the s*s mask of the pixels outside the convex hull of the valid uvs
+    # rescale the 1.0 in uv to s which is the size of the output map
+    uv = uv.astype(np.float64) * s
+    # valid point
+    msk = uv[:, :, 2] > 0.1
+    # sx sy are the value in the forward mapping but the coord in the backward mapping
+    src = np.stack([uv[:, :, 0][msk], uv[:, :, 1][msk]], axis=1)
+    # tx ty are the coord in the forward mapping but the value in the backward mapping
+    ty, tx = np.nonzero(msk)
+    dst = np.stack([tx + 1.0, ty + 1.0], axis=1)
+    # sampling coord on the output mapping
+    xq, yq = np.meshgrid(np.arange(1, s + 1), np.arange(1, s + 1))
+    query = np.stack([xq.ravel(), yq.ravel()], axis=1).astype(np.float64)
+
+    tree = cKDTree(src)
+    if method == 'delaunay':
+        invmap = LinearNDInterpolator(src, dst)(query)
+        outside = np.isnan(invmap[:, 0])
+        if outside.any():
+            invmap[outside] = dst[tree.query(query[outside])[1]]
+    elif method == 'kdtree':
+        dist, idx = tree.query(query, k=k)
+        w = 1.0 / np.maximum(dist, 1e-12)
+        invmap = (dst[idx] * w[:, :, None]).sum(axis=1) / w.sum(axis=1, keepdims=True)
+        outside = np.zeros(len(query), dtype=bool)
+    else:
+        raise ValueError('unknown method ' + method)
+    return invmap.reshape(s, s, 2), outside.reshape(s, s)
+
+
+def convert(fname, src_dir, dst_dir, method):
+    # uv .exr to bm .mat, returns the computation time
+    from hdf5storage import savemat
+    start = time.time()
+    bm = uv2mp(read_uv(os.path.join(src_dir, fname)), method=method)
+    elapsed = time.time() - start
+    savemat(os.path.join(dst_dir, fname[:-4] + '.mat'), {'bm': bm})
+    return fname, elapsed
+
+
+def compare(fname, src_dir, ref_dir, method):
+    # difference with the bm of fm2bm.m, inside the hull of the valid uvs and everywhere
+    from hdf5storage import loadmat
+    start = time.time()
+    bm, outside = backward_map(read_uv(os.path.join(src_dir, fname)), method=method)
+    elapsed = time.time() - start
+    ref = loadmat(os.path.join(ref_dir, fname[:-4] + '.mat'))['bm']
+    err = np.abs(bm - ref).max(axis=2)
+    # outside of the hull MatLab extrapolates, the error there is reported apart
+    inside_err = err[~outside].max() if (~outside).any() else 0.0
+    return fname, elapsed, float(np.median(err)), float(inside_err), float(err.max())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Backward mappings from uv .exr files')
+    parser.add_argument('folder', help='folder id')
+    parser.add_argument('-n', '--nproc', type=int, help='number of processes', default=os.cpu_count())
+    parser.add_argument('--method', choices=['delaunay', 'kdtree'], default='delaunay')
+    parser.add_argument('--reference', help='compare with the bm .mat files of fm2bm.m in this folder, nothing is written')
+    args = parser.parse_args()
+
+    src_dir = '../uv/{}/'.format(args.folder)
+    dst_dir = '../bm/{}/'.format(args.folder)
+    fnames = sorted(f for f in os.listdir(src_dir) if f.endswith('.exr'))
+    pool = multiprocessing.Pool(processes=args.nproc)
+
+    if args.reference:
+        fnames = [f for f in fnames if os.path.exists(os.path.join(args.reference, f[:-4] + '.mat'))]
+        task = functools.partial(compare, src_dir=src_dir, ref_dir=args.reference, method=args.method)
+        stats = []
+        for fname, elapsed, med, inside, worst in pool.imap_unordered(task, fnames):
+            print('{} {:.2f}s median error {:.4f}px, max {:.4f}px inside the hull, {:.4f}px overall'.format(
+                fname, elapsed, med, inside, worst))
+            stats.append((elapsed, med, inside, worst))
+        if stats:
+            stats = np.array(stats)
+            print('{} files, {:.2f}s per file, median error {:.4f}px, max {:.4f}px inside the hull, {:.4f}px overall'.format(
+                len(stats), stats[:, 0].mean(), np.median(stats[:, 1]), stats[:, 2].max(), stats[:, 3].max()))
+    else:
+        if not os.path.exists(dst_dir):
+            os.makedirs(dst_dir)
+        # skip the existing outputs like fm2bm.m
+        fnames = [f for f in fnames if not os.path.exists(os.path.join(dst_dir, f[:-4] + '.mat'))]
+        task = functools.partial(convert, src_dir=src_dir, dst_dir=dst_dir, method=args.method)
+        for k, (fname, elapsed) in enumerate(pool.imap_unordered(task, fnames)):
+            print('{}/{} {} {:.2f}s'.format(k + 1, len(fnames), fname, elapsed))
+
+    pool.close()
+    pool.join()
@@ -0,0 +1,87 @@
+'''
+Code for rendering the groundtruths of Doc3D dataset
+https://www3.cs.stonybrook.edu/~cvl/projects/dewarpnet/storage/paper.pdf (ICCV 2019)
+
+This code tests whether a mesh is fully visible from a camera.
+The vertices and normals are numpy arrays, all the vertices are projected
+in one pass instead of one world_to_camera_view call per vertex.
+It gives the same decision as the original per vertex loop of
+render_mesh.isVisible and does not need Blender. A batch of candidate
+cameras is scored with one broadcasted projection.
+'''
+import math
+import numpy as np
+
+# every vertex has to be inside this part of the view frame
+FRAME_MIN = 0.03
+FRAME_MAX = 0.97
+
+
+def camera_view(co, cam_matrix, lens, sensor_width=36.0, res_x=448, res_y=448):
+    '''
+    Same as bpy_extras.object_utils.world_to_camera_view for a perspective
+    camera with sensor fit AUTO and no shift.
+    co is (n, 3) world coordinates, cam_matrix the 4x4 camera matrix_world
+    or a (k, 4, 4) batch of them.
+    Returns (n, 3) or (k, n, 3), x and y in [0, 1] inside the frame, z the depth.
+    '''
+    cam_matrix = np.asarray(cam_matrix, dtype=np.float64)
+    rot = cam_matrix[..., :3, :3] / np.linalg.norm(cam_matrix[..., :3, :3], axis=-2, keepdims=True)
+    local = np.einsum('...ni,...ij->...nj', np.asarray(co, dtype=np.float64) - cam_matrix[..., None, :3, 3], rot)
+    z = -local[..., 2]
+    # the sensor width goes along the larger side of the image
+    scale = lens / sensor_width
+    sx = scale * max(res_y / res_x, 1.0)
+    sy = scale * max(res_x / res_y, 1.0)
+    safe_z = np.where(z == 0, 1.0, z)
+    x = np.where(z == 0, 0.5, 0.5 + sx * local[..., 0] / safe_z)
+    y = np.where(z == 0, 0.5, 0.5 + sy * local[..., 1] / safe_z)
+    return np.stack([x, y, z], axis=-1)
+
+
+def count_visible_batch(co, normals, cam_matrices, lens, sensor_width=36.0, res_x=448, res_y=448):
+    '''
+    Scores a (k, 4, 4) batch of cameras. Returns three (k,) arrays:
+    whether all the vertices are inside the frame, and the number of normals
+    below 120 and above 60 degrees to the view direction.
+    normals are compared as given (the original test used the local vertex normals).
+    '''
+    cam_matrices = np.asarray(cam_matrices, dtype=np.float64)
+    ndc = camera_view(co, cam_matrices, lens, sensor_width, res_x, res_y)
+    in_view = ~np.any((ndc[..., :2] < FRAME_MIN) | (ndc[..., :2] > FRAME_MAX), axis=(1, 2))
+
+    cam_direction = -cam_matrices[:, :3, 2] / np.linalg.norm(cam_matrices[:, :3, 2], axis=1, keepdims=True)
+    normals = np.asarray(normals, dtype=np.float64)
+    normals = normals / np.linalg.norm(normals, axis=1, keepdims=True)
+    angle = np.arccos(np.clip(cam_direction @ normals.T, -1.0, 1.0))
+    ct1 = np.count_nonzero(angle < math.radians(120), axis=1)
+    ct2 = np.count_nonzero(angle > math.radians(60), axis=1)
+    return in_view, ct1, ct2
+
+
+def count_visible(co, normals, cam_matrix, lens, sensor_width=36.0, res_x=448, res_y=448):
+    '''
+    count_visible_batch for a single camera, returns (in_view, ct1, ct2).
+    '''
+    in_view, ct1, ct2 = count_visible_batch(co, normals, np.asarray(cam_matrix)[None], lens,
+                                            sensor_width, res_x, res_y)
+    return bool(in_view[0]), int(ct1[0]), int(ct2[0])
+
+
+def accept(ct1, ct2):
+    # normal may be in two directions
+    return np.logical_not(np.minimum(ct1, ct2) / 1000000. > 0.03)
+
+
+def is_visible(co, normals, cam_matrix, lens, sensor_width=36.0, res_x=448, res_y=448):
+    in_view, ct1, ct2 = count_visible(co, normals, cam_matrix, lens, sensor_width, res_x, res_y)
+    return in_view and bool(accept(ct1, ct2))
+
+
+def first_visible(co, normals, cam_matrices, lens, sensor_width=36.0, res_x=448, res_y=448):
+    '''
+    Index of the first camera of the batch that passes the test, or None.
+    '''
+    in_view, ct1, ct2 = count_visible_batch(co, normals, cam_matrices, lens, sensor_width, res_x, res_y)
+    valid = np.flatnonzero(in_view & accept(ct1, ct2))
+    return int(valid[0]) if len(valid) else None